@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# encoding: utf8
+
+"""Microbenchmarks for the per operation overhead of fluent, compared to plain python.
+
+Run with `python benchmark_fluent.py`, prints nanoseconds per operation (per element for the Iterable 
+methods, at several input sizes) and how long `import fluent` takes.
+
+`--json results.json` saves all measurements. `--baseline results.json` compares against such a file
+and exits with status 1 if the overhead ratio (fluent / plain) of something grew by more than 
+`--tolerance`. It also exits with status 1 if importing fluent takes longer than 
+IMPORT_TIME_BUDGET_MILLISECONDS.
+"""
+
+import os
+import sys
+import json
+import argparse
+import functools
+import itertools
+import operator
+import platform
+import subprocess
+import types
+import typing
+import timeit
+
+import fluent
+from fluent import wrap
+
+def wrap_with_uncached_dispatch(wrapped, *, previous=None, chain=None):
+    "How wrap() decided on the Wrapper subclass before the dispatch cache, for comparison"
+    by_type = (
+        (types.ModuleType, fluent.Module),
+        (typing.Text, fluent.Text),
+        (typing.Mapping, fluent.Mapping),
+        (typing.AbstractSet, fluent.Set),
+        (typing.Iterable, fluent.Iterable),
+        (typing.Callable, fluent.Callable),
+    )
+    for clazz, wrapper in by_type:
+        if isinstance(wrapped, clazz):
+            return wrapper(wrapped, previous=previous, chain=chain)
+    return fluent.Wrapper(wrapped, previous=previous, chain=chain)
+
+class Plain(object):
+    attribute = 'value'
+
+def nanoseconds_per_operation(statement, namespace, number=100000):
+    return min(timeit.repeat(statement, globals=namespace, number=number, repeat=5)) / number * 1e9
+
+def compared(cases, namespace, number=100000, per=1):
+    "Yields (name, plain, fluent) in nanoseconds per operation divided by per, for (name, plain statement, fluent statement) cases"
+    for name, plain, wrapped in cases:
+        yield name, nanoseconds_per_operation(plain, namespace, number) / per, \
+            nanoseconds_per_operation(wrapped, namespace, number) / per
+
+def wrap_overhead():
+    "Yields (name, uncached dispatch, cached dispatch) in nanoseconds per operation"
+    objects = dict(int=3, str='foo', list=[1, 2, 3], dict=dict(foo='bar'), set={1}, function=len, object=Plain())
+    for name, an_object in objects.items():
+        namespace = dict(wrap=wrap, uncached=wrap_with_uncached_dispatch, an_object=an_object)
+        yield 'wrap(%s)' % name, \
+            nanoseconds_per_operation('uncached(an_object)', namespace), \
+            nanoseconds_per_operation('wrap(an_object)', namespace)
+
+def proxy_overhead():
+    "Yields (name, plain python, fluent) in nanoseconds per operation"
+    namespace = dict(plain=Plain(), wrapped=wrap(Plain()), a_list=[1, 2, 3], wrapped_list=wrap([1, 2, 3]),
+        function=abs, wrapped_function=wrap(abs))
+    for name, plain, wrapped in (
+        ('attribute access', 'plain.attribute', 'wrapped.attribute'),
+        ('item access', 'a_list[0]', 'wrapped_list[0]'),
+        ('call', 'function(-1)', 'wrapped_function(-1)'),
+    ):
+        yield name, nanoseconds_per_operation(plain, namespace), nanoseconds_per_operation(wrapped, namespace)
+
+def call_overhead():
+    "Yields (name, plain python, fluent) in nanoseconds per call"
+    def add(first, second):
+        return first + second
+    namespace = dict(add=add, wrapped_add=wrap(add), partial=functools.partial(add, 1), 
+        curried=wrap(add).curry(1), curried_placeholder=wrap(add).curry(wrap, 1), 
+        plain_placeholder=lambda first: add(first, 1))
+    yield from compared((
+        ('Callable.__call__', 'add(1, 2)', 'wrapped_add(1, 2)'),
+        ('call curried', 'partial(2)', 'curried(2)'),
+        ('call curried _', 'plain_placeholder(2)', 'curried_placeholder(2)'),
+        ('curry', 'functools.partial(add, 1)', 'wrapped_add.curry(1)'),
+        ('curry _', 'lambda first: add(first, 1)', 'wrapped_add.curry(wrap, 1)'),
+    ), dict(namespace, functools=functools, wrap=wrap), number=50000)
+
+def each_overhead():
+    "Yields (name, plain lambda, _.each expression) in nanoseconds per element"
+    data = list(range(1000))
+    namespace = dict(data=data)
+    for name, plain, expression in (
+        ('map(_.each + 3)', 'list(map(lambda each: each + 3, data))', 'list(map(expression, data))'),
+        ('map(_.each * _.each)', 'list(map(lambda each: each * each, data))', 'list(map(expression, data))'),
+    ):
+        namespace['expression'] = eval(name[4:-1], dict(_=wrap)).unwrap
+        yield name, nanoseconds_per_operation(plain, namespace, number=200) / len(data), \
+            nanoseconds_per_operation(expression, namespace, number=200) / len(data)
+
+ITERABLE_SIZES = (10, 1000, 100000)
+
+def iterable_overhead(sizes=ITERABLE_SIZES):
+    "Yields ('method[size]', plain python, fluent) in nanoseconds per element, for the Iterable methods"
+    cases = (
+        ('map', 'tuple(map(str, data))', 'wrapped.map(str)'),
+        ('map(_.each)', 'tuple(map(lambda each: each * 2, data))', 'wrapped.map(_.each * 2)'),
+        ('imap', 'list(map(str, data))', 'wrapped.imap(str).call(list)'),
+        ('filter', 'tuple(filter(is_odd, data))', 'wrapped.filter(is_odd)'),
+        ('star_map', 'tuple(itertools.starmap(operator.add, pairs))', 'wrapped_pairs.star_map(operator.add)'),
+        ('sorted', 'tuple(sorted(data, key=operator.neg))', 'wrapped.sorted(key=operator.neg)'),
+        ('reversed', 'tuple(reversed(data))', 'wrapped.reversed()'),
+        ('enumerate', 'tuple(enumerate(data))', 'wrapped.enumerate()'),
+        ('zip', 'tuple(zip(data, data))', 'wrapped.zip(data)'),
+        ('flatten', 'tuple(itertools.chain.from_iterable(pairs))', 'wrapped_pairs.flatten()'),
+        ('grouped', 'tuple(zip(*[iter(data)] * 2))', 'wrapped.grouped(2)'),
+        ('batched', 'tuple(tuple(data[start:start + 100]) for start in range(0, len(data), 100))', 'wrapped.batched(100)'),
+        ('windowed', 'tuple(tuple(data[start:start + 3]) for start in range(max(1, len(data) - 2)))', 'wrapped.windowed(3)'),
+        ('groupby', 'tuple((key, tuple(group)) for key, group in itertools.groupby(data, key=tens))', 'wrapped.groupby(tens)'),
+        ('reduce', 'functools.reduce(operator.add, data)', 'wrapped.reduce(operator.add)'),
+        ('len', 'len(data)', 'wrapped.len()'),
+        ('sum', 'sum(data)', 'wrapped.sum()'),
+        ('max', 'max(data)', 'wrapped.max()'),
+        ('join', "','.join(map(str, data))", "wrapped.join(',')"),
+        ('lazy', 'tuple(str(each) for each in data if each % 2)', 'wrapped.lazy().filter(is_odd).map(str).unwrap'),
+    )
+    for size in sizes:
+        data = list(range(size))
+        pairs = [(each, each) for each in data]
+        namespace = dict(data=data, pairs=pairs, wrapped=wrap(data), wrapped_pairs=wrap(pairs), _=wrap,
+            is_odd=lambda each: each % 2, tens=lambda each: each // 10, 
+            functools=functools, itertools=itertools, operator=operator)
+        for name, plain, wrapped in compared(cases, namespace, number=max(1, 20000 // size), per=size):
+            yield '%s[%s]' % (name, size), plain, wrapped
+
+def measurements(sizes=ITERABLE_SIZES):
+    "(group, header, measurements) with measurements as tuples of (name, baseline, fluent) in nanoseconds"
+    return (
+        ('wrap', ('', 'uncached', 'cached'), wrap_overhead()),
+        ('proxy', ('', 'plain', 'fluent'), proxy_overhead()),
+        ('call', ('', 'plain', 'fluent'), call_overhead()),
+        ('each', ('per element', 'lambda', '_.each'), each_overhead()),
+        ('iterable', ('per element', 'plain', 'fluent'), iterable_overhead(sizes)),
+    )
+
+def regressions(results, baseline, tolerance):
+    "Names whose overhead ratio grew by more than tolerance (0.25 is 25%) compared to baseline, both as written by --json"
+    old_ratios = { (result['group'], result['name']): result['ratio'] for result in baseline['results'] }
+    return [ result['group'] + ' ' + result['name'] for result in results['results'] 
+        if (result['group'], result['name']) in old_ratios 
+        and result['ratio'] > old_ratios[result['group'], result['name']] * (1 + tolerance) ]
+
+# shell one-liners via `python -m fluent` pay this on every run
+IMPORT_TIME_BUDGET_MILLISECONDS = 10
+
+def import_milliseconds(module='fluent', repeat=5):
+    "Best cumulative time of `import module` in a fresh interpreter, as reported by -X importtime"
+    directory = os.path.dirname(os.path.abspath(fluent.__file__))
+    environment = dict(os.environ)
+    # measure what users see, i.e. with cached bytecode
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+    timings = []
+    for _ in range(repeat + 1): # the first run may have to write the bytecode cache
+        report = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module], 
+            cwd=directory, env=environment, stderr=subprocess.PIPE, check=True, universal_newlines=True).stderr
+        own_line, = (line for line in report.splitlines() if line.split('|')[-1].strip() == module)
+        timings.append(int(own_line.split('|')[1]) / 1000)
+    return min(timings[1:])
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Measures the overhead of fluent compared to plain python.')
+    parser.add_argument('--json', help='write all measurements to this file')
+    parser.add_argument('--baseline', help='fail if the overhead grew compared to measurements written with --json')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed growth of the overhead ratio (default: %(default)s)')
+    parser.add_argument('--sizes', type=lambda sizes: tuple(map(int, sizes.split(','))), default=ITERABLE_SIZES,
+        help='input sizes for the Iterable methods (default: %s)' % ','.join(map(str, ITERABLE_SIZES)))
+    options = parser.parse_args(arguments)
+    
+    results = dict(python=platform.python_version(), machine=platform.machine(), results=[])
+    for group, header, group_measurements in measurements(options.sizes):
+        print('%-20s %12s %12s %8s' % (header + ('ratio',)))
+        for name, baseline, fluent_nanoseconds in group_measurements:
+            ratio = fluent_nanoseconds / baseline
+            print('%-20s %9.0f ns %9.0f ns %7.1fx' % (name, baseline, fluent_nanoseconds, ratio))
+            results['results'].append(dict(group=group, name=name, 
+                baseline_ns=baseline, fluent_ns=fluent_nanoseconds, ratio=ratio))
+        print()
+    
+    milliseconds = import_milliseconds()
+    results['import_ms'] = milliseconds
+    print('%-20s %9.1f ms (budget %s ms)' % ('import fluent', milliseconds, IMPORT_TIME_BUDGET_MILLISECONDS))
+    
+    if options.json:
+        with open(options.json, 'w') as file:
+            json.dump(results, file, indent=1)
+    
+    failed = milliseconds > IMPORT_TIME_BUDGET_MILLISECONDS
+    if options.baseline:
+        with open(options.baseline) as file:
+            regressed = regressions(results, json.load(file), options.tolerance)
+        for name in regressed:
+            print('regression: %s' % name)
+        failed = failed or bool(regressed)
+    if failed:
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -143,8 +143,11 @@ with it. The second thing this does is that it returns a subclass of Wrapper tha
 of methods depending on the type of what is wrapped. I envision this to expand in the future, but right 
 now the most usefull wrappers are: Iterable, where we add all the python collection functions (map, 
 filter, zip, reduce, …) as well as a good batch of methods from itertools and a few extras for good 
-measure. Callable, where we add `.curry()` and `.compose()` and Text, where most of the regex methods 
-are added.
+measure. Callable, where we add `.curry()`, `.compose()` and `.memoize()` and Text, where most of the 
+regex methods are added. Bytes adds the same regex methods to bytes, bytearray, memoryview and mmap objects, so 
+`_.mapped_file('huge.log').finditer(rb'ERROR: (.*)')` searches a file without reading it into memory.
+Array does `sum`, `map`, `filter` and `sorted` on numpy arrays and array.array in one vectorized 
+operation where it can, e.g. `_(numbers).map(_.each * 2).filter(_.each > 0)` returns an array again.
 
 ## Imports as expressions
 
@@ -175,6 +178,12 @@ $ curl -sL 'https://www.iblocklist.com/lists.php' | egrep -A1 'star_[345]' | pyt
 How's that for reading and writing if all the imports are inlined? Oh, and of course everything imported 
 via `lib` comes already pre-wrapped, so your code becomes even shorter.
 
+`lib.sys.stdin.read()` has to read all of the input before anything happens though. For big inputs, 
+`--lines` gives the expression a lazy iterable `lines` of stdin instead, and writes every element of 
+the result as a line as soon as it is computed, in constant memory:
+
+$ cat huge.log | python3 -m fluent --lines "lines.filter(lambda line: 'ERROR' in line).map(str.upper)"
+
 More formally:The `lib` object, which is a wrapper around the python import machinery, allows to import 
 anything that is accessible by import to be imported as an expression for inline use.
 
@@ -189,6 +198,12 @@ You can do
 
 As a bonus, everything imported via lib is already pre-wrapped, so you can chain off of it immediately.
 
+Resolved modules are cached, so `lib.os.path.join` in a loop costs a dictionary lookup per module. 
+Other attributes are looked up every time, so rebinding them (e.g. replacing `sys.stdout`) is seen.
+`lib.import_times()` tells you which imports made your startup slow, and on the command line
+`--import-times` prints that to stderr, while `--preimport` starts importing everything the code
+accesses via `lib` on a background thread right away.
+
 `lib` is also available on `_` which is itself just an alias for `wrap`. This is usefull if you want 
 to import fewer symbols from fluent or want to import the library under a custom name
 
@@ -245,6 +260,14 @@ in the collection:
 Yeah I know `_.each.call.*()` is crude - but I haven't found a good syntax to get rid of 
 the .call yet. Feedback welcome.
 
+All of these can be combined, and other `_.each` expressions can be used as operands:
+
+>>> _(orders).map(_.each.price * _.each.quantity)
+>>> _(lines).map(_.each.call.strip().call.upper())
+
+Every expression is compiled into a single plain lambda, so using it in map or filter is 
+about as fast as writing the lambda by hand.
+
 ## Chaining off of methods that return None
 
 A major nuissance for using fluent interfaces are methods that return None. Now this is mostly 
@@ -261,6 +284,43 @@ Even though both sort() and reverse() return None
 
 Of course, if you unwrap at any point with `.unwrap` or `._` you will get the true return value of `None`.
 
+## Lazy pipelines
+
+All the collection methods on Iterable are immediate, so every step of a chain creates a full tuple 
+of the data. If that is too much, `.lazy()` switches a chain to recording the steps instead. Nothing 
+is computed until the result is needed, and then all steps run in one pass over the data:
+
+>>> _(sys.stdin).lazy().map(str.strip).filter(None).map(str.upper).call(list)
+
+map / filter steps become chained builtin map and filter iterators, which pass every element 
+through all of them without intermediate tuples, steps that need all the data (e.g. sorted) only 
+collect once. The pipeline runs on `._` / `.unwrap` (returning a tuple, just like the immediate 
+version), when iterated, on `.call()` and on all the reductions like `.len()` or `.sum()`. 
+`.eager()` runs it and switches back to immediate methods.
+
+For data that doesn't fit into memory at all, `.iexternal_sorted()` and `.iexternal_groupby()` sort 
+in runs that are spilled to temporary files and merged lazily:
+
+>>> _(open('huge.log')).iexternal_groupby(_.each.call.split()[0]) \
+>>>     .imap(lambda group: (group[0], sum(1 for line in group[1])))
+
+Side channels like counters or writers can be fed from the same stream with `.ibroadcast(*consumers)`. 
+Each consumer runs in its own thread and gets the elements through a bounded queue, so a slow 
+consumer slows the stream down instead of the elements piling up in memory.
+
+## Profiling
+
+Which step of a long chain is slow? Every method called on a wrapper within `with _.profiled():` is 
+recorded with its time, the number of elements it got and produced and (with `memory=True`) the 
+memory it allocated. Lazy i-methods and the steps of `.lazy()` pipelines are measured as their elements 
+are pulled. At the end of the block a report with one line per stage is printed to stderr. 
+`python -m fluent --profile …` does the same for a whole one liner.
+
+Every wrapper keeps the wrapper it was created from alive as `.previous`, so a long chain of 
+immediate methods keeps a tuple per step. Within `with _.bounded_memory():` wrappers only keep 
+what chaining off of methods that return None needs, so only a constant number of intermediate 
+results are alive at any time.
+
 # Famous Last Words
 
 This library tries to do a little of what underscore does for javascript. Just provide the missing glue to make the standard library nicer and easier to use - especially for short oneliners or short script. Have fun!
@@ -283,7 +343,8 @@ Rework fluent so explicit unwrapping is required to do anythign with wrapped obj
 The idea here is that this would likely enable the library to be used in big / bigger 
 projects as it looses it's virus like qualities.
 * Maybe this is best done as a separate import?
-* This would also be a chance to consider always using the iterator versions of 
+* This would also be a chance to consider always using the iterator versions of
+  (partly done, see `.lazy()`) 
   all the collection methods under their original name and automatically unpacking 
   / triggering the iteration on ._? Not sure that's a great idea, as getting the 
   iterator to abstract over it is a) great and b) triggering the iteration is also 
@@ -307,10 +368,9 @@ __all__ = [
     'lib', # wrapper for python import machinery, access every importable package / function directly on this via attribute access
 ]
 
-import typing
-import re
 import math
 import types
+import contextvars
 import functools
 import itertools
 import operator
@@ -325,15 +385,6 @@ def wrap(wrapped, *, previous=None, chain=None):
     if isinstance(wrapped, Wrapper):
         return wrapped
     
-    by_type = (
-        (types.ModuleType, Module),
-        (typing.Text, Text),
-        (typing.Mapping, Mapping),
-        (typing.AbstractSet, Set),
-        (typing.Iterable, Iterable),
-        (typing.Callable, Callable),
-    )
-    
     if wrapped is None and chain is None and previous is not None:
         chain = previous.chain
     
@@ -341,15 +392,61 @@ def wrap(wrapped, *, previous=None, chain=None):
     if wrapped is None and chain is not None:
         decider = chain
     
+    decider_type = type(decider)
+    wrapper = wrapper_by_type.get(decider_type)
+    if wrapper is None:
+        if len(wrapper_by_type) >= WRAPPER_CACHE_SIZE:
+            wrapper_by_type.pop(next(iter(wrapper_by_type)), None)
+        wrapper = wrapper_by_type[decider_type] = wrapper_for_type(decider_type)
+    return wrapper(wrapped, previous=previous, chain=chain)
+
+def wrapper_for_type(a_type):
+    "Which Wrapper subclass is used for instances of a_type"
+    by_type = (
+        (types.ModuleType, Module),
+        (str, Text),
+        (byte_buffer_types(), Bytes),
+        (array_types(), Array),
+        (collections.abc.Mapping, Mapping),
+        (collections.abc.Set, Set),
+        (collections.abc.Iterable, Iterable),
+        (collections.abc.AsyncIterable, AsyncIterable),
+        (collections.abc.Callable, Callable),
+    )
     for clazz, wrapper in by_type:
-        if isinstance(decider, clazz):
-            return wrapper(wrapped, previous=previous, chain=chain)
-    
-    return Wrapper(wrapped, previous=previous, chain=chain)
+        if issubclass(a_type, clazz):
+            return wrapper
+    return Wrapper
+
+def byte_buffer_types():
+    "The types wrapped as Bytes. mmap objects can only exist if the mmap module was imported by someone"
+    import sys
+    mmap = sys.modules.get('mmap')
+    return (bytes, bytearray, memoryview) + ((mmap.mmap,) if mmap is not None else ())
+
+def array_types():
+    "The types wrapped as Array. numpy arrays can only exist if numpy was imported by someone"
+    import sys, array
+    numpy = sys.modules.get('numpy')
+    return (array.array,) + ((numpy.ndarray,) if numpy is not None else ())
+
+# The abstract base classes only look at the type, so the result of wrapper_for_type can be cached per type.
+# Clear this if you register classes with an abstract base class after they where wrapped.
+# A plain dict, as this is looked up for every wrap(). Only the last WRAPPER_CACHE_SIZE types are kept, 
+# so classes created on the fly, e.g. by namedtuple or in a loop, don't keep the cache growing.
+WRAPPER_CACHE_SIZE = 4096
+wrapper_by_type = dict()
 
 # sadly _ is pretty much the only valid python identifier that is sombolic and easy to type. Unicode would also be a candidate, but hard to type $, § like in js cannot be used
 _ = wrap
 
+# the Profile that records the methods called on wrappers, see Profile
+active_profile = None
+
+# whether wrappers keep the wrapper they were created from alive, see BoundedMemory
+# A context variable, so bounded_memory() in one thread or task doesn't change the chains of the others.
+retain_previous = contextvars.ContextVar('retain_previous', default=True)
+
 def wrapped(wrapped_function, additional_result_wrapper=None, self_index=0):
     """
     Using these decorators will take care of unwrapping and rewrapping the target object.
@@ -357,12 +454,30 @@ def wrapped(wrapped_function, additional_result_wrapper=None, self_index=0):
     
     Also perfect to adapt free functions as instance methods.
     """
-    @functools.wraps(wrapped_function)
-    def wrapper(self, *args, **kwargs):
-        result = wrapped_function(*args[0:self_index], self.chain, *args[self_index:], **kwargs)
+    if self_index == 0 and not callable(additional_result_wrapper):
+        # fast path for the most common case, as this runs for every attribute and item access
+        @functools.wraps(wrapped_function)
+        def wrapper(self, *args, **kwargs):
+            if active_profile is not None:
+                chain = self.chain
+                return wrap(active_profile.measure(wrapped_function.__name__, chain, args, 
+                    lambda: wrapped_function(chain, *args, **kwargs)), previous=self)
+            return wrap(wrapped_function(self.chain, *args, **kwargs), previous=self)
+        return wrapper
+    
+    def call(chain, args, kwargs):
+        result = wrapped_function(*args[0:self_index], chain, *args[self_index:], **kwargs)
         if callable(additional_result_wrapper):
             result = additional_result_wrapper(result)
-        return wrap(result, previous=self)
+        return result
+    
+    @functools.wraps(wrapped_function)
+    def wrapper(self, *args, **kwargs):
+        chain = self.chain
+        if active_profile is not None:
+            return wrap(active_profile.measure(wrapped_function.__name__, chain, args, 
+                lambda: call(chain, args, kwargs)), previous=self)
+        return wrap(call(chain, args, kwargs), previous=self)
     return wrapper
 
 def unwrapped(wrapped_function):
@@ -392,9 +507,27 @@ def tupleize(wrapped_function):
     """
     @functools.wraps(wrapped_function)
     def wrapper(self, *args, **kwargs):
+        if active_profile is not None:
+            return wrap(active_profile.measure(wrapped_function.__name__, self.chain, args, 
+                lambda: tuple(wrapped_function(self, *args, **kwargs))), previous=self)
         return wrap(tuple(wrapped_function(self, *args, **kwargs)), previous=self)
     return wrapper
 
+def native(function):
+    "The plain function behind an _.each expression, anything else as is"
+    if isinstance(function, Each):
+        return function.unwrap
+    return function
+
+def with_native_functions(a_function):
+    "Replaces _.each expressions in the arguments (and key=) with the functions they compile to"
+    @functools.wraps(a_function)
+    def wrapper(*args, **kwargs):
+        if 'key' in kwargs:
+            kwargs['key'] = native(kwargs['key'])
+        return a_function(*map(native, args), **kwargs)
+    return wrapper
+
 class Wrapper(object):
     """Universal wrapper.
     
@@ -416,9 +549,16 @@ class Wrapper(object):
        string interface, etc.
     """
     
+    # Wrappers are created for every intermediate result, so keep them small.
+    # All subclasses need to declare __slots__ too.
+    __slots__ = ('__wrapped', '__previous', '__chain')
+    
     def __init__(self, wrapped, *, previous, chain):
         assert wrapped is not None or chain is not None, 'Cannot chain off of None'
         self.__wrapped = wrapped
+        if not retain_previous.get() and not isinstance(self, Callable):
+            # the chain is all that methods returning None need, see BoundedMemory
+            previous = None
         self.__previous = previous
         self.__chain = chain
     
@@ -451,8 +591,8 @@ class Wrapper(object):
     @property
     def chain(self):
         "Like .unwrap but handles chaining off of methods / functions that return None like SmallTalk does"
-        if self.unwrap is not None:
-            return self.unwrap
+        if self.__wrapped is not None:
+            return self.__wrapped
         return self.__chain
     
     # Utilities
@@ -504,30 +644,58 @@ class Module(Wrapper):
     All objects returned from lib are pre-wrapped, so you can chain off of them immediately.
     """
     
+    __slots__ = ()
+    
     def __getattr__(self, name):
-        if hasattr(self.chain, name):
-            return wrap(getattr(self.chain, name))
+        # modules are cached, so lib.os.path.join in a loop only resolves the modules once. Other attributes 
+        # are looked up every time, so rebinding them (e.g. sys.stdout) is seen, just like with a plain import.
+        path = name if self.chain is virtual_root_module else self.chain.__name__ + '.' + name
+        if path in resolved_lib_paths:
+            return resolved_lib_paths[path]
         
-        import importlib
-        module = None
-        if self.chain is virtual_root_module:
-            module = importlib.import_module(name)
+        if hasattr(self.chain, name):
+            attribute = getattr(self.chain, name)
+            if not isinstance(attribute, types.ModuleType):
+                return wrap(attribute)
+            resolved = wrap(attribute)
         else:
-            module = importlib.import_module('.'.join((self.chain.__name__, name)))
+            import importlib, time
+            start = time.perf_counter()
+            module = importlib.import_module(path)
+            lib_import_times[path] = time.perf_counter() - start
+            resolved = wrap(module)
         
-        return wrap(module)
+        resolved_lib_paths[path] = resolved
+        return resolved
+    
+    def clear_cache(self):
+        """Forget all resolved modules.
+        
+        Modules are resolved once, so this is only needed if a module is replaced, e.g. by importlib.reload.
+        """
+        resolved_lib_paths.clear()
+    
+    @wrapped
+    def import_times(self):
+        "Seconds spent in each import done by lib, most expensive first."
+        return dict(sorted(lib_import_times.items(), key=operator.itemgetter(1), reverse=True))
+
+resolved_lib_paths = dict()
+lib_import_times = dict()
 
 wrap.lib = lib = Module(virtual_root_module, previous=None, chain=None)
 
 class Callable(Wrapper):
     
+    __slots__ = ()
+    
     def __call__(self, *args, **kwargs):
         """"Call through with a twist.
         
         If one of the args is `wrap` / `_`, then this acts as a shortcut to curry instead"""
         # REFACT consider to drop the auto curry - doesn't look like it is so super usefull
         # REFACT Consider how to expand this so every method in the library supports auto currying
-        if wrap in args:
+        if any(arg is wrap for arg in args):
             return self.curry(*args, **kwargs)
         
         result = self.chain(*args, **kwargs)
@@ -548,32 +716,155 @@ class Callable(Wrapper):
         For example:
         
         >>> _(operator.add).curry(_, 'foo')('bar') == 'barfoo'
-        """
-        placeholder = wrap
-        def merge_args(curried_args, args):
-            assert curried_args.count(placeholder) == len(args), \
-                'Need the right ammount of arguments for the placeholders'
-            
-            new_args = list(curried_args)
-            if placeholder in curried_args:
-                index = 0
-                for arg in args:
-                    index = new_args.index(placeholder, index)
-                    new_args[index] = arg
-            return new_args
         
-        @functools.wraps(self)
-        def wrapper(*actual_args, **actual_kwargs):
-            return self(
-                *merge_args(curry_args, actual_args),
-                **dict(curry_kwargs, **actual_kwargs)
-            )
-        return wrapper
+        Where the placeholders are is only looked at once, the curried function 
+        is compiled to pass its arguments straight through.
+        """
+        if not any(arg is wrap for arg in curry_args):
+            curried = functools.partial(self, *curry_args, **curry_kwargs)
+        else:
+            curried_values = (arg for arg in curry_args if arg is not wrap)
+            curried = curry_plan(curry_args, bool(curry_kwargs))(self, curry_kwargs, *curried_values)
+        return functools.update_wrapper(curried, self)
     
     @wrapped
     def compose(self, outer):
         return lambda *args, **kwargs: outer(self(*args, **kwargs))
     # REFACT consider aliasses wrap = chain = cast = compose
+    
+    @wrapped
+    def memoize(self, maxsize=128, *, ttl=None, key=None, byte_budget=None, size_of=None, thread_safe=False):
+        """Cache the results of the last maxsize calls (None: no limit), evicting the least recently used first.
+        
+        ttl: results older than this many seconds are computed again
+        key: called with the arguments, returns the hashable cache key. Needed for unhashable 
+            arguments, e.g. `key=lambda items: tuple(items)`
+        byte_budget: also evict while the results take more than this many bytes, as measured by 
+            size_of (default sys.getsizeof). Larger results are not cached at all.
+        thread_safe: lock the cache, so it can be shared by several threads. Concurrent calls with 
+            the same arguments may still both compute the result.
+        
+        `.cache_info()` returns the hits, misses, evictions, maxsize and currsize, `.cache_clear()` empties it.
+        
+        >>> _(lines).imap(_(expensive_lookup).memoize(maxsize=10000))
+        """
+        return Memoized(self, maxsize, ttl=ttl, key=key, byte_budget=byte_budget, size_of=size_of, thread_safe=thread_safe)
+
+# (placeholder pattern, has curried keyword arguments) -> function that takes the function, 
+# the curried keyword and positional arguments and returns the compiled curried function
+curry_plans = dict()
+
+def curry_plan(curry_args, has_curry_kwargs):
+    """Compiles a function that puts its positional arguments where the placeholders in curry_args are.
+    
+    E.g. for (_, 'baz', _) this is
+    >>> lambda function, curry_kwargs, c1: lambda a0, a2, /, **kwargs: function(a0, c1, a2, **kwargs)
+    """
+    pattern = tuple(arg is wrap for arg in curry_args)
+    if (pattern, has_curry_kwargs) not in curry_plans:
+        names = tuple(('a%d' if is_placeholder else 'c%d') % index for index, is_placeholder in enumerate(pattern))
+        placeholders = tuple(name for name, is_placeholder in zip(names, pattern) if is_placeholder)
+        curried = tuple(name for name, is_placeholder in zip(names, pattern) if not is_placeholder)
+        
+        parameters = ', '.join(placeholders + ('/', '**kwargs'))
+        keyword_arguments = '**{**curry_kwargs, **kwargs}' if has_curry_kwargs else '**kwargs'
+        source = 'lambda %s: lambda %s: function(%s)' % (
+            ', '.join(('function', 'curry_kwargs') + curried), parameters, ', '.join(names + (keyword_arguments,)))
+        curry_plans[pattern, has_curry_kwargs] = eval(source, dict(__builtins__={}))
+    return curry_plans[pattern, has_curry_kwargs]
+
+CacheInfo = collections.namedtuple('CacheInfo', 'hits misses evictions maxsize currsize')
+
+# separates the positional from the keyword arguments in the default cache key
+keyword_arguments_mark = object()
+
+def memoize_key(*args, **kwargs):
+    if not kwargs:
+        return args
+    return args + (keyword_arguments_mark,) + tuple(kwargs.items())
+
+class Memoized(object):
+    "function with a bounded cache of its results, see Callable.memoize"
+    
+    def __init__(self, function, maxsize=128, *, ttl=None, key=None, byte_budget=None, size_of=None, thread_safe=False):
+        functools.update_wrapper(self, function)
+        self._function = function
+        self._maxsize = math.inf if maxsize is None else maxsize
+        self._ttl = ttl
+        self._key = memoize_key if key is None else native(key)
+        self._byte_budget = byte_budget
+        self._size_of = size_of
+        if byte_budget is not None and size_of is None:
+            import sys
+            self._size_of = sys.getsizeof
+        if ttl is not None:
+            import time
+            self._clock = time.monotonic
+        self._lock = None
+        if thread_safe:
+            import threading
+            self._lock = threading.Lock()
+        # key -> (result, expiry time or None, bytes), least recently used first
+        self._cache = collections.OrderedDict()
+        self._bytes = self._hits = self._misses = self._evictions = 0
+    
+    def __call__(self, *args, **kwargs):
+        key = self._key(*args, **kwargs)
+        if self._lock is None:
+            entry = self._lookup(key)
+        else:
+            with self._lock:
+                entry = self._lookup(key)
+        if entry is not None:
+            return entry[0]
+        
+        result = self._function(*args, **kwargs)
+        if self._lock is None:
+            self._store(key, result)
+        else:
+            with self._lock:
+                self._store(key, result)
+        return result
+    
+    def _lookup(self, key):
+        entry = self._cache.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= self._clock()):
+            self._misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self._hits += 1
+        return entry
+    
+    def _store(self, key, result):
+        result_bytes = 0 if self._size_of is None else self._size_of(result)
+        if self._byte_budget is not None and result_bytes > self._byte_budget:
+            return # would only evict everything else
+        if key in self._cache: # expired, or another thread was faster
+            self._bytes -= self._cache.pop(key)[2]
+        self._cache[key] = (result, None if self._ttl is None else self._clock() + self._ttl, result_bytes)
+        self._bytes += result_bytes
+        while len(self._cache) > self._maxsize or (self._byte_budget is not None and self._bytes > self._byte_budget):
+            evicted_key, (evicted_result, expiry, evicted_bytes) = self._cache.popitem(last=False)
+            self._bytes -= evicted_bytes
+            self._evictions += 1
+    
+    def cache_info(self):
+        maxsize = None if self._maxsize == math.inf else self._maxsize
+        return CacheInfo(self._hits, self._misses, self._evictions, maxsize, len(self._cache))
+    
+    def cache_clear(self):
+        if self._lock is None:
+            self._clear()
+        else:
+            with self._lock:
+                self._clear()
+    
+    def _clear(self):
+        self._cache.clear()
+        self._bytes = self._hits = self._misses = self._evictions = 0
+
+# about how many elements broadcasted() keeps queued per consumer
+BROADCAST_QUEUE_LENGTH = 1024
 
 class Iterable(Wrapper):
     """Add iterator methods to any iterable.
@@ -590,6 +881,8 @@ class Iterable(Wrapper):
     iterator.
     """
     
+    __slots__ = ()
+    
     __iter__ = unwrapped(iter)
     
     @wrapped
@@ -613,22 +906,22 @@ class Iterable(Wrapper):
     ## Reductors .........................................
     
     len = wrapped(len)
-    max = wrapped(max)
-    min = wrapped(min)
+    max = wrapped(with_native_functions(max))
+    min = wrapped(with_native_functions(min))
     sum = wrapped(sum)
     any = wrapped(any)
     all = wrapped(all)
-    reduce = wrapped_forward(functools.reduce)
+    reduce = wrapped_forward(with_native_functions(functools.reduce))
     
     ## Iterators .........................................
     
-    imap = wrapped_forward(map)
+    imap = wrapped_forward(with_native_functions(map))
     map = tupleize(imap)
     
-    istar_map = istarmap = wrapped_forward(itertools.starmap)
+    istar_map = istarmap = wrapped_forward(with_native_functions(itertools.starmap))
     star_map = starmap = tupleize(istarmap)
     
-    ifilter = wrapped_forward(filter)
+    ifilter = wrapped_forward(with_native_functions(filter))
     filter = tupleize(ifilter)
     
     ienumerate = wrapped(enumerate)
@@ -637,31 +930,82 @@ class Iterable(Wrapper):
     ireversed = wrapped(reversed)
     reversed = tupleize(ireversed)
     
-    isorted = wrapped(sorted)
+    isorted = wrapped(with_native_functions(sorted))
     sorted = tupleize(isorted)
     
     @wrapped
     def igrouped(self, group_length):
-        "s -> (s0,s1,s2,...sn-1), (sn,sn+1,sn+2,...s2n-1), (s2n,s2n+1,s2n+2,...s3n-1), ..."
+        "s -> (s0,s1,s2,...sn-1), (sn,sn+1,sn+2,...s2n-1), (s2n,s2n+1,s2n+2,...s3n-1), ... drops an incomplete last group, see ibatched"
         return zip(*[iter(self)]*group_length)
     grouped = tupleize(igrouped)
     
+    @wrapped
+    def ibatched(self, size, buffer=None):
+        """s -> (s0,…,s[size-1]), (s[size],…,s[2*size-1]), …, (…,sn) like igrouped, but keeps the shorter last batch.
+        
+        With a buffer (a list or array.array of length size) every batch is written into it and the 
+        buffer itself is yielded, so there is no allocation per batch. It is overwritten by the next 
+        batch, so use it up before advancing, e.g. in executemany() or a vectorized function:
+        
+        >>> for batch in _(rows).ibatched(1000, buffer=[None] * 1000):
+        >>>     cursor.executemany(sql, batch)
+        
+        A shorter last batch is yielded as a copy of the filled part, the buffer keeps its length."""
+        return batched(self, size, buffer)
+    
+    @tupleize
+    def batched(self, size):
+        "Like ibatched, but collects the batches, so there is no buffer to write them into."
+        return batched(self, size)
+    
+    @wrapped
+    def ichunked(self, size=None, *, byte_budget=None, size_of=None):
+        """Tuples of consecutive elements, with at most size elements and / or byte_budget bytes each.
+        
+        The bytes of an element are size_of(element), len by default, which fits str and bytes elements.
+        An element that alone exceeds byte_budget becomes a chunk of its own. Nothing is dropped at the end."""
+        return chunked(self, size, byte_budget, size_of)
+    chunked = tupleize(ichunked)
+    
+    @wrapped
+    def iwindowed(self, size, step=1):
+        """s -> (s0,…,s[size-1]), (s[step],…,s[step+size-1]), …
+        
+        Windows start every step elements, so with step > size the elements between windows are skipped. 
+        If the last full window doesn't reach the end, a shorter window with the rest follows, so with 
+        step <= size every element is part of a window."""
+        return windowed(self, size, step)
+    windowed = tupleize(iwindowed)
+    
     izip = wrapped(zip)
     zip = tupleize(izip)
     
     @wrapped
-    def iflatten(self, level=math.inf):
-        "Modeled after rubys array.flatten @see http://ruby-doc.org/core-1.9.3/Array.html#method-i-flatten"
-        for element in self:
-            if level > 0 and isinstance(element, typing.Iterable):
-                for subelement in _(element).iflatten(level=level-1):
-                    yield subelement
-            else:
-                yield element
-        return
+    def ipmap(self, function, **options):
+        """Like imap, but calls function on a pool of threads or processes.
+        
+        Results stream back lazily, with only a bounded number of elements in flight.
+        See parallel_chunks() for the options."""
+        return parallel_chunks(map_chunk, function, self, **options)
+    pmap = tupleize(ipmap)
+    
+    @wrapped
+    def ipfilter(self, function, **options):
+        "Like ifilter, but calls function on a pool of threads or processes. See ipmap."
+        return parallel_chunks(filter_chunk, function, self, **options)
+    pfilter = tupleize(ipfilter)
+    
+    @wrapped
+    def iflatten(self, level=math.inf, atomic_types=(str, bytes, bytearray)):
+        """Modeled after rubys array.flatten @see http://ruby-doc.org/core-1.9.3/Array.html#method-i-flatten
+        
+        Instances of atomic_types are not descended into, even though they are iterable. Keep str in there,
+        its elements are strings again, so flattening would never end.
+        """
+        return flattened(self, level=level, atomic_types=atomic_types)
     flatten = tupleize(iflatten)
     
-    igroupby = wrapped(itertools.groupby)
+    igroupby = wrapped(with_native_functions(itertools.groupby))
     def groupby(self, *args, **kwargs):
         # Need an extra wrapping function to consume the deep iterators in time
         result = []
@@ -669,17 +1013,577 @@ class Iterable(Wrapper):
             result.append((key, tuple(values)))
         return wrap(tuple(result))
     
+    @wrapped
+    def iexternal_sorted(self, key=None, reverse=False, **options):
+        """Like isorted, but for more data than fits into memory.
+        
+        Spills sorted runs to temporary files, see externally_sorted() for the options."""
+        return externally_sorted(self, key=native(key), reverse=reverse, **options)
+    external_sorted = tupleize(iexternal_sorted)
+    
+    @wrapped
+    def iexternal_groupby(self, key=None, **options):
+        """Groups all elements with the same key, even if they are not next to each other and don't fit into memory.
+        
+        Sorts with iexternal_sorted() first and then yields (key, iterator over the group) as igroupby does, 
+        so each group has to be consumed before moving on to the next one."""
+        key = native(key)
+        return itertools.groupby(externally_sorted(self, key=key, **options), key)
+    def external_groupby(self, *args, **kwargs):
+        return wrap(tuple((key, tuple(values)) for key, values in self.iexternal_groupby(*args, **kwargs)))
+    
     def tee(self, function):
-        "This override tries to retain iterators, as a speedup"
+        """This override tries to retain iterators, as a speedup.
+        
+        function has consumed its copy of an iterator before tee returns, so all elements it pulled 
+        are kept in memory until the result is iterated. Use ibroadcast to feed iterators to side 
+        channels in constant memory."""
         if hasattr(self.chain, '__next__'): # iterator
             first, second = itertools.tee(self.chain, 2)
             function(wrap(first, previous=self))
             return wrap(second, previous=self)
         else:
             return super().tee(function)
+    
+    @wrapped
+    def ibroadcast(self, *consumers, queue_length=BROADCAST_QUEUE_LENGTH):
+        """Iterator over self, that also feeds the elements to all the consumers, each running in its own thread.
+        
+        Each consumer is called with an iterator over the elements and gets them through a queue of 
+        about queue_length elements. If a consumer falls behind, the iteration waits for it, so infinite 
+        iterators can be fed to side channels like counters or writers in constant memory.
+        The first exception a consumer raises stops the iteration with the next chunk of elements
+        (at the latest once self is exhausted) and is reraised after all consumers returned.
+        
+        >>> _(sys.stdin).ibroadcast(output.writelines, progress).imap(parse)…
+        """
+        return broadcasted(self, tuple(map(native, consumers)), queue_length)
+    
+    @wrapped
+    def broadcast(self, *consumers, queue_length=BROADCAST_QUEUE_LENGTH):
+        """Feeds all elements of self to the consumers like ibroadcast, returns a tuple of their results.
+        
+        Different from the other eager methods, the elements are not collected, so this runs in constant memory.
+        
+        >>> line_count, counts = _(open('huge.log')).broadcast(count, collections.Counter)
+        """
+        results = [None] * len(consumers)
+        collections.deque(broadcasted(self, tuple(map(native, consumers)), queue_length, results), maxlen=0)
+        return tuple(results)
+
+    @wrapped
+    def cached(self):
+        """Iterable that pulls each element from self only once and can be iterated again and again.
+        
+        All elements pulled so far are kept, so this needs as much memory as a tuple of them, 
+        but it can be used with infinite iterators. Anything that is not an iterator is returned as is."""
+        if not hasattr(self, '__next__'): # can already be iterated repeatedly
+            return self
+        return Replayable(self)
+    
+    def lazy(self):
+        "Record the following collection methods and run them in one pass once the result is needed. See Lazy."
+        return Lazy(self.chain, previous=self, chain=None)
+    
+    @wrapped
+    def aiter(self):
+        "Async iterator over self, to continue with the methods of AsyncIterable"
+        async def asynchronous():
+            for element in self:
+                yield element
+        return asynchronous()
+
+class Replayable(object):
+    "Iterable over the elements of iterator, buffered so it can be iterated repeatedly, see Iterable.cached"
+    
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._buffer = []
+    
+    def __iter__(self):
+        index = 0
+        while True:
+            if index == len(self._buffer):
+                # one element at a time, so several iterations can be interleaved
+                element = next(self._iterator, end_of_iteration)
+                if element is end_of_iteration:
+                    return
+                self._buffer.append(element)
+            yield self._buffer[index]
+            index += 1
+
+end_of_iteration = object()
+
+def broadcasted(iterable, consumers, queue_length=BROADCAST_QUEUE_LENGTH, results=None):
+    "Yields the elements of iterable, while feeding them to the consumers in threads. See Iterable.ibroadcast"
+    import queue, threading
+    results = [None] * len(consumers) if results is None else results
+    errors = []
+    # the elements are queued in chunks, as every queue operation takes a lock
+    chunk_length = max(1, queue_length // 4)
+    queues = tuple(queue.Queue(maxsize=4) for consumer in consumers)
+    threads = tuple(
+        threading.Thread(target=consume_queued, args=(consumer, chunks, results, index, errors), daemon=True)
+        for index, (consumer, chunks) in enumerate(zip(consumers, queues)))
+    for thread in threads:
+        thread.start()
+    
+    chunk = []
+    try:
+        for element in iterable:
+            chunk.append(element)
+            if len(chunk) == chunk_length:
+                if errors:
+                    chunk = []
+                    break
+                for chunks in queues:
+                    chunks.put(chunk) # blocks while a consumer is behind
+                chunk = []
+            yield element
+    finally:
+        for chunks in queues:
+            if chunk:
+                chunks.put(chunk)
+            chunks.put(end_of_iteration)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+def consume_queued(consumer, chunks, results, index, errors):
+    "Calls consumer with an iterator over the queued chunks, stores its result or exception"
+    def elements():
+        while True:
+            chunk = chunks.get()
+            if chunk is end_of_iteration:
+                return
+            yield from chunk
+    iterator = elements()
+    try:
+        results[index] = consumer(iterator)
+    except BaseException as error:
+        errors.append(error)
+    finally:
+        for ignored in iterator: # consumers that stop early must not block the others
+            pass
+
+def flattened(iterable, level=math.inf, atomic_types=(str, bytes, bytearray)):
+    """Iterator over the elements of iterable, with nested iterables up to level replaced by their elements.
+    
+    Works with an explicit stack of iterators, so every element is yielded by just this one generator 
+    and deep nesting doesn't hit the recursion limit.
+    """
+    atomic_types = tuple(atomic_types)
+    # whether to descend into elements of a type, as ABCs only look at the type this can be cached
+    is_container = { container: not issubclass(container, atomic_types) for container in (list, tuple) }
+    iterator = iter(iterable)
+    parents = []
+    while True:
+        for element in iterator:
+            element_type = type(element)
+            if element_type not in is_container:
+                is_container[element_type] = not issubclass(element_type, atomic_types) \
+                    and issubclass(element_type, collections.abc.Iterable)
+            if is_container[element_type] and len(parents) < level:
+                parents.append(iterator)
+                iterator = iter(element)
+                break
+            yield element
+        else:
+            if not parents:
+                return
+            iterator = parents.pop()
+
+def batched(iterable, size, buffer=None):
+    "Batches of size elements, see Iterable.ibatched"
+    assert size >= 1, 'size has to be positive'
+    iterator = iter(iterable)
+    if buffer is None:
+        return iter(lambda: tuple(itertools.islice(iterator, size)), ())
+    assert len(buffer) == size, 'buffer needs to have the length of a batch'
+    return filled_batches(iterator, buffer)
+
+def filled_batches(iterator, buffer):
+    size = len(buffer)
+    while True:
+        length = 0
+        for element in itertools.islice(iterator, size):
+            buffer[length] = element
+            length += 1
+        if length < size:
+            if length > 0:
+                yield buffer[:length]
+            return
+        yield buffer
+
+def chunked(iterable, size=None, byte_budget=None, size_of=None):
+    "Chunks limited by number of elements and / or bytes, see Iterable.ichunked"
+    assert size is not None or byte_budget is not None, 'Need a size or a byte_budget (or both)'
+    if byte_budget is None:
+        return batched(iterable, size)
+    return byte_budget_chunks(iterable, math.inf if size is None else size, byte_budget, size_of or len)
+
+def byte_budget_chunks(iterable, size, byte_budget, size_of):
+    chunk, chunk_bytes = [], 0
+    for element in iterable:
+        element_bytes = size_of(element)
+        if chunk and (chunk_bytes + element_bytes > byte_budget or len(chunk) >= size):
+            yield tuple(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(element)
+        chunk_bytes += element_bytes
+    if chunk:
+        yield tuple(chunk)
+
+def windowed(iterable, size, step=1):
+    "Windows of size elements every step elements, see Iterable.iwindowed"
+    assert size >= 1 and step >= 1, 'size and step have to be positive'
+    iterator = iter(iterable)
+    window = collections.deque(itertools.islice(iterator, size))
+    while window:
+        yield tuple(window)
+        if len(window) < size: # that was the rest
+            return
+        
+        if step == 1: # the classic sliding window
+            for element in iterator:
+                window.popleft()
+                window.append(element)
+                yield tuple(window)
+            return
+        
+        if step >= size:
+            window.clear()
+            collections.deque(itertools.islice(iterator, step - size), maxlen=0) # skip the gap
+            window.extend(itertools.islice(iterator, size))
+        else:
+            new_elements = tuple(itertools.islice(iterator, step))
+            if not new_elements:
+                return
+            for ignored in range(step):
+                window.popleft()
+            window.extend(new_elements)
+
+EXTERNAL_SORT_MEMORY_BUDGET = 256 << 20 # bytes
+SPILL_CHUNK_LENGTH = 1024 # elements pickled together
+
+def externally_sorted(iterable, key=None, reverse=False, *, memory_budget=EXTERNAL_SORT_MEMORY_BUDGET, directory=None):
+    """Iterator over the elements of iterable in sorted order, for more elements than fit into memory.
+    
+    Elements are collected until their size reaches memory_budget bytes, then sorted and written as a run to a 
+    temporary file in directory (the default of tempfile if None). Sizes are taken from sys.getsizeof, so what 
+    elements reference is not counted. The runs are merged lazily, which needs one chunk per run in memory. 
+    Elements have to be picklable if they don't all fit into the budget. Like sorted, this is stable.
+    """
+    import sys, heapq
+    iterator = iter(iterable)
+    runs = []
+    try:
+        while True:
+            run, size = [], 0
+            for element in iterator:
+                run.append(element)
+                size += sys.getsizeof(element)
+                if size >= memory_budget:
+                    break
+            run.sort(key=key, reverse=reverse)
+            if size < memory_budget: # iterable is exhausted, the last run doesn't need to be spilled
+                if not runs:
+                    yield from run
+                    return
+                break
+            runs.append(spilled(run, directory))
+        
+        yield from heapq.merge(*map(read_spilled, runs), run, key=key, reverse=reverse)
+    finally:
+        for file in runs:
+            file.close()
+
+def spilled(elements, directory=None):
+    "Writes elements to an anonymous temporary file in directory, positioned to be read back with read_spilled()"
+    import tempfile, pickle
+    file = tempfile.TemporaryFile(dir=directory)
+    for start in range(0, len(elements), SPILL_CHUNK_LENGTH):
+        pickle.dump(elements[start:start + SPILL_CHUNK_LENGTH], file, pickle.HIGHEST_PROTOCOL)
+    file.seek(0)
+    return file
+
+def read_spilled(file):
+    import pickle
+    while True:
+        try:
+            chunk = pickle.load(file)
+        except EOFError:
+            return
+        yield from chunk
+
+# module level, so they can be sent to process pools
+def map_chunk(function, chunk):
+    return [function(element) for element in chunk]
+
+def filter_chunk(function, chunk):
+    return [element for element in chunk if function(element)]
+
+def parallel_chunks(chunk_function, function, iterable, *, workers=None, processes=False, 
+        chunk_size=1, ordered=True, in_flight=None):
+    """Yields from chunk_function(function, chunk) for chunks of iterable, computed on a pool.
+    
+    workers: number of threads or processes, defaults to what concurrent.futures chooses
+    processes: use a process pool instead of threads. Requires function and elements to be picklable.
+    chunk_size: number of elements sent to a worker at once
+    ordered: yield results in the order of iterable, or as soon as they are done
+    in_flight: maximum number of chunks submitted but not yet yielded, defaults to twice the workers
+    
+    As only in_flight chunks are pulled from iterable ahead of the consumer, this works with infinite iterators.
+    """
+    import os
+    
+    assert workers is None or workers >= 1, 'workers has to be positive'
+    assert chunk_size >= 1, 'chunk_size has to be positive'
+    if in_flight is None:
+        in_flight = 2 * (workers or os.cpu_count() or 1)
+    assert in_flight >= 1, 'in_flight has to be positive'
+    return pooled_chunks(chunk_function, native(function), iter(iterable), workers, processes, 
+        chunk_size, ordered, in_flight)
+
+def pooled_chunks(chunk_function, function, iterator, workers, processes, chunk_size, ordered, in_flight):
+    import concurrent.futures
+    
+    executor_class = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+    executor = executor_class(workers)
+    chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+    pending = collections.deque()
+    try:
+        for chunk in itertools.islice(chunks, in_flight):
+            pending.append(executor.submit(chunk_function, function, chunk))
+        while pending:
+            if ordered:
+                done = pending.popleft()
+            else:
+                done = next(concurrent.futures.as_completed(pending))
+                pending.remove(done)
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(executor.submit(chunk_function, function, chunk))
+            yield from done.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+class Lazy(Iterable):
+    """Iterable that records collection methods instead of running them.
+    
+    Each collection method returns a new Lazy with one more step. The steps run in one 
+    pass when the result is needed: on `._` / `.unwrap` (which returns a tuple), when 
+    iterated, on `.call()` and on all the reductions. Every run starts a new pass over 
+    the wrapped iterable, so an iterator can only be run once.
+    """
+    
+    __slots__ = ('_source', '_steps')
+    
+    def __init__(self, wrapped, *, previous, chain, steps=()):
+        super().__init__(wrapped, previous=previous, chain=chain)
+        self._source = wrapped
+        self._steps = steps
+    
+    def _with_step(self, *step):
+        return Lazy(self._source, previous=self, chain=None, steps=self._steps + (step,))
+    
+    def _run(self):
+        if active_profile is not None: # every step on its own, so they can be measured
+            return active_profile.measure_lazy_steps(self._source, self._steps)
+        
+        # chained map and filter objects already run in one pass, without calling back into Python
+        iterator = iter(self._source)
+        for kind, function in self._steps:
+            if kind == 'map':
+                iterator = map(function, iterator)
+            elif kind == 'filter':
+                iterator = filter(function, iterator)
+            else:
+                iterator = function(iterator)
+        return iterator
+    
+    @property
+    def unwrap(self):
+        return tuple(self._run())
+    _ = unwrap
+    
+    @property
+    def chain(self):
+        return self._run()
+    
+    __iter__ = _run
+    
+    def __eq__(self, other):
+        return self.unwrap == other
+    
+    def __repr__(self):
+        return "fluent.wrap(%r).lazy()%s" % (self._source, ''.join('.%s()' % kind for kind, function in self._steps))
+    __str__ = __repr__
+    
+    def lazy(self):
+        return self
+    
+    def eager(self):
+        "Runs the pipeline and returns to immediate collection methods"
+        return wrap(self.unwrap, previous=self)
+    
+    @wrapped
+    def len(self):
+        return sum(1 for element in self)
+    
+    # Elementwise steps ..................................
+    
+    def map(self, function):
+        return self._with_step('map', native(function))
+    imap = map
+    
+    def star_map(self, function):
+        function = native(function)
+        return self._with_step('map', lambda arguments: function(*arguments))
+    starmap = istar_map = istarmap = star_map
+    
+    def filter(self, function):
+        return self._with_step('filter', native(function))
+    ifilter = filter
+    
+    # Steps over the whole stream ........................
+    
+    def enumerate(self, *args, **kwargs):
+        return self._with_step('enumerate', lambda iterator: enumerate(iterator, *args, **kwargs))
+    ienumerate = enumerate
+    
+    def reversed(self):
+        return self._with_step('reversed', lambda iterator: reversed(tuple(iterator)))
+    ireversed = reversed
+    
+    def sorted(self, *args, **kwargs):
+        return self._with_step('sorted', lambda iterator: iter(with_native_functions(sorted)(iterator, *args, **kwargs)))
+    isorted = sorted
+    
+    def zip(self, *others):
+        return self._with_step('zip', lambda iterator: zip(iterator, *others))
+    izip = zip
+    
+    def flatten(self, *args, **kwargs):
+        return self._with_step('flatten', lambda iterator: flattened(iterator, *args, **kwargs))
+    iflatten = flatten
+    
+    def grouped(self, group_length):
+        return self._with_step('grouped', lambda iterator: zip(*[iterator]*group_length))
+    igrouped = grouped
+    
+    def batched(self, size):
+        return self._with_step('batched', lambda iterator: batched(iterator, size))
+    ibatched = batched
+    
+    def chunked(self, size=None, **options):
+        return self._with_step('chunked', lambda iterator: chunked(iterator, size, **options))
+    ichunked = chunked
+    
+    def windowed(self, size, step=1):
+        return self._with_step('windowed', lambda iterator: windowed(iterator, size, step))
+    iwindowed = windowed
+    
+    def pmap(self, function, **options):
+        return self._with_step('pmap', lambda iterator: parallel_chunks(map_chunk, function, iterator, **options))
+    ipmap = pmap
+    
+    def pfilter(self, function, **options):
+        return self._with_step('pfilter', lambda iterator: parallel_chunks(filter_chunk, function, iterator, **options))
+    ipfilter = pfilter
+    
+    def groupby(self, *args, **kwargs):
+        def groupby(iterator):
+            for key, values in with_native_functions(itertools.groupby)(iterator, *args, **kwargs):
+                yield key, tuple(values)
+        return self._with_step('groupby', groupby)
+    igroupby = groupby
+
+async def _call_and_await(function, element):
+    "Calls function and awaits the result if it is awaitable, so plain functions work too"
+    result = function(element)
+    if isinstance(result, Wrapper):
+        result = result.unwrap
+    if hasattr(type(result), '__await__'):
+        result = await result
+    return result
+
+def concurrent_calls(function, async_iterable, *, keep, concurrency=1, ordered=True):
+    """Calls function for every element of async_iterable, with at most `concurrency` calls in flight.
+    
+    keep(element, result) decides what is yielded, e.g. the result for map or the element for filter.
+    Results are yielded in the order of async_iterable, or with ordered=False as soon as they are done.
+    """
+    assert concurrency >= 1, 'concurrency has to be positive'
+    return limited_calls(native(function), async_iterable, keep, concurrency, ordered)
+
+async def limited_calls(function, async_iterable, keep, concurrency, ordered):
+    import asyncio
+    
+    async def call(element):
+        return element, await _call_and_await(function, element)
+    
+    pending = collections.deque()
+    async def next_done():
+        if ordered:
+            return await pending.popleft()
+        done, _still_pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        task = done.pop()
+        pending.remove(task)
+        return task.result()
+    
+    try:
+        async for element in async_iterable:
+            pending.append(asyncio.ensure_future(call(element)))
+            while len(pending) >= concurrency:
+                for kept in keep(*await next_done()):
+                    yield kept
+        while pending:
+            for kept in keep(*await next_done()):
+                yield kept
+    finally:
+        for task in pending:
+            task.cancel()
+
+class AsyncIterable(Wrapper):
+    """Add collection methods to async iterables, like async generators.
+    
+    The functions given to amap and afilter can be plain functions or return awaitables, 
+    e.g. coroutine functions. For I/O bound work, `concurrency` allows many of them to be in 
+    flight at the same time.
+    
+    >>> _(urls).aiter().amap(fetch, concurrency=100, ordered=False).gather()
+    """
+    
+    __slots__ = ()
+    
+    __aiter__ = unwrapped(aiter)
+    
+    @wrapped
+    def amap(self, function, *, concurrency=1, ordered=True):
+        "Async version of imap that allows up to concurrency calls in flight"
+        return concurrent_calls(function, self, keep=lambda element, result: (result,),
+            concurrency=concurrency, ordered=ordered)
+    
+    @wrapped
+    def afilter(self, function, *, concurrency=1, ordered=True):
+        "Async version of ifilter that allows up to concurrency calls in flight"
+        return concurrent_calls(function, self, keep=lambda element, result: (element,) if result else (),
+            concurrency=concurrency, ordered=ordered)
+    
+    async def agather(self):
+        "Collects all elements into a tuple, await it"
+        return wrap(tuple([element async for element in self.chain]), previous=self)
+    
+    def gather(self):
+        "Like agather, but runs the event loop to get the result. For use outside of async code."
+        import asyncio
+        return asyncio.run(self.agather())
 
 class Mapping(Iterable):
     
+    __slots__ = ()
+    
     def __getattr__(self, name):
         "Support JavaScript like dict item access via attribute access"
         if name in self.chain:
@@ -692,48 +1596,360 @@ class Mapping(Iterable):
         "Calls function(**self), but allows to add args and set defaults for kwargs."
         return function(*args, **dict(kwargs, **self))
 
-class Set(Iterable): pass
+class Set(Iterable):
+    __slots__ = ()
+
+# re only caches 512 patterns, one liners matching against many patterns would keep recompiling them
+PATTERN_CACHE_SIZE = 4096
+compiled_patterns = dict()
+
+def compiled_pattern(pattern, flags=0):
+    "re.compile(pattern, flags), but cached for the last PATTERN_CACHE_SIZE patterns"
+    key = (type(pattern), pattern, flags)
+    if key not in compiled_patterns:
+        import re
+        if len(compiled_patterns) >= PATTERN_CACHE_SIZE:
+            compiled_patterns.pop(next(iter(compiled_patterns)), None)
+        compiled_patterns[key] = re.compile(pattern, flags)
+    return compiled_patterns[key]
+
+# how many positional arguments the re functions take between the pattern and the flags
+regex_flags_index = dict(search=1, match=1, fullmatch=1, split=2, findall=1, finditer=1, sub=3, subn=3)
+
+def regex_function(name):
+    """Like re.<name>, but through compiled_pattern().
+    
+    This also means that re is only imported on first use, as it is a big part of the time it takes to import fluent."""
+    flags_index = regex_flags_index[name]
+    def function(pattern, *args, flags=0, **kwargs):
+        if len(args) > flags_index:
+            args, flags = args[:flags_index] + args[flags_index + 1:], args[flags_index]
+        return getattr(compiled_pattern(pattern, flags), name)(*args, **kwargs)
+    function.__name__ = function.__qualname__ = name
+    return function
 
 # REFACT consider to inherit from Iterable? It's how Python works...
 class Text(Wrapper):
     "Supports most of the regex methods as if they where native str methods"
     
+    __slots__ = ()
+    
     # Regex Methods ......................................
     
-    search = wrapped_forward(re.search)
-    match = wrapped_forward(re.match)
-    fullmatch = wrapped_forward(re.match)
-    split = wrapped_forward(re.split)
-    findall = wrapped_forward(re.findall)
+    search = wrapped_forward(regex_function('search'))
+    match = wrapped_forward(regex_function('match'))
+    fullmatch = wrapped_forward(regex_function('fullmatch'))
+    split = wrapped_forward(regex_function('split'))
+    findall = wrapped_forward(regex_function('findall'))
     # REFACT consider ifind and find in the spirit of the collection methods?
-    finditer = wrapped_forward(re.finditer)
-    sub = wrapped_forward(re.sub, self_index=2)
-    subn = wrapped_forward(re.subn, self_index=2)
+    finditer = wrapped_forward(regex_function('finditer'))
+    sub = wrapped_forward(regex_function('sub'), self_index=2)
+    subn = wrapped_forward(regex_function('subn'), self_index=2)
+
+class Bytes(Iterable):
+    """Supports the regex methods of Text on bytes, bytearray, memoryview and mmap objects.
+    
+    The regex engine works directly on the buffer, so nothing but the matches is copied.
+    Use mapped_file() to search through files without reading them into memory first.
+    """
+    
+    __slots__ = ()
+    
+    search = wrapped_forward(regex_function('search'))
+    match = wrapped_forward(regex_function('match'))
+    fullmatch = wrapped_forward(regex_function('fullmatch'))
+    split = wrapped_forward(regex_function('split'))
+    findall = wrapped_forward(regex_function('findall'))
+    finditer = wrapped_forward(regex_function('finditer'))
+    sub = wrapped_forward(regex_function('sub'), self_index=2)
+    subn = wrapped_forward(regex_function('subn'), self_index=2)
+
+def mapped_file(path):
+    """Maps the file at path read only into memory and returns it wrapped as Bytes.
+    
+    >>> _.mapped_file('huge.log').finditer(rb'ERROR: (.*)').map(_.each.call.group(1))
+    
+    The operating system pages the file in as the search progresses.
+    """
+    import os, mmap
+    with open(path, 'rb') as file:
+        if 0 == os.fstat(file.fileno()).st_size:
+            return wrap(b'') # empty files cannot be mapped
+        return wrap(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+wrap.mapped_file = mapped_file
+
+def is_vectorizable(node):
+    "Whether the _.each expression node gives the same result on a whole numpy array as element by element"
+    kind = node[0]
+    if kind == 'each':
+        return True
+    if kind == 'constant':
+        return isinstance(node[1], (int, float, complex))
+    if kind == 'binary':
+        kind, symbol, left, right = node
+        return symbol != '@' and is_vectorizable(left) and is_vectorizable(right)
+    if kind == 'unary':
+        kind, format, inner = node
+        return format != '(not %s)' and is_vectorizable(inner)
+    return False
+
+def numpy_view(an_array):
+    """(numpy, one dimensional numpy array sharing the memory of an_array) or None.
+    
+    numpy is only used if it was imported anyway."""
+    import sys
+    numpy = sys.modules.get('numpy')
+    if numpy is None:
+        return None
+    if isinstance(an_array, numpy.ndarray):
+        return (numpy, an_array) if an_array.ndim == 1 else None
+    if an_array.typecode == 'u': # array.array of unicode characters
+        return None
+    return numpy, numpy.frombuffer(an_array, dtype=an_array.typecode)
+
+def vectorized(numpy, function):
+    "function as something that works on a whole numpy array at once, or None"
+    if isinstance(function, numpy.ufunc) and function.nin == 1 and function.nout == 1:
+        return function
+    if isinstance(function, Each) and is_vectorizable(function._expression):
+        return function.unwrap
+    return None
+
+def array_like(an_array, numpy_array):
+    "numpy_array as the same kind of array as an_array, or as a tuple if array.array can't hold its type"
+    import array
+    if not isinstance(an_array, array.array):
+        return numpy_array
+    if numpy_array.dtype.char in array.typecodes and numpy_array.dtype.char != 'u':
+        return array.array(numpy_array.dtype.char, numpy_array.tobytes())
+    return tuple(numpy_array.tolist())
+
+def array_sum(an_array, start=0):
+    numpy_and_view = numpy_view(an_array)
+    if numpy_and_view is None:
+        return sum(an_array, start)
+    numpy, view = numpy_and_view
+    # like the sum of the Python floats, else float32 arrays would be summed in float32
+    total = view.sum(dtype=numpy.float64) if view.dtype.kind == 'f' else view.sum()
+    return start + (total if isinstance(an_array, numpy.ndarray) else total.item())
+
+def apply_vectorized(an_array, function):
+    "(view, function(view)) if function could be applied to the whole of an_array with the same shape, else None"
+    numpy_and_view = numpy_view(an_array)
+    if numpy_and_view is None:
+        return None
+    numpy, view = numpy_and_view
+    vectorized_function = vectorized(numpy, function)
+    if vectorized_function is None:
+        return None
+    try:
+        result = vectorized_function(view)
+    except Exception:
+        return None # the element wise version reports (or handles) it
+    if not isinstance(result, numpy.ndarray) or result.shape != view.shape:
+        return None
+    return view, result
+
+def array_map(an_array, function):
+    view_and_result = apply_vectorized(an_array, function)
+    if view_and_result is not None:
+        view, result = view_and_result
+        import array
+        if isinstance(an_array, array.array): # a tuple with and without numpy
+            return tuple(result.tolist())
+        return result
+    return tuple(map(native(function), an_array))
+
+def array_filter(an_array, function):
+    view_and_mask = apply_vectorized(an_array, function)
+    if view_and_mask is not None:
+        view, mask = view_and_mask
+        return array_like(an_array, view[mask.astype(bool, copy=False)])
+    import array
+    if isinstance(an_array, array.array): # filtering can't change the type of the elements
+        return array.array(an_array.typecode, filter(native(function), an_array))
+    return tuple(filter(native(function), an_array))
+
+def array_sorted(an_array, key=None, reverse=False):
+    if key is None:
+        numpy_and_view = numpy_view(an_array)
+        if numpy_and_view is not None:
+            numpy, view = numpy_and_view
+            result = numpy.sort(view)
+            return array_like(an_array, result[::-1] if reverse else result)
+        import array
+        if isinstance(an_array, array.array):
+            return array.array(an_array.typecode, sorted(an_array, reverse=reverse))
+    return tuple(sorted(an_array, key=native(key), reverse=reverse))
+
+class Array(Iterable):
+    """array.array and numpy arrays, where sum, map, filter and sorted work on the whole array at once.
+    
+    >>> _(numpy.arange(1000000)).map(_.each * 2).filter(_.each % 3 == 0).sum()
+    
+    _.each expressions built from operators and single argument numpy ufuncs run as one numpy 
+    operation and return arrays of the same kind. numpy is used for array.array too, if it was 
+    imported anyway, with the same result types as without numpy: map returns a tuple, 
+    filter and sorted an array.array and sum adds floats in float64. Everything else, including the lazy i-versions of these methods, works 
+    element by element just like on any Iterable. Vectorized arithmetic follows the rules of 
+    numpy, e.g. fixed size integers wrap around on overflow.
+    """
+    
+    __slots__ = ()
+    
+    sum = wrapped(array_sum)
+    map = wrapped(array_map)
+    filter = wrapped(array_filter)
+    sorted = wrapped(array_sorted)
+
+# _.each expressions are kept as a tree of tuples and compiled into one flat lambda.
+# Nodes: ('each',), ('constant', value), ('attribute', node, name), ('item', node, key_node), 
+# ('call', function_node, argument_nodes, keyword_argument_nodes), ('binary', symbol, left_node, right_node), 
+# ('unary', format, node), ('function', function, argument_nodes)
+
+binary_operators = {
+    '__add__': '+', '__sub__': '-', '__mul__': '*', '__matmul__': '@', '__truediv__': '/', 
+    '__floordiv__': '//', '__mod__': '%', '__pow__': '**', '__lshift__': '<<', '__rshift__': '>>', 
+    '__and__': '&', '__or__': '|', '__xor__': '^', 
+    '__lt__': '<', '__le__': '<=', '__eq__': '==', '__ne__': '!=', '__gt__': '>', '__ge__': '>=',
+}
+unary_operators = {
+    '__neg__': '(-%s)', '__pos__': '(+%s)', '__invert__': '(~%s)', '__inv__': '(~%s)', 
+    '__abs__': 'abs(%s)', '__not__': '(not %s)',
+}
+
+def as_node(value):
+    "Each expressions are inlined, everything else becomes a constant"
+    if isinstance(value, Each):
+        return value._expression
+    return ('constant', value)
+
+def render_expression(node, constants):
+    "Python source for node, with all constants replaced by parameters c0, c1, … appended to constants"
+    kind = node[0]
+    if kind == 'each':
+        return 'each'
+    if kind == 'constant':
+        constants.append(node[1])
+        return 'c%d' % (len(constants) - 1)
+    if kind == 'attribute':
+        import keyword
+        kind, inner, name = node
+        if name.isidentifier() and not keyword.iskeyword(name):
+            return '%s.%s' % (render_expression(inner, constants), name)
+        return 'getattr(%s, %s)' % (render_expression(inner, constants), render_expression(('constant', name), constants))
+    if kind == 'item':
+        kind, inner, key = node
+        return '%s[%s]' % (render_expression(inner, constants), render_expression(key, constants))
+    if kind == 'call':
+        kind, function, arguments, keyword_arguments = node
+        rendered_arguments = [render_expression(argument, constants) for argument in arguments]
+        if keyword_arguments:
+            rendered_arguments.append('**{%s}' % ', '.join('%r: %s' % (name, render_expression(value, constants)) 
+                for name, value in keyword_arguments.items()))
+        return '%s(%s)' % (render_expression(function, constants), ', '.join(rendered_arguments))
+    if kind == 'binary':
+        kind, symbol, left, right = node
+        return '(%s %s %s)' % (render_expression(left, constants), symbol, render_expression(right, constants))
+    if kind == 'unary':
+        kind, format, inner = node
+        return format % render_expression(inner, constants)
+    if kind == 'function':
+        kind, function, arguments = node
+        return render_expression(('call', ('constant', function), arguments, {}), constants)
+    raise AssertionError('Unknown expression %r' % (node,))
+
+# source -> function that takes the constants and returns the compiled lambda, for the last 
+# PATTERN_CACHE_SIZE sources, so generated expressions don't keep the cache growing
+compiled_expressions = dict()
+
+def compile_expression(node):
+    """Compiles an expression tree into a plain lambda taking one argument.
+    
+    Constants are bound as closure variables, so expressions that only differ 
+    in their constants share the compiled code."""
+    constants = []
+    source = render_expression(node, constants)
+    if source not in compiled_expressions:
+        import builtins
+        parameters = ', '.join('c%d' % index for index in range(len(constants)))
+        if len(compiled_expressions) >= PATTERN_CACHE_SIZE:
+            compiled_expressions.pop(next(iter(compiled_expressions)), None)
+        compiled_expressions[source] = eval('lambda %s: lambda each: %s' % (parameters, source), dict(__builtins__=builtins))
+    return compiled_expressions[source](*constants)
 
 def make_operator(name):
     __op__ = getattr(operator, name)
+    # in place operators become their normal version, as expressions are immutable
+    normal_name = name.replace('__i', '__', 1) if name not in ('__index__', '__invert__', '__inv__') else name
+    
     @functools.wraps(__op__)
     def wrapper(self, *others):
-        return wrap(__op__).curry(wrap, *others)
+        if normal_name in binary_operators and len(others) == 1:
+            return Each.from_expression(('binary', binary_operators[normal_name], self._expression, as_node(others[0])))
+        if name in unary_operators and not others:
+            return Each.from_expression(('unary', unary_operators[name], self._expression))
+        return Each.from_expression(('function', __op__, (self._expression, *map(as_node, others))))
+    return wrapper
+
+def make_reflected_operator(name):
+    symbol = binary_operators[name]
+    def wrapper(self, other):
+        return Each.from_expression(('binary', symbol, as_node(other), self._expression))
+    wrapper.__name__ = name.replace('__', '__r', 1)
     return wrapper
 
 class Each(Wrapper):
+    """Builds expressions from everything done to `_.each` and compiles them into a plain function.
+    
+    >>> _.each.price * _.each.quantity # works like lambda each: each.price * each.quantity
+    
+    Attribute and item accesses, operators and method calls via `.call.method_name(…)` can be combined 
+    freely, and other `_.each` expressions can be used as operands or arguments. Calling the expression 
+    returns the plain result. Collection methods like map use the compiled function directly, so they 
+    run about as fast as with a hand written lambda.
+    
+    This is no Callable, so names like curry, compose or memoize build attribute accesses too.
+    """
+    
+    __slots__ = ('_expression',)
+    
+    def __init__(self, wrapped, *, previous, chain, expression=('each',)):
+        super().__init__(wrapped, previous=previous, chain=chain)
+        self._expression = expression
+    
+    @classmethod
+    def from_expression(cls, expression):
+        return cls(compile_expression(expression), previous=None, chain=None, expression=expression)
+    
+    def __call__(self, *args, **kwargs):
+        return self.unwrap(*args, **kwargs)
+    
+    def __repr__(self):
+        return 'fluent.each(lambda each: %s)' % render_expression(self._expression, [])
+    __str__ = __repr__
     
     for name in dir(operator):
-        if not name.startswith('__'):
-            continue
-        locals()[name] = make_operator(name)
+        if name.startswith('__') and callable(getattr(operator, name)) \
+                and name not in ('__call__', '__getitem__', '__contains__'):
+            locals()[name] = make_operator(name)
+        if name in binary_operators and name not in ('__lt__', '__le__', '__eq__', '__ne__', '__gt__', '__ge__'):
+            reflected_name = name.replace('__', '__r', 1)
+            locals()[reflected_name] = make_reflected_operator(name)
+    del name
     
-    @wrapped
     def __getattr__(self, name):
-        return operator.attrgetter(name)
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name) # protocol lookups, e.g. by functools.wraps or copy
+        return Each.from_expression(('attribute', self._expression, name))
     
-    @wrapped
     def __getitem__(self, index):
-        return operator.itemgetter(index)
+        return Each.from_expression(('item', self._expression, as_node(index)))
     
     @property
     def call(self):
+        expression = self._expression
         class MethodCallerConstructor(object):
             
             _method_name = None
@@ -745,379 +1961,359 @@ class Each(Wrapper):
             def __call__(self, *args, **kwargs):
                 assert self._method_name is not None, \
                     'Need to access the method to call first! E.g. _.each.call.method_name(arg1, kwarg="arg2")'
-                return wrap(operator.methodcaller(self._method_name, *args, **kwargs))
+                return Each.from_expression(('call', ('attribute', expression, self._method_name), 
+                    tuple(map(as_node, args)), { name: as_node(value) for name, value in kwargs.items() }))
         
         return MethodCallerConstructor()
-    
-each_marker = object()
-wrap.each = Each(each_marker, previous=None, chain=None)
-
-import unittest
-from pyexpect import expect
-import pytest
 
-class FluentTest(unittest.TestCase): pass
+wrap.each = Each.from_expression(('each',))
 
-class WrapperTest(FluentTest):
+class Stage(object):
+    "What a Profile records about one method called on a wrapper, or one step of a lazy pipeline"
     
-    def test_should_not_wrap_a_wrapper_again(self):
-        wrapped = _(4)
-        expect(type(_(wrapped).unwrap)) == int
+    __slots__ = ('name', 'lazy', 'seconds', 'allocated_bytes', 'elements_in', 'elements_out', 'source')
     
-    def test_should_provide_usefull_str_and_repr_output(self):
-        expect(repr(_('foo'))) == "fluent.wrap('foo')"
-        expect(str(_('foo'))) == "fluent.wrap(foo)"
+    def __init__(self, name, lazy=False):
+        self.name = name
+        self.lazy = lazy
+        self.seconds = 0.
+        self.allocated_bytes = 0
+        self.elements_in = None
+        self.elements_out = None
+        self.source = None # the Stage whose output is the input of this one, if that is known
+    
+    def input_length(self):
+        if self.source is not None:
+            return self.source.elements_out
+        return self.elements_in
+
+def is_plain_iterator(an_object):
+    "Whether an_object is a generator or a builtin / itertools iterator, i.e. has no interface beyond __next__"
+    return hasattr(type(an_object), '__next__') and type(an_object).__module__ in ('builtins', 'itertools')
+
+class ProfiledIterator(object):
+    "Counts the elements pulled from iterator and measures the time (and memory) spent pulling them"
     
-    def test_should_wrap_callables(self):
-        counter = [0]
-        def foo(): counter[0] += 1
-        expect(_(foo)).is_instance(Wrapper)
-        _(foo)()
-        expect(counter[0]) == 1
+    __slots__ = ('_iterator', '_stage', '_profile')
     
-    def test_should_wrap_attribute_accesses(self):
-        class Foo(): bar = 'baz'
-        expect(_(Foo()).bar).is_instance(Wrapper)
+    def __init__(self, iterator, stage, profile):
+        self._iterator = iterator
+        self._stage = stage
+        self._profile = profile
+        stage.elements_out = 0
     
-    def test_should_wrap_item_accesses(self):
-        expect(_(dict(foo='bar'))['foo']).is_instance(Wrapper)
+    def __iter__(self):
+        return self
     
-    def test_should_error_when_accessing_missing_attribute(self):
-        class Foo(): pass
-        expect(lambda: _(Foo().missing)).to_raise(AttributeError)
+    def __next__(self):
+        element = self._profile._timed(self._stage, self._iterator.__next__)
+        self._stage.elements_out += 1
+        return element
+
+class Profile(object):
+    """Records every method called on a wrapper, with time, element counts and allocated memory.
     
-    def test_should_explictly_unwrap(self):
-        foo = 1
-        expect(_(foo).unwrap).is_(foo)
+    >>> with _.profiled():
+    >>>     _(range(1000)).imap(str).filter(_.each.endswith('7')).len()
     
-    def test_should_wrap_according_to_returned_type(self):
-        expect(_('foo')).is_instance(Text)
-        expect(_([])).is_instance(Iterable)
-        expect(_(iter([]))).is_instance(Iterable)
-        expect(_({})).is_instance(Mapping)
-        expect(_({1})).is_instance(Set)
-        
-        expect(_(lambda: None)).is_instance(Callable)
-        class CallMe(object):
-            def __call__(self): pass
-        expect(_(CallMe())).is_instance(Callable)
-        
-        expect(_(object())).is_instance(Wrapper)
-    
-    def test_should_remember_call_chain(self):
-        def foo(): return 'bar'
-        expect(_(foo)().unwrap) == 'bar'
-        expect(_(foo)().previous.unwrap) == foo
-    
-    def test_should_delegate_equality_test_to_wrapped_instance(self):
-        # REFACT makes these tests much nicer - but probably has to go to make this library less virus like
-        expect(_(1)) == 1
-        expect(_('42')) == '42'
-        callme = lambda: None
-        expect(_(callme)) == callme
-    
-    def test_hasattr_getattr_setattr_delattr(self):
-        expect(_((1,2)).hasattr('len'))
-        expect(_('foo').getattr('__len__')()) == 3
-        class Attr(object):
-            def __init__(self): self.foo = 'bar'
-        expect(_(Attr()).setattr('foo', 'baz').foo) == 'baz'
-        
-        expect(_(Attr()).delattr('foo').unwrap) == None
-        expect(_(Attr()).delattr('foo').chain).isinstance(Attr)
-        expect(_(Attr()).delattr('foo').vars()) == {}
-    
-    def test_isinstance_issubclass(self):
-        expect(_('foo').isinstance(str)) == True
-        expect(_('foo').isinstance(int)) == False
-        expect(_(str).issubclass(object)) == True
-        expect(_(str).issubclass(str)) == True
-        expect(_(str).issubclass(int)) == False
-    
-    def test_dir_vars(self):
-        expect(_(object()).dir()).contains('__class__', '__init__', '__eq__')
-        class Foo(object): pass
-        foo = Foo()
-        foo.bar = 'baz'
-        expect(_(foo).vars()) == {'bar': 'baz'}
-
-class CallableTest(FluentTest):
-    
-    def test_call(self):
-        expect(_(lambda: 3)()) == 3
-        expect(_(lambda *x: x)(1,2,3)) == (1,2,3)
-        expect(_(lambda x=3: x)()) == 3
-        expect(_(lambda x=3: x)(x=4)) == 4
-        expect(_(lambda x=3: x)(4)) == 4
-    
-    def test_star_call(self):
-        expect(wrap([1,2,3]).star_call(str.format, '{} - {} : {}')) == '1 - 2 : 3'
-    
-    def test_should_call_callable_with_wrapped_as_first_argument(self):
-        expect(_([1,2,3]).call(min)) == 1
-        expect(_([1,2,3]).call(min)) == 1
-        expect(_('foo').call(str.upper)) == 'FOO'
-        expect(_('foo').call(str.upper)) == 'FOO'
-    
-    def test_tee_breakout_a_function_with_side_effects_and_disregard_return_value(self):
-        side_effect = {}
-        def observer(a_list): side_effect['tee'] = a_list.join('-')
-        expect(_([1,2,3]).tee(observer)) == [1,2,3]
-        expect(side_effect['tee']) == '1-2-3'
-        
-        def fnording(ignored): return 'fnord'
-        expect(_([1,2,3]).tee(fnording)) == [1,2,3]
+    prints a report of all stages to stderr at the end of the with block. Times and allocated bytes are 
+    exclusive, i.e. they don't include what was spent in other stages, e.g. pulling elements from the 
+    lazy i-methods before (which are measured as they are pulled). Methods called from within a method 
+    count for the outer one. Allocated bytes are only measured with memory=True, which traces all 
+    allocations via tracemalloc and is therefore much slower. Not thread safe.
+    """
     
-    def test_curry(self):
-        expect(_(lambda x, y: x*y).curry(2, 3)()) == 6
-        expect(_(lambda x=1, y=2: x*y).curry(x=3)()) == 6
+    def __init__(self, memory=False, file=None):
+        self.memory = memory
+        self.file = file
+        self.stages = []
+        self._depth = 0
+        self._nested = [0., 0] # seconds and bytes spent in stages below the one currently measured
+        self._previous_profile = None
+    
+    def __enter__(self):
+        global active_profile
+        if self.memory:
+            import tracemalloc
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+        self._previous_profile, active_profile = active_profile, self
+        return self
     
-    def test_auto_currying(self):
-        expect(_(lambda x: x + 3)(_)(3)) == 6
-        expect(_(lambda x, y: x + y)(_, 'foo')('bar')) == 'barfoo'
-        expect(_(lambda x, y: x + y)('foo', _)('bar')) == 'foobar'
+    def __exit__(self, exception_type, exception, traceback):
+        global active_profile
+        active_profile = self._previous_profile
+        if self.memory and self._started_tracing:
+            import tracemalloc
+            tracemalloc.stop()
+        if self.file is not None:
+            print(self.report(), file=self.file)
+    
+    def _allocated(self):
+        if not self.memory:
+            return 0
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[0]
+    
+    def _timed(self, stage, function):
+        "function(), with the time and memory it took, but not what nested stages took, added to stage"
+        import time
+        outer_nested, self._nested = self._nested, [0., 0]
+        start_seconds, start_bytes = time.perf_counter(), self._allocated()
+        try:
+            return function()
+        finally:
+            seconds, allocated_bytes = time.perf_counter() - start_seconds, self._allocated() - start_bytes
+            stage.seconds += seconds - self._nested[0]
+            stage.allocated_bytes += allocated_bytes - self._nested[1]
+            outer_nested[0] += seconds
+            outer_nested[1] += allocated_bytes
+            self._nested = outer_nested
+    
+    def measure(self, name, target, args, function):
+        """function() as a stage called name, operating on target with the arguments args.
         
-    def test_curry_should_support_placeholders_to_curry_later_positional_arguments(self):
-        expect(_(operator.add).curry(_, 'foo')('bar')) == 'barfoo'
-        expect(_(lambda x, y, z: x + y + z).curry(_, 'baz', _)('foo', 'bar')) == 'foobazbar'
-        # expect(_(operator.add).curry(_2, _1)('foo', 'bar')) == 'barfoo'
-    
-    def test_compose_cast_wraps_chain(self):
-        expect(_(lambda x: x*2).compose(lambda x: x+3)(5)) == 13
-        expect(_(str.strip).compose(str.capitalize)('  fnord  ')) == 'Fnord'
-
-class SmallTalkLikeBehaviour(FluentTest):
-    
-    def test_should_pretend_methods_that_return_None_returned_self(self):
-        expect(_([3,2,1]).sort().unwrap) == None
-        expect(_([3,2,1]).sort().previous.previous) == [1,2,3]
-        expect(_([3,2,1]).sort().chain) == [1,2,3]
-        expect(_([2,3,1]).sort().sort(reverse=True).unwrap) == None
-        expect(_([2,3,1]).sort().sort(reverse=True).previous.previous.previous.previous) == [3,2,1]
-        expect(_([2,3,1]).sort().sort(reverse=True).chain) == [3,2,1]
-    
-    def test_should_chain_off_of_previous_if_our_functions_return_none(self):
-        class Attr(object):
-            foo = 'bar'
-        expect(_(Attr()).setattr('foo', 'baz').foo) == 'baz'
-    
-    # TODO check individually that the different forms of wrapping behave according to the SmallTalk contract
-    # wrapped
-    # unwrapped
-    # wrapped_forward
-
-class IterableTest(FluentTest):
-    
-    def test_should_call_callable_with_star_splat_of_self(self):
-        expect(_([1,2,3]).star_call(lambda x, y, z: z-x-y)) == 0
-    
-    def test_join(self):
-        expect(_(['1','2','3']).join(' ')) == '1 2 3'
-        expect(_([1,2,3]).join(' ')) == '1 2 3'
-    
-    def test_any(self):
-        expect(_((True, False)).any()) == True
-        expect(_((False, False)).any()) == False
-    
-    def test_all(self):
-        expect(_((True, False)).all()) == False
-        expect(_((True, True)).all()) == True
-    
-    def test_len(self):
-        expect(_((1,2,3)).len()) == 3
-    
-    def test_min_max_sum(self):
-        expect(_([1,2]).min()) == 1
-        expect(_([1,2]).max()) == 2
-        expect(_((1,2,3)).sum()) == 6
-    
-    def test_map(self):
-        expect(_([1,2,3]).imap(lambda x: x * x).call(list)) == [1, 4, 9]
-        expect(_([1,2,3]).map(lambda x: x * x)) == (1, 4, 9)
-    
-    def test_starmap(self):
-        expect(_([(1,2), (3,4)]).istarmap(lambda x, y: x+y).call(list)) == [3, 7]
-        expect(_([(1,2), (3,4)]).starmap(lambda x, y: x+y)) == (3, 7)
-    
-    def test_filter(self):
-        expect(_([1,2,3]).ifilter(lambda x: x > 1).call(list)) == [2,3]
-        expect(_([1,2,3]).filter(lambda x: x > 1)) == (2,3)
-    
-    def test_zip(self):
-        expect(_((1,2)).izip((3,4)).call(tuple)) == ((1, 3), (2, 4))
-        expect(_((1,2)).izip((3,4), (5,6)).call(tuple)) == ((1, 3, 5), (2, 4, 6))
+        Returns the result of function. Plain iterators, like the results of the lazy i-methods, are 
+        wrapped to measure them as they are pulled. Others, e.g. files, are returned as is, as they 
+        have more interface than a ProfiledIterator could offer."""
+        if self._depth > 0:
+            return function()
         
-        expect(_((1,2)).zip((3,4))) == ((1, 3), (2, 4))
-        expect(_((1,2)).zip((3,4), (5,6))) == ((1, 3, 5), (2, 4, 6))
-    
-    def test_reduce(self):
-        # no iterator version of reduce as it's not a mapping
-        expect(_((1,2)).reduce(operator.add)) == 3
-    
-    def test_grouped(self):
-        expect(_((1,2,3,4,5,6)).igrouped(2).call(list)) == [(1,2), (3,4), (5,6)]
-        expect(_((1,2,3,4,5,6)).grouped(2)) == ((1,2), (3,4), (5,6))
-        expect(_((1,2,3,4,5)).grouped(2)) == ((1,2), (3,4))
-    
-    def test_group_by(self):
-        actual = {}
-        for key, values in _((1,1,2,2,3,3)).igroupby():
-            actual[key] = tuple(values)
+        stage = Stage(name + '(%s)' % ', '.join(map(describe_argument, args)))
+        self._add_source(stage, target)
+        self._depth += 1
+        try:
+            result = self._timed(stage, function)
+        finally:
+            self._depth -= 1
+        self.stages.append(stage)
         
-        expect(actual) == {
-            1: (1,1),
-            2: (2,2),
-            3: (3,3)
-        }
-        
-        actual = {}
-        for key, values in _((1,1,2,2,3,3)).groupby():
-            actual[key] = tuple(values)
-        
-        expect(actual) == {
-            1: (1,1),
-            2: (2,2),
-            3: (3,3)
-        }
-    
-    def test_tee_should_not_break_iterators(self):
-        # This should work because the extend as well als the .call(list) 
-        # should not exhaust the iterator created by .imap()
-        recorder = []
-        def record(generator): recorder.extend(generator)
-        expect(_([1,2,3]).imap(lambda x: x*x).tee(record).call(list)) == [1,4,9]
-        expect(recorder) == [1,4,9]
-    
-    def test_enumerate(self):
-        expect(_(('foo', 'bar')).ienumerate().call(list)) == [(0, 'foo'), (1, 'bar')]
-        expect(_(('foo', 'bar')).enumerate()) == ((0, 'foo'), (1, 'bar'))
-    
-    def test_reversed_sorted(self):
-        expect(_([2,1,3]).ireversed().call(list)) == [3,1,2]
-        expect(_([2,1,3]).reversed()) == (3,1,2)
-        expect(_([2,1,3]).isorted().call(list)) == [1,2,3]
-        expect(_([2,1,3]).sorted()) == (1,2,3)
-        expect(_([2,1,3]).isorted(reverse=True).call(list)) == [3,2,1]
-        expect(_([2,1,3]).sorted(reverse=True)) == (3,2,1)
-    
-    def test_flatten(self):
-        expect(_([(1,2),[3,4],(5, [6,7])]).iflatten().call(list)) == \
-            [1,2,3,4,5,6,7]
-        expect(_([(1,2),[3,4],(5, [6,7])]).flatten()) == \
-            (1,2,3,4,5,6,7)
-        
-        expect(_([(1,2),[3,4],(5, [6,7])]).flatten(level=1)) == \
-            (1,2,3,4,5,[6,7])
+        if is_plain_iterator(result):
+            stage.lazy = True
+            return ProfiledIterator(result, stage, self)
+        if isinstance(result, collections.abc.Sized) and not isinstance(result, (str, bytes)):
+            stage.elements_out = len(result)
+        return result
+    
+    def measure_lazy_steps(self, source, steps):
+        "Iterator over the result of the steps of a Lazy, with every step measured on its own"
+        iterator = iter(source)
+        source_stage = Stage('lazy()', lazy=True)
+        self._add_source(source_stage, source)
+        self.stages.append(source_stage)
+        iterator = ProfiledIterator(iterator, source_stage, self)
+        for kind, function in steps:
+            if kind == 'map':
+                iterator, name = map(function, iterator), 'map(%s)' % describe_argument(function)
+            elif kind == 'filter':
+                iterator, name = filter(function, iterator), 'filter(%s)' % describe_argument(function)
+            else:
+                iterator, name = function(iterator), kind + '()'
+            stage = Stage('.' + name, lazy=True)
+            stage.source = self.stages[-1]
+            self.stages.append(stage)
+            iterator = ProfiledIterator(iter(iterator), stage, self)
+        return iterator
+    
+    def _add_source(self, stage, target):
+        if isinstance(target, ProfiledIterator):
+            stage.source = target._stage
+        elif isinstance(target, collections.abc.Sized) and not isinstance(target, (str, bytes)):
+            stage.elements_in = len(target)
+    
+    def report(self):
+        "One line per stage, in the order they were called"
+        lines = ['%-3s %-40s %10s %10s %10s' % ('', 'stage', 'ms', 'in', 'out') 
+            + (' %12s' % 'allocated' if self.memory else '')]
+        for index, stage in enumerate(self.stages, start=1):
+            line = '%-3s %-40s %10.3f %10s %10s' % (index, shortened(stage.name, 40), stage.seconds * 1000, 
+                '' if stage.input_length() is None else stage.input_length(), 
+                '' if stage.elements_out is None else stage.elements_out)
+            if self.memory:
+                line += ' %10.1f kB' % (stage.allocated_bytes / 1000)
+            lines.append(line)
+        return '\n'.join(lines)
+
+def describe_argument(argument):
+    "Short description of an argument to a stage for Profile.report"
+    if isinstance(argument, Each):
+        return render_expression(argument._expression, [])
+    if isinstance(argument, Wrapper):
+        argument = argument.unwrap
+    if callable(argument) and hasattr(argument, '__name__'):
+        return 'lambda' if argument.__name__ == '<lambda>' else argument.__name__
+    return shortened(repr(argument), 30)
+
+def shortened(text, length):
+    return text if len(text) <= length else text[:length - 1] + '…'
+
+def profiled(memory=False, file=None):
+    """Profile the fluent methods called in a with block, see Profile.
+    
+    The report is printed to file, which defaults to stderr."""
+    if file is None:
+        import sys
+        file = sys.stderr
+    return Profile(memory=memory, file=file)
 
-class MappingTest(FluentTest):
-    
-    def test_should_call_callable_with_double_star_splat_as_keyword_arguments(self):
-        def foo(*, foo): return foo
-        expect(_(dict(foo='bar')).star_call(foo)) == 'bar'
-        expect(_(dict(foo='baz')).star_call(foo, foo='bar')) == 'baz'
-        expect(_(dict()).star_call(foo, foo='bar')) == 'bar'
-    
-    def test_should_support_attribute_access_to_mapping_items(self):
-        expect(_(dict(foo='bar')).foo) == 'bar'
+wrap.profiled = profiled
 
-class StrTest(FluentTest):
+class BoundedMemory(object):
+    """Within the with block, long chains only keep a constant number of intermediate results alive.
     
-    def test_search(self):
-        expect(_('foo bar baz').search(r'b.r').span()) == (4,7)
+    Every wrapper usually references the wrapper it was created from as `.previous`, so the last 
+    wrapper of a chain keeps all intermediate results alive - with the immediate methods these are 
+    complete tuples of the data. Within the block wrappers don't keep `.previous`, except for 
+    Callables, which need it to chain off of methods returning None. So `.previous` is None 
+    for wrappers created in the block.
     
-    def test_match_fullmatch(self):
-        expect(_('foo bar').match(r'foo\s').span()) == (0, 4)
-        expect(_('foo bar').fullmatch(r'foo\sbar').span()) == (0, 7)
+    >>> with _.bounded_memory():
+    >>>     _(huge).map(parse).filter(is_valid).sorted(key=…)
     
-    def test_split(self):
-        expect(_('foo\nbar\nbaz').split(r'\n')) == ['foo', 'bar', 'baz']
-        expect(_('foo\nbar/baz').split(r'[\n/]')) == ['foo', 'bar', 'baz']
-    
-    def test_findall_finditer(self):
-        expect(_("bazfoobar").findall('ba[rz]')) == ['baz', 'bar']
-        expect(_("bazfoobar").finditer('ba[rz]').map(_.each.call.span())) == ((0,3), (6,9))
-    
-    def test_sub_subn(self):
-        expect(_('bazfoobar').sub(r'ba.', 'foo')) == 'foofoofoo'
-        expect(_('bazfoobar').sub(r'ba.', 'foo', 1)) == 'foofoobar'
-        expect(_('bazfoobar').sub(r'ba.', 'foo', count=1)) == 'foofoobar'
-
-class ImporterTest(FluentTest):
-    
-    def test_import_top_level_module(self):
-        import sys
-        expect(lib.sys) == sys
+    This only applies to the current thread or asyncio task. `fluent.retain_previous.set(False)` bounds
+    the memory there for good.
+    """
     
-    def test_import_symbol_from_top_level_module(self):
-        import sys
-        expect(lib.sys.stdin) == sys.stdin
+    def __enter__(self):
+        self._token = retain_previous.set(False)
+        return self
     
-    def test_import_submodule_that_is_also_a_symbol_in_the_parent_module(self):
+    def __exit__(self, exception_type, exception, traceback):
+        retain_previous.reset(self._token)
+
+wrap.bounded_memory = BoundedMemory
+
+USAGE = """Usage: python -m fluent [options] 'some code that can access fluent functions without having to import them'
+   or: python -m fluent [options] --lines 'expression using lines'
+
+With --lines, stdin is read lazily and `lines` is a lazy iterable of its lines (without the line endings).
+Every element of the result of the expression is written to stdout as one line, as soon as it is computed.
+None results (e.g. from print) are skipped.
+
+Options:
+  -l, --lines       stream stdin as described above
+  -p, --preimport   import the modules the code accesses via lib.… on a background thread right away
+  --import-times    report to stderr how long each import done via lib took
+  --profile         report to stderr how long each method called on a wrapper took, see fluent.Profile"""
+OPTIONS = ('-l', '--lines', '-p', '--preimport', '--import-times', '--profile')
+
+STREAM_BUFFER_SIZE = 1 << 20
+
+def input_lines(file, buffer_size=STREAM_BUFFER_SIZE, before_read=None):
+    """Lazily yields the lines of file without their line endings, reading in large chunks.
+    
+    Every read returns whatever input is available, so the first lines are yielded 
+    without waiting for a full buffer. before_read is called before every read that might 
+    have to wait for more input, which is a good moment to flush buffered output."""
+    import io
+    import codecs
+    binary = io.open(file.fileno(), 'rb', buffering=0, closefd=False)
+    # universal newlines, like text mode sys.stdin, even if a \r\n is split between two reads
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(file.encoding)(file.errors), translate=True)
+    incomplete_line = ''
+    while True:
+        if before_read is not None:
+            before_read()
+        chunk = binary.read(buffer_size)
+        lines = (incomplete_line + decoder.decode(chunk, final=not chunk)).split('\n')
+        incomplete_line = lines.pop()
+        yield from lines
+        if not chunk:
+            break
+    if incomplete_line:
+        yield incomplete_line
+
+def buffered_output(file, buffer_size=STREAM_BUFFER_SIZE):
+    "Text file writing to the same file descriptor as file with a large buffer, line buffered on terminals"
+    import io
+    return io.TextIOWrapper(io.open(file.fileno(), 'wb', buffering=buffer_size, closefd=False),
+        encoding=file.encoding, errors=file.errors, line_buffering=file.isatty())
+
+def output_lines(result, output):
+    "Writes every element of result as a line to output"
+    if isinstance(result, Wrapper):
+        result = result.chain
+    if isinstance(result, (str, bytes)) or not isinstance(result, collections.abc.Iterable):
+        result = (result,)
+    
+    for element in result:
+        if isinstance(element, Wrapper):
+            element = element.chain
+        if element is not None:
+            output.write(str(element))
+            output.write('\n')
+    output.flush()
+
+def referenced_lib_paths(code):
+    "Dotted paths accessed as lib.… in code, e.g. ('xml.sax.saxutils.unescape',) for a call to lib.xml.sax.saxutils.unescape(…)"
+    import re
+    paths = (re.sub(r'\s', '', path)[1:] for path in re.findall(r'\blib((?:\s*\.\s*[^\W\d]\w*)+)', code))
+    return tuple(dict.fromkeys(paths))
+
+def preimport(code):
+    """Resolve the modules code accesses via lib on a daemon thread.
+    
+    The imports then overlap with compiling the code and waiting for input. Resolution stops at the
+    first attribute that is not a module, so no other code is triggered. Errors are left for the code
+    itself to report. Returns the thread.
+    """
+    import threading
+    def resolve():
+        for path in referenced_lib_paths(code):
+            resolved = lib
+            for name in path.split('.'):
+                if not isinstance(resolved, Module):
+                    break
+                try:
+                    resolved = getattr(resolved, name)
+                except Exception:
+                    break
+    thread = threading.Thread(target=resolve, name='fluent preimport', daemon=True)
+    thread.start()
+    return thread
+
+def import_report():
+    "Human readable version of lib.import_times()."
+    return '\n'.join('%8.2f ms  %s' % (seconds * 1000, path) for path, seconds in lib.import_times().unwrap.items())
+
+def main(arguments):
+    import sys
+    options, code = arguments[1:-1], arguments[-1] if len(arguments) >= 2 else None
+    assert code is not None and all(option in OPTIONS for option in options), USAGE
+    
+    if '-p' in options or '--preimport' in options:
+        preimport(code)
+    try:
+        if '--profile' in options:
+            with profiled():
+                run(code, options)
+        else:
+            run(code, options)
+    finally:
+        if '--import-times' in options:
+            print(import_report(), file=sys.stderr)
+
+def run(code, options):
+    if '-l' in options or '--lines' in options:
+        run_lines(code)
+    else:
+        exec(code, dict(wrap=wrap, _=_, lib=lib))
+
+def run_lines(code):
+    import sys
+    output = buffered_output(sys.stdout)
+    def flush():
+        sys.stdout.flush() # for print()
+        output.flush()
+    lines = wrap(input_lines(sys.stdin, before_read=flush)).lazy()
+    try:
+        output_lines(eval(code, dict(wrap=wrap, _=_, lib=lib, lines=lines)), output)
+    except BrokenPipeError:
+        # the reader is gone (e.g. | head), don't let python complain when flushing stdout on exit
         import os
-        expect(lib.os.name) == os.name
-        expect(lib.os.path.join) == os.path.join
-    
-    def test_import_submodule_that_is_not_a_symbol_in_the_parent_module(self):
-        import dbm
-        expect(lambda: dbm.dumb).to_raise(AttributeError)
-        
-        def delayed_import():
-            import dbm.dumb
-            return dbm.dumb
-        expect(lib.dbm.dumb) == delayed_import()
-    
-    def test_imported_objects_are_pre_wrapped(self):
-        lib.os.path.join('/foo', 'bar', 'baz').findall(r'/(\w*)') == ['foo', 'bar', 'baz']
-
-class EachTest(FluentTest):
-    
-    def test_should_produce_attrgetter_on_attribute_access(self):
-        class Foo(object):
-            bar = 'baz'
-        expect(_([Foo(), Foo()]).map(_.each.bar)) == ('baz', 'baz')
-    
-    def test_should_produce_itemgetter_on_item_access(self):
-        expect(_([['foo'], ['bar']]).map(_.each[0])) == ('foo', 'bar')
-    
-    def test_should_produce_callable_on_binary_operator(self):
-        expect(_(['foo', 'bar']).map(_.each == 'foo')) == (True, False)
-        expect(_([3, 5]).map(_.each + 3)) == (6, 8)
-        expect(_([3, 5]).map(_.each < 4)) == (True, False)
-    
-    def test_should_produce_callable_on_unary_operator(self):
-        expect(_([3, 5]).map(- _.each)) == (-3, -5)
-        expect(_([3, 5]).map(~ _.each)) == (-4, -6)
-    
-    def test_should_produce_methodcaller_on_call_attribute(self):
-        # problem: _.each.call is now not an attrgetter
-        # _.each.method.call('foo') # like a method chaining
-        # _.each_call.method('foo')
-        # _.eachcall.method('foo')
-        class Tested(object):
-            def method(self, arg): return 'method+'+arg
-        expect(_(Tested()).call(_.each.call.method('argument'))) == 'method+argument'
-        expect(lambda: _.each.call('argument')).to_raise(AssertionError, '_.each.call.method_name')
-
-class IntegrationTest(FluentTest):
-    
-    def test_extrac_and_decode_URIs(self):
-        from xml.sax.saxutils import unescape
-        line = '''<td><img src='/sitefiles/star_5.png' height='15' width='75' alt=''></td>
-            <td><input style='width:200px; outline:none; border-style:solid; border-width:1px; border-color:#ccc;' type='text' id='ydxerpxkpcfqjaybcssw' readonly='readonly' onClick="select_text('ydxerpxkpcfqjaybcssw');" value='http://list.iblocklist.com/?list=ydxerpxkpcfqjaybcssw&amp;fileformat=p2p&amp;archiveformat=gz'></td>'''
-
-        actual = _(line).findall(r'value=\'(.*)\'').imap(unescape).call(list)
-        expect(actual) == ['http://list.iblocklist.com/?list=ydxerpxkpcfqjaybcssw&fileformat=p2p&archiveformat=gz']
-    
-    def test_call_module_from_shell(self):
-        from subprocess import check_output
-        output = check_output(
-            ['python', '-m', 'fluent', "lib.sys.stdin.read().split('\\n').imap(str.upper).imap(print).call(list)"],
-            input=b'foo\nbar\nbaz')
-        expect(output) == b'FOO\nBAR\nBAZ\n'
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
 
 if __name__ == '__main__':
     import sys
-    assert len(sys.argv) == 2, \
-        "Usage: python -m fluent 'some code that can access fluent functions without having to import them'"
-    
-    exec(sys.argv[1], dict(wrap=wrap, _=_, lib=lib))
+    main(sys.argv)
@@ -2,14 +2,57 @@
 # coding: utf-8
 
 from pyexpect import expect
+import os
+import sys
+import csv
+import json
+import tempfile
+import math
+import bisect
+import random
+import struct
 import itertools
-from operator import attrgetter
+import collections
+import concurrent.futures
+from array import array
+import operator
+from operator import attrgetter, itemgetter, mul
 from fluent import *
 
 def assert_almost_sums_to_one(probabilities):
     epsilon = .00000001
     assert abs(1 - sum(probabilities)) < epsilon, 'Probability tables need to sum to (almost) 1'
+
+def assert_rows_almost_sum_to_one(probabilities, row_length):
+    "Like assert_almost_sums_to_one, but for all rows of a flat table at once"
+    epsilon = .00000001
+    rows = (probabilities[start:start + row_length] for start in range(0, len(probabilities), row_length))
+    assert all(abs(1 - row_sum) < epsilon for row_sum in map(math.fsum, rows)), \
+        'Probability tables need to sum to (almost) 1'
+
+def assert_full_product_of_labels(references, dependencies):
+    """Checks that references contain every combination of the labels of dependencies exactly once.
+    
+    Counting is enough for that, the cross product is only built for the error message."""
+    is_full_product = len(set(map(frozenset, references))) == len(references) \
+        == math.prod(len(dependency._labels.unwrap) for dependency in dependencies) \
+        and all(len(keys) == len(set(map(attrgetter('table'), keys))) == len(dependencies) for keys in references)
+    if is_full_product:
+        return
+    
+    cross_product_of_dependencies_keys = _(dependencies) \
+        .imap(attrgetter('_labels')) \
+        .star_call(itertools.product) \
+        .imap(frozenset) \
+        .call(set)
     
+    assert _(references).map(frozenset).call(set) == cross_product_of_dependencies_keys, \
+        "References to other tables need to be a full product of their labels. Expected %r, \nbut got %r" \
+        % (set(references), cross_product_of_dependencies_keys)
+    
+def assert_all_floats(probabilities):
+    assert all(map(isinstance, probabilities, itertools.repeat(float))), 'Need all probabilities to be floats'
+
 class Reference(object):
     
     def __init__(self, name, table):
@@ -32,7 +75,11 @@ class Distribution(object):
         return cls(tuple(kwargs.keys()), kwargs, dependencies=())
     
     @classmethod
-    def dependent(cls, labels, dependent_values):
+    def dependent(cls, labels, dependent_values, validate=True):
+        """Table with one row of probabilities per combination of the labels of other tables.
+        
+        Use validate=False to skip checking the rows and references for large tables, and call 
+        validate() (or validate() on the network) later."""
         references = tuple(dependent_values.keys())
         probability_rows = tuple(dependent_values.values())
         
@@ -48,45 +95,65 @@ class Distribution(object):
             .imap(lambda x: x.table) \
             .call(set).call(tuple)
         
+        if validate:
+            assert_rows_almost_sum_to_one(tuple(itertools.chain.from_iterable(probability_rows)), len(probability_rows[0]))
+            assert_full_product_of_labels(references, tuple(dependencies))
+        
         values = dict()
         for keys, probabilities in zip(references, probability_rows):
-            assert_almost_sums_to_one(probabilities)
             for self_key, value in zip(labels, probabilities):
                 values[keys + (self_key, )] = value
         
-        cross_product_of_dependencies_keys = _(dependencies) \
-            .imap(attrgetter('_labels')) \
-            .star_call(itertools.product) \
-            .imap(frozenset) \
-            .call(set)
-        
-        assert _(references).map(frozenset).call(set) == cross_product_of_dependencies_keys, \
-            "References to other tables need to be a full product of their labels. Expected %r, \nbut got %r" \
-            % (set(references), cross_product_of_dependencies_keys)
-        
-        return cls(labels, values, dependencies=tuple(dependencies))
+        return cls(labels, values, dependencies=tuple(dependencies), validate=validate)
     
-    def __init__(self, labels, values, dependencies):
+    def __init__(self, labels, values, dependencies, validate=True):
         self._network = None # to be set by network
         self._name = None # to be set by network
         # self._labels = [] # set in _set_references
         self._set_references(labels)
         self._dependencies = dependencies
-        self._values = dict()
-        
-        assert _(values.values()).map(lambda x: isinstance(x, float)).all(), 'Need all probabilities to be floats'
+        # the probabilities as array('d') aligned with _layout(), see _compiled()
+        self._probabilities = None
+        self._storages = dict() # storage -> converted probabilities, see _stored()
+        self._table_strides = None # see _strides()
+        # only kept until validate(), which needs the keys to report what is missing
         self._values = { self._normalize_keys(key): value for key, value in values.items() }
+        
+        if validate:
+            assert_all_floats(self._values.values())
+            self._compiled()
+            self._values = None
+    
+    def validate(self):
+        "Runs the checks skipped by constructing with validate=False, with the same error messages"
+        if self._values is not None:
+            assert_all_floats(self._values.values())
+            self._assert_complete()
+        assert_rows_almost_sum_to_one(self._compiled(), len(self._labels.unwrap))
+        self._values = None
+        return self
+    
+    def _assert_complete(self):
+        "Checks that there is a value for every key of _layout(), while the values are still kept"
+        references = tuple(frozenset(filter(lambda key: key.table != self, keys)) for keys in self._values)
+        assert_full_product_of_labels(tuple(set(references)), self._dependencies)
+        assert len(references) == len(self._layout()), 'Need the same number of probabilites for each row'
     
     def _set_references(self, labels):
         self._labels = _(labels).map(lambda key: Reference(key, self))
-        for reference in self._labels:
+        for position, reference in enumerate(self._labels):
+            reference.position = position
             setattr(self, reference.name, reference)
     
     # REFACT consider to ignore all keys which do not apply
     def __getitem__(self, key_or_keys):
+        """The probability as declared.
+        
+        This doesn't depend on the storage of a network, as Distributions are shared by all instances 
+        of a network class. The network methods compute with the probabilities as stored."""
         keys = self._normalize_keys(key_or_keys)
         self._assert_keys_are_sufficient(keys)
-        return self._values[keys]
+        return self._compiled()[self._index_of(keys)]
     
     def _normalize_keys(self, key_or_keys):
         keys = (key_or_keys,) if isinstance(key_or_keys, (str, Reference)) else key_or_keys
@@ -96,25 +163,117 @@ class Distribution(object):
         return frozenset(map(to_reference, keys))
     
     def _assert_keys_are_sufficient(self, keys):
-        assert len(tuple(self._values.keys())[0]) == len(keys), 'Need the full set of keys to get a probability'
+        assert len(self._dependencies) + 1 == len(keys), 'Need the full set of keys to get a probability'
         assert any(filter(lambda x: x.table == self, keys)), 'Does not contain key to self'
     
     def __repr__(self):
-        display_values = ', '.join(['%r: %s' % (set(key), value) for key, value in self._values.items()])
+        display_values = ', '.join(['%r: %s' % (set(key), value) for key, value in zip(self._layout(), self._compiled())])
         name = self._name if self._name is not None else 'Distribution'
         return '%s(%s)' % (name, display_values)
     __str__ = __repr__
     
     def _suitable_subset_of(self, keys):
         return filter(lambda key: key.table == self or key.table in self._dependencies, keys)
+    
+    def _layout(self):
+        "All keys of this table in canonical order: one row per combination of dependency labels, one column per own label"
+        rows = itertools.product(*map(attrgetter('_labels'), self._dependencies))
+        return tuple(frozenset((*row, label)) for row in rows for label in self._labels)
+    
+    def _index_of(self, keys):
+        "Position of the full set of keys in _layout()"
+        strides = self._strides()
+        index, tables = 0, set()
+        for key in keys:
+            stride = strides.get(key.table)
+            assert stride is not None, 'Need the full set of keys to get a probability'
+            index += key.position * stride
+            tables.add(key.table)
+        assert len(tables) == len(strides), 'Need the full set of keys to get a probability'
+        return index
+    
+    def _strides(self):
+        "{ table: how far apart in _layout() the labels of table are }, row major like _layout()"
+        if self._table_strides is None:
+            self._table_strides, stride = dict(), 1
+            for table in (self, *reversed(self._dependencies)):
+                self._table_strides[table] = stride
+                stride *= len(table._labels.unwrap)
+        return self._table_strides
+    
+    def _compiled(self):
+        "The probabilities of this table as a flat array('d'), aligned with _layout()"
+        if self._probabilities is None:
+            if not all(map(self._values.__contains__, self._layout())):
+                self._assert_complete() # unvalidated tables report what is missing like validate()
+            self._probabilities = array('d', map(self._values.__getitem__, self._layout()))
+        return self._probabilities
+    
+    def _stored(self, storage):
+        """The probabilities as a network with storage keeps them (see BayesianNetwork), aligned with _layout().
+        
+        Float32 and log probabilities are converted once, and shared by all networks with that storage. 
+        They are kept next to the array('d'), which __getitem__ and float64 networks still need."""
+        if storage == 'float64':
+            return self._compiled()
+        if storage == 'float32' and storage not in self._storages:
+            self._storages[storage] = array('f', self._compiled())
+        if storage == 'log' and storage not in self._storages:
+            self._storages[storage] = array('d', map(_log, self._compiled()))
+        return self._storages[storage]
+
+def _log(probability):
+    return math.log(probability) if probability > 0 else -math.inf
+
+def log_sum_exp(log_probabilities):
+    "log(sum(map(exp, log_probabilities))) without underflowing"
+    log_probabilities = tuple(log_probabilities)
+    maximum = max(log_probabilities, default=-math.inf)
+    if maximum == -math.inf:
+        return maximum
+    return maximum + math.log(math.fsum(math.exp(log_probability - maximum) for log_probability in log_probabilities))
 
 class BayesianNetwork(object):
+    """Network of Distributions, declared in the class body.
+    
+    `storage` selects how each network instance keeps its factors: 'float64' as array('d'), 'float32' 
+    as array('f'), which computes in single precision, or 'log' as log probabilities, where products 
+    become sums and marginalization uses log-sum-exp, so long chains of small probabilities do not underflow.
     
-    def __init__(self):
+    Distributions are shared by all instances of a network class and keep their probabilities as 
+    one array, which float64 networks use directly. The float32 and log tables are converted once per 
+    Distribution, on first use, so creating a network copies no tables, see Distribution._stored. 
+    As the Distributions keep their float64 values, float32 storage doesn't save memory.
+    """
+    
+    STORAGES = ('float64', 'float32', 'log')
+    
+    def __init__(self, storage='float64'):
+        assert storage in self.STORAGES, 'Need storage to be one of %s, got %r' % (', '.join(self.STORAGES), storage)
+        self._storage = storage
+        self._factors = dict() # see _factors_of()
         for name, table in self._tables().items():
             table._network = self
             table._name = name
     
+    def _factors_of(self, table):
+        """The entries of table as stored, aligned with its _layout().
+        
+        Looked up on first use, so a network of unvalidated Distributions can be built and validate()d."""
+        if table not in self._factors:
+            self._factors[table] = table._stored(self._storage)
+        return self._factors[table]
+    
+    def _factor(self, table, atomic_event):
+        "Entry of table for the suitable subset of atomic_event, as stored (i.e. a log probability in log storage)"
+        return self._factors_of(table)[table._index_of(table._suitable_subset_of(keys=atomic_event))]
+    
+    def _probability(self, table, index):
+        "Entry index of table as stored, but as a probability in every storage"
+        if self._storage == 'log':
+            return math.exp(self._factors_of(table)[index])
+        return self._factors_of(table)[index]
+    
     def _tables(self):
         # would be a desaster if Distribution's are added after construction - but that is currently
         # prevented by design
@@ -126,26 +285,196 @@ class BayesianNetwork(object):
         return self.__tables
     
     def probability_of_event(self, *atomic_event):
+        if self._storage == 'log':
+            return math.exp(self.log_probability_of_event(*atomic_event))
+        
         probability = 1
         # REFACT rename table -> distributions
         for table in self._tables().values():
-            probability *= table[table._suitable_subset_of(keys=atomic_event)]
+            probability *= self._factor(table, atomic_event)
         return probability
     
-    # REFACT not sure this is the right name for this?
-    def joint_probability(self, *givens): # REFACT rename events -> givens
-        probability = 0
+    def log_probability_of_event(self, *atomic_event):
+        if self._storage != 'log':
+            return _log(self.probability_of_event(*atomic_event))
+        
+        return math.fsum(self._factor(table, atomic_event) for table in self._tables().values())
+    
+    def _atomic_events(self, givens):
         by_table = self._events_by_table(self._sure_event()) # REFACT rename _sure_event -> _all_events
         for event in givens:
             by_table[event.table] = [event]
         # dict(intelligence = [intelligence.low], difficulty=$alle, ...)
-        for atomic_event in itertools.product(*by_table.values()):
+        return itertools.product(*by_table.values())
+    
+    # REFACT not sure this is the right name for this?
+    def joint_probability(self, *givens): # REFACT rename events -> givens
+        if self._storage == 'log':
+            return math.exp(self.log_joint_probability(*givens))
+        
+        probability = 0
+        for atomic_event in self._atomic_events(givens):
             probability += self.probability_of_event(*atomic_event)
         return probability
     
+    def log_joint_probability(self, *givens):
+        if self._storage != 'log':
+            return _log(self.joint_probability(*givens))
+        
+        return log_sum_exp(self.log_probability_of_event(*atomic_event) for atomic_event in self._atomic_events(givens))
+    
     def conditional_probability(self, *events, given):
+        if self._storage == 'log':
+            return math.exp(self.log_joint_probability(*events, *given) - self.log_joint_probability(*given))
+        
         return self.joint_probability(*events, *given) / self.joint_probability(*given)
     
+    def sensitivities(self, *events, given=()):
+        """Partial derivatives of the probability of a query with respect to every entry of every Distribution.
+        
+        The query is conditional_probability(*events, given=given) or, without givens, joint_probability(*events).
+        
+        All derivatives come out of one pass over the joint distribution. Every atomic event contributes 
+        a product of one entry per table, and the derivative of that product with respect to each entry is 
+        the product of all the others. Prefix and suffix products give those without dividing by zero entries.
+        
+        Returns { name: array('d') } with one array per Distribution, aligned with its _layout().
+        """
+        tables = tuple(self._tables().values())
+        gradient_of_given = { table: array('d', bytes(8 * len(table._layout()))) for table in tables }
+        gradient_of_joint = { table: array('d', bytes(8 * len(table._layout()))) for table in tables }
+        probability_of_given = probability_of_joint = 0
+        
+        for atomic_event in self._atomic_events(given):
+            indices = tuple(table._index_of(table._suitable_subset_of(keys=atomic_event)) for table in tables)
+            factors = tuple(map(self._probability, tables, indices))
+            
+            prefixes = tuple(itertools.accumulate(factors[:-1], mul, initial=1))
+            suffixes = tuple(itertools.accumulate(reversed(factors[1:]), mul, initial=1))[::-1]
+            probability = prefixes[-1] * factors[-1]
+            is_joint = all(event in atomic_event for event in events)
+            
+            probability_of_given += probability
+            if is_joint:
+                probability_of_joint += probability
+            for table, index, prefix, suffix in zip(tables, indices, prefixes, suffixes):
+                gradient_of_given[table][index] += prefix * suffix
+                if is_joint:
+                    gradient_of_joint[table][index] += prefix * suffix
+        
+        if not given:
+            return { table._name: gradient_of_joint[table] for table in tables }
+        
+        # quotient rule for P(events, given) / P(given)
+        return {
+            table._name: array('d', (
+                (joint * probability_of_given - probability_of_joint * given_) / probability_of_given ** 2
+                for joint, given_ in zip(gradient_of_joint[table], gradient_of_given[table])
+            ))
+            for table in tables
+        }
+    
+    def validate(self):
+        "Validates all Distributions, see Distribution.validate()"
+        for table in self._tables().values():
+            table.validate()
+        return self
+    
+    def _topological_order(self):
+        ordered = []
+        remaining = list(self._tables().values())
+        while remaining:
+            ready = [table for table in remaining if all(dependency in ordered for dependency in table._dependencies)]
+            assert ready, 'Dependencies between Distributions need to be acyclic'
+            ordered.extend(ready)
+            remaining = [table for table in remaining if table not in ready]
+        return tuple(ordered)
+    
+    def _sampling_plan(self):
+        """Everything needed to sample, in topological order and free of references to the network.
+        
+        This is what is sent to worker processes. Per Distribution: 
+        (name, labels, column indices of the dependencies, their strides into the rows, cumulative weights per row)
+        """
+        order = self._topological_order()
+        plan = []
+        for table in order:
+            labels = tuple(map(attrgetter('name'), table._labels))
+            label_counts = tuple(len(dependency._labels.unwrap) for dependency in table._dependencies)
+            strides = tuple(math.prod(label_counts[index + 1:]) for index in range(len(label_counts)))
+            probabilities = table._compiled()
+            rows = tuple(
+                tuple(itertools.accumulate(probabilities[start:start + len(labels)]))
+                for start in range(0, len(probabilities), len(labels))
+            )
+            columns = tuple(map(order.index, table._dependencies))
+            plan.append((table._name, labels, columns, strides, rows))
+        return tuple(plan)
+    
+    def sample(self, number_of_rows, *, chunk_size=10000, seed=None, processes=1):
+        """Ancestral sampling, yields chunks of at most chunk_size rows.
+        
+        Every chunk is a tuple of array('H') columns of label indices, in the order of 
+        _sampling_plan(). Each chunk gets its own random generator derived from seed, so 
+        the result is the same for any number of processes.
+        
+        Chunks are drawn one column (i.e. Distribution) at a time, with chained builtin iterators 
+        instead of numpy, which this module doesn't depend on.
+        """
+        assert chunk_size >= 1, 'chunk_size has to be positive'
+        if seed is None:
+            seed = random.randrange(sys.maxsize)
+        plan = self._sampling_plan()
+        chunk_sizes = itertools.chain(
+            itertools.repeat(chunk_size, number_of_rows // chunk_size),
+            filter(None, (number_of_rows % chunk_size,))
+        )
+        arguments = ((plan, seed, chunk_index, size) for chunk_index, size in enumerate(chunk_sizes))
+        
+        if processes == 1:
+            yield from itertools.starmap(_sample_chunk, arguments)
+            return
+        
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            # bounded, so only a few chunks are in memory at a time
+            pending = collections.deque()
+            for argument in arguments:
+                pending.append(executor.submit(_sample_chunk, *argument))
+                if len(pending) >= 2 * (processes or os.cpu_count()):
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    
+    def write_samples(self, path, number_of_rows, *, format='csv', **sample_options):
+        """Stream samples to a file, one chunk at a time. 
+        
+        format='csv' writes the label names with a header row, format='columnar' writes 
+        the binary format read by read_columnar_samples(). Takes the same options as sample().
+        """
+        assert format in ('csv', 'columnar'), 'Need format to be csv or columnar, got %r' % format
+        plan = self._sampling_plan()
+        chunks = self.sample(number_of_rows, **sample_options)
+        
+        if format == 'csv':
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(map(itemgetter(0), plan))
+                for columns in chunks:
+                    named_columns = (map(labels.__getitem__, column) for (_name, labels, *_rest), column in zip(plan, columns))
+                    writer.writerows(zip(*named_columns))
+            return
+        
+        with open(path, 'wb') as file:
+            header = json.dumps(dict(
+                columns=[(name, labels) for name, labels, *_rest in plan],
+                typecode='H', byteorder=sys.byteorder,
+            )).encode()
+            file.write(COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header)
+            for columns in chunks:
+                file.write(struct.pack('<I', len(columns[0])))
+                for column in columns:
+                    column.tofile(file)
+    
     def _sure_event(self):
         return _(self._tables().values()).map(attrgetter('_labels')).flatten().call(set)
     
@@ -158,6 +487,421 @@ class BayesianNetwork(object):
             by_table[table] = events
         return by_table
 
+def _sample_chunk(plan, seed, chunk_index, size):
+    random_generator = random.Random('%s/%s' % (seed, chunk_index))
+    columns = []
+    for name, labels, dependency_columns, strides, rows in plan:
+        row_indices = itertools.repeat(0, size)
+        for column, stride in zip(dependency_columns, strides):
+            row_indices = map(operator.add, row_indices, map(stride.__mul__, columns[column]))
+        cumulative_weights = tuple(map(rows.__getitem__, row_indices))
+        draws = map(mul, iter(random_generator.random, None), map(itemgetter(-1), cumulative_weights))
+        columns.append(array('H', map(bisect.bisect, cumulative_weights, draws)))
+    return tuple(columns)
+
+COLUMNAR_MAGIC = b'BNSAMPLE'
+
+def read_columnar_samples(path):
+    """Reads what BayesianNetwork.write_samples(format='columnar') wrote, one chunk at a time.
+    
+    Yields (names, labels, columns) per chunk, where columns are arrays of label indices."""
+    with open(path, 'rb') as file:
+        assert file.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC, 'Not a columnar samples file'
+        header_length, = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(header_length))
+        names, labels = zip(*header['columns'])
+        while True:
+            row_count_bytes = file.read(4)
+            if not row_count_bytes:
+                return
+            row_count, = struct.unpack('<I', row_count_bytes)
+            columns = []
+            for _name in names:
+                column = array(header['typecode'])
+                column.fromfile(file, row_count)
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                columns.append(column)
+            yield names, labels, tuple(columns)
+
+class DynamicBayesianNetwork(BayesianNetwork):
+    """Two slice temporal network.
+    
+    The Distributions in the class body describe the first (prior) time slice. `_transitions` maps 
+    the names of some of them to Distributions with the same labels, whose dependencies are read as 
+    references to the previous time slice. All other Distributions are reused unchanged in every slice.
+    
+    Belief states are only kept over the interface, i.e. the Distributions the next slice depends on,
+    so the memory needed per time slice stays constant.
+    """
+    
+    _transitions = dict()
+    
+    def __init__(self, storage='float64'):
+        super().__init__(storage=storage)
+        tables = self._tables()
+        for name, transition in self._transitions.items():
+            assert name in tables, 'Transitions need to refer to a Distribution of the prior slice, got %r' % name
+            assert tuple(map(attrgetter('name'), transition._labels)) \
+                == tuple(map(attrgetter('name'), tables[name]._labels)), \
+                'Transition for %r needs the same labels as its prior' % name
+            transition._network = self
+            transition._name = "%s'" % name
+    
+    def _interface(self):
+        return _(self._transitions.values()) \
+            .imap(attrgetter('_dependencies')) \
+            .iflatten() \
+            .call(set).unwrap
+    
+    def _probability_of_slice(self, atomic_event, previous_state):
+        if previous_state is None:
+            return self.probability_of_event(*atomic_event)
+        
+        probability = 1
+        for name, table in self._tables().items():
+            if name not in self._transitions:
+                probability *= self._probability(table, table._index_of(table._suitable_subset_of(keys=atomic_event)))
+                continue
+            
+            transition = self._transitions[name]
+            own_event, = filter(lambda event: event.table == table, atomic_event)
+            keys = (getattr(transition, own_event.name), *transition._suitable_subset_of(keys=previous_state))
+            probability *= self._probability(transition, transition._index_of(keys))
+        return probability
+    
+    def _transition_kernel(self, evidence, previous_belief):
+        """Weights of all interface states of the next slice, for every interface state of the previous one.
+        
+        Returns { previous_state: { state: weight } }, where previous_state is None for the prior slice."""
+        interface = self._interface()
+        
+        kernel = dict()
+        for previous_state in (previous_belief or (None,)):
+            weights = kernel[previous_state] = collections.defaultdict(float)
+            for atomic_event in self._atomic_events(evidence):
+                state = frozenset(filter(lambda event: event.table in interface, atomic_event))
+                weights[state] += self._probability_of_slice(atomic_event, previous_state)
+        return kernel
+    
+    def _forward(self, previous_belief, kernel):
+        belief = collections.defaultdict(float)
+        for previous_state, weights in kernel.items():
+            prior = 1 if previous_state is None else previous_belief[previous_state]
+            for state, weight in weights.items():
+                belief[state] += prior * weight
+        return _normalized(belief)
+    
+    def _smoothed(self, window, index):
+        "Combine the forward message at index with the backward message from the end of the window"
+        backward = dict.fromkeys(window[-1][0], 1)
+        for _belief, kernel in reversed(tuple(window)[index + 1:]):
+            backward = {
+                previous_state: sum(weight * backward[state] for state, weight in weights.items())
+                for previous_state, weights in kernel.items()
+            }
+        belief, _kernel = window[index]
+        return _normalized({ state: probability * backward[state] for state, probability in belief.items() })
+    
+    def filter(self, evidence_stream):
+        """Forward filtering over a stream of evidence, one tuple of events per time slice.
+        
+        Yields a BeliefState over the interface after each slice."""
+        belief = None
+        for evidence in evidence_stream:
+            belief = self._forward(belief, self._transition_kernel(evidence, belief))
+            yield BeliefState(belief)
+    
+    def fixed_lag_smoothing(self, evidence_stream, lag):
+        """Like filter, but every belief state also considers the evidence of the next `lag` slices.
+        
+        Only the last `lag` slices are kept in memory. Once the stream ends, the remaining 
+        slices are yielded with the evidence that is available."""
+        assert lag >= 0, 'Need a positive lag'
+        window = collections.deque(maxlen=lag + 1) # (belief, kernel) per slice
+        number_of_slices = 0
+        for evidence in evidence_stream:
+            previous_belief = window[-1][0] if window else None
+            kernel = self._transition_kernel(evidence, previous_belief)
+            window.append((self._forward(previous_belief, kernel), kernel))
+            number_of_slices += 1
+            if len(window) == window.maxlen:
+                yield BeliefState(self._smoothed(window, 0))
+        
+        for index in range(len(window) - min(number_of_slices, lag), len(window)):
+            yield BeliefState(self._smoothed(window, index))
+
+def _normalized(weights):
+    total = sum(weights.values())
+    assert total > 0, 'Evidence is impossible under this model'
+    return { key: weight / total for key, weight in weights.items() }
+
+class BeliefState(object):
+    "Probabilities of the interface states of one time slice. Query it like a Distribution."
+    
+    def __init__(self, probabilities):
+        self._probabilities = probabilities
+    
+    def __getitem__(self, key_or_keys):
+        keys = frozenset((key_or_keys,) if isinstance(key_or_keys, Reference) else key_or_keys)
+        interface = set(map(attrgetter('table'), next(iter(self._probabilities))))
+        assert all(key.table in interface for key in keys), 'Can only query the interface of a time slice'
+        return sum(probability for state, probability in self._probabilities.items() if keys <= state)
+    
+    def __repr__(self):
+        display_values = ', '.join(['%r: %s' % (set(state), probability) for state, probability in self._probabilities.items()])
+        return 'BeliefState(%s)' % display_values
+    __str__ = __repr__
+
+def _family_counts(columns, cardinalities, child, parents):
+    """Counts of every combination of the labels of a family, as a Counter.
+    
+    The keys are positions in the _layout() of a Distribution for child with dependencies parents (in this order)."""
+    configurations = itertools.repeat(0, len(columns[child]))
+    for parent in parents:
+        configurations = map(operator.add, map(cardinalities[parent].__mul__, configurations), columns[parent])
+    return collections.Counter(map(operator.add, map(cardinalities[child].__mul__, configurations), columns[child]))
+
+def _marginal_family_counts(counts, cardinalities, child, parents, subset):
+    """Counts of the family child, subset from the counts of the family child, parents (as _family_counts returns them).
+    
+    subset can be any part of parents, in any order. This only takes time in the number of counts, not in the number of rows."""
+    radices = (*map(cardinalities.__getitem__, parents), cardinalities[child])
+    kept = (*map(parents.index, subset), len(parents))
+    marginal = collections.Counter()
+    for key, count in counts.items():
+        digits = [0] * len(radices)
+        for index in reversed(range(len(radices))):
+            key, digits[index] = divmod(key, radices[index])
+        position = 0
+        for index in kept:
+            position = position * radices[index] + digits[index]
+        marginal[position] += count
+    return marginal
+
+def _family_score(counts, number_of_rows, cardinalities, score, equivalent_sample_size, child, parents):
+    label_count = cardinalities[child]
+    configuration_count = math.prod(cardinalities[parent] for parent in parents)
+    row_totals = collections.Counter()
+    for key, count in counts.items():
+        row_totals[key // label_count] += count
+    
+    if score == 'bic':
+        log_likelihood = math.fsum(count * math.log(count / row_totals[key // label_count]) for key, count in counts.items())
+        return log_likelihood - .5 * math.log(number_of_rows) * (label_count - 1) * configuration_count
+    
+    # bdeu, rows and entries without counts contribute nothing
+    row_prior = equivalent_sample_size / configuration_count
+    entry_prior = row_prior / label_count
+    return math.fsum(math.lgamma(row_prior) - math.lgamma(row_prior + total) for total in row_totals.values()) \
+        + math.fsum(math.lgamma(entry_prior + count) - math.lgamma(entry_prior) for count in counts.values())
+
+_worker_search_data = None
+
+def _initialize_search_worker(*search_data):
+    global _worker_search_data
+    _worker_search_data = search_data
+
+def _count_family_in_worker(family):
+    return _family_counts(*_worker_search_data, *family)
+
+class StructureSearch(object):
+    """Learns the structure and the Distributions of a BayesianNetwork from data.
+    
+    Hill climbing over single edge additions, removals and reversals, scored with BIC or BDeu.
+    With a tabu list of recently visited structures the search can also take worsening moves 
+    to escape local maxima, and returns the best structure it has seen.
+    
+    Both scores are a sum of one term per family (a variable and its dependencies), so a move 
+    changes the score by the difference of one or two family terms. The counts and scores of every 
+    family are cached, and fit() reuses the counts. A family whose dependencies are part of a counted 
+    family (e.g. after removing an edge) is marginalized from those counts, only the others are 
+    counted from the data, in parallel for each step.
+    
+    Data is kept as one array('H') of label indices per variable.
+    """
+    
+    SCORES = ('bic', 'bdeu')
+    
+    def __init__(self, names, labels, columns, *, score='bic', equivalent_sample_size=1., processes=1):
+        assert score in self.SCORES, 'Need score to be one of %s, got %r' % (', '.join(self.SCORES), score)
+        assert all(len(name) > 1 and name[0] != '_' for name in names), \
+            'Need names longer than one character that do not start with _, as BayesianNetwork ignores those'
+        self._names = tuple(names)
+        self._labels = tuple(map(tuple, labels))
+        self._columns = tuple(columns)
+        self._processes = processes
+        self._cardinalities = tuple(map(len, self._labels))
+        self._score = score
+        self._equivalent_sample_size = equivalent_sample_size
+        self._family_counts = dict() # (child, parents) -> Counter, see _family_counts()
+        self._family_scores = dict() # (child, parents) -> score
+    
+    @classmethod
+    def from_csv(cls, path, **options):
+        "Reads a file like BayesianNetwork.write_samples(format='csv') writes, with a header row of names"
+        with open(path, newline='') as file:
+            reader = csv.reader(file)
+            names = next(reader)
+            label_indices = tuple(dict() for name in names)
+            columns = tuple(array('H') for name in names)
+            for row in reader:
+                for label, indices, column in zip(row, label_indices, columns):
+                    column.append(indices.setdefault(label, len(indices)))
+        return cls(names, label_indices, columns, **options)
+    
+    @classmethod
+    def from_columnar(cls, path, **options):
+        "Reads a file written by BayesianNetwork.write_samples(format='columnar')"
+        names = labels = columns = None
+        for names, labels, chunk in read_columnar_samples(path):
+            if columns is None:
+                columns = tuple(array(column.typecode) for column in chunk)
+            for column, part in zip(columns, chunk):
+                column.extend(part)
+        return cls(names, labels, columns, **options)
+    
+    def _count_families(self, families, executor=None):
+        "Makes sure the counts of all families are cached, counting the data only for those that can't be marginalized"
+        missing = set(family for family in families if family not in self._family_counts)
+        to_count = []
+        for child, parents in missing:
+            supersets = [cached_parents for cached_child, cached_parents in self._family_counts 
+                if cached_child == child and set(parents) <= set(cached_parents)]
+            if not supersets:
+                to_count.append((child, parents))
+                continue
+            superset = min(supersets, key=lambda cached_parents: len(self._family_counts[child, cached_parents]))
+            self._family_counts[child, parents] = _marginal_family_counts(
+                self._family_counts[child, superset], self._cardinalities, child, superset, parents)
+        
+        if executor is None:
+            counts = map(lambda family: _family_counts(self._columns, self._cardinalities, *family), to_count)
+        else:
+            chunk_size = max(1, len(to_count) // (4 * (self._processes or os.cpu_count())))
+            counts = executor.map(_count_family_in_worker, to_count, chunksize=chunk_size)
+        self._family_counts.update(zip(to_count, counts))
+    
+    def _score_families(self, families, executor):
+        missing = tuple(set(family for family in families if family not in self._family_scores))
+        self._count_families(missing, executor)
+        for family in missing:
+            self._family_scores[family] = _family_score(self._family_counts[family], len(self._columns[0]), 
+                self._cardinalities, self._score, self._equivalent_sample_size, *family)
+    
+    def _moves(self, parents, max_parents):
+        "Yields every legal move as { child: new parents } for the one or two families it changes"
+        children = collections.defaultdict(set)
+        for child, dependencies in parents.items():
+            for parent in dependencies:
+                children[parent].add(child)
+        
+        def has_path(start, goal, ignored_edge=None):
+            seen, todo = set(), [start]
+            while todo:
+                node = todo.pop()
+                if node == goal:
+                    return True
+                seen.add(node)
+                todo.extend(child for child in children[node] if child not in seen and (node, child) != ignored_edge)
+            return False
+        
+        without = lambda dependencies, parent: tuple(sorted(set(dependencies) - {parent}))
+        with_ = lambda dependencies, parent: tuple(sorted(set(dependencies) | {parent}))
+        for parent, child in itertools.permutations(range(len(self._names)), 2):
+            if parent in parents[child]:
+                yield { child: without(parents[child], parent) }
+                if len(parents[parent]) < max_parents and not has_path(parent, child, ignored_edge=(parent, child)):
+                    yield { child: without(parents[child], parent), parent: with_(parents[parent], child) }
+            elif len(parents[child]) < max_parents and not has_path(child, parent):
+                yield { child: with_(parents[child], parent) }
+    
+    def search(self, *, max_parents=3, tabu_length=0, patience=10, max_iterations=1000):
+        """Returns a fitted BayesianNetwork with the best structure found.
+        
+        Without a tabu list, the search stops as soon as no move improves the score. Otherwise 
+        it stops after `patience` moves without finding a better structure."""
+        parents = { child: () for child in range(len(self._names)) }
+        self._score_families(parents.items(), executor=None)
+        score = best_score = math.fsum(self._family_scores[family] for family in parents.items())
+        best_parents = dict(parents)
+        tabu = collections.deque([tuple(parents.values())], maxlen=max(1, tabu_length))
+        moves_without_improvement = 0
+        
+        executor = None
+        if self._processes != 1:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                self._processes, initializer=_initialize_search_worker, initargs=(self._columns, self._cardinalities))
+        try:
+            for iteration in range(max_iterations):
+                moves = tuple(self._moves(parents, max_parents))
+                self._score_families(itertools.chain.from_iterable(move.items() for move in moves), executor)
+                
+                best_move = None
+                for move in moves:
+                    structure = tuple({ **parents, **move }.values())
+                    if tabu_length and structure in tabu:
+                        continue
+                    delta = math.fsum(self._family_scores[child, dependencies] - self._family_scores[child, parents[child]]
+                        for child, dependencies in move.items())
+                    if best_move is None or delta > best_move[0]:
+                        best_move = (delta, move, structure)
+                
+                if best_move is None or (best_move[0] <= 0 and not tabu_length):
+                    break
+                
+                delta, move, structure = best_move
+                parents.update(move)
+                score += delta
+                tabu.append(structure)
+                if score > best_score:
+                    best_score, best_parents = score, dict(parents)
+                    moves_without_improvement = 0
+                else:
+                    moves_without_improvement += 1
+                    if moves_without_improvement >= patience:
+                        break
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        return self.fit({ self._names[child]: tuple(map(self._names.__getitem__, dependencies))
+            for child, dependencies in best_parents.items() })
+    
+    def fit(self, dependencies, *, pseudo_count=0., name='LearnedNetwork'):
+        """BayesianNetwork with the given structure { name: (dependency names) }, estimated from the data.
+        
+        Probabilities are relative frequencies, with pseudo_count added to every count. Rows 
+        without any counts become uniform."""
+        indices = { name: index for index, name in enumerate(self._names) }
+        tables = dict()
+        while len(tables) < len(self._names):
+            ready = [child for child in self._names if child not in tables 
+                and all(dependency in tables for dependency in dependencies.get(child, ()))]
+            assert ready, 'Dependencies between Distributions need to be acyclic'
+            for child in ready:
+                parents = tuple(map(indices.__getitem__, dependencies.get(child, ())))
+                tables[child] = self._fit_table(indices[child], parents, tuple(map(tables.__getitem__, dependencies.get(child, ()))), pseudo_count)
+        return type(name, (BayesianNetwork,), tables)()
+    
+    def _fit_table(self, child, parents, parent_tables, pseudo_count):
+        self._count_families(((child, parents),))
+        counts = self._family_counts[child, parents]
+        labels = self._labels[child]
+        
+        def probabilities(row):
+            row_counts = tuple(counts[row * len(labels) + label] + pseudo_count for label in range(len(labels)))
+            total = sum(row_counts)
+            if total == 0:
+                return (1 / len(labels),) * len(labels)
+            return tuple(count / total for count in row_counts)
+        
+        if not parents:
+            return Distribution.independent(**dict(zip(labels, probabilities(0))))
+        
+        references = itertools.product(*(table._labels.unwrap for table in parent_tables))
+        return Distribution.dependent(labels, { keys: probabilities(row) for row, keys in enumerate(references) })
+
 class Student(BayesianNetwork):
     d = difficulty = Distribution.independent(easy=.6, hard=.4)
     i = intelligence = Distribution.independent(low=.7, high=.3)
@@ -181,6 +925,22 @@ class Student(BayesianNetwork):
         g.bad:  (.99,   .01),
     })
 
+class UmbrellaWorld(DynamicBayesianNetwork):
+    r = rain = Distribution.independent(yes=.5, no=.5)
+    u = umbrella = Distribution.dependent(
+                ('yes', 'no'), {
+        r.yes:  (.9,    .1),
+        r.no:   (.2,    .8),
+    })
+    
+    _transitions = dict(
+        rain = Distribution.dependent(
+                    ('yes', 'no'), {
+            r.yes:  (.7,    .3),
+            r.no:   (.3,    .7),
+        }),
+    )
+
 n = network = Student()
 
 # print(n.i)
@@ -211,6 +971,156 @@ expect(n.conditional_probability(n.l.glowing, given=(n.i.low, n.d.easy))).close_
 expect(n.conditional_probability(n.i.high, given=(n.g.good,))).close_to(.613, 1e-2)
 expect(n.conditional_probability(n.i.high, given=(n.g.good, n.d.easy))).close_to(.5625, 1e-4)
 
+gradients = n.sensitivities(n.l.glowing)
+expect(gradients['letter'][n.l._index_of((n.l.glowing, n.g.good))]).close_to(n.joint_probability(n.g.good), 1e-9)
+expect(gradients['letter'][n.l._index_of((n.l.bad, n.g.good))]) == 0
+expect(len(gradients['grade'])) == len(n.grade._layout()) == 12
+gradients = n.sensitivities(n.i.high, given=(n.g.good,))
+expect(gradients['intelligence'][n.i._index_of((n.i.high,))]).close_to(.74 * .14 / .362 ** 2, 1e-9)
+expect(max(map(abs, gradients['letter']))).close_to(0, 1e-12)
+expect(n.grade._compiled()[n.grade._index_of((n.g.ok, n.i.high, n.d.easy))]) == .08
+
+expect(n.validate()).is_(n)
+unchecked_grade = Distribution.dependent(('good', 'bad'), {
+    (n.i.low, n.d.easy): (.5, .5), (n.i.low, n.d.hard): (.5, .5), (n.i.high, n.d.easy): (.5, .6),
+}, validate=False)
+expect(lambda: unchecked_grade.validate()).to_raise(AssertionError, 'full product of their labels')
+UncheckedStudent = type('UncheckedStudent', (BayesianNetwork,), dict(
+    intelligence=Student.intelligence, difficulty=Student.difficulty, grade=unchecked_grade))
+unchecked_student = UncheckedStudent() # building a network doesn't validate, like building the tables
+expect(lambda: unchecked_student.validate()).to_raise(AssertionError, 'full product of their labels')
+expect(lambda: unchecked_student.joint_probability()).to_raise(AssertionError, 'full product of their labels')
+expect(lambda: Distribution.dependent(('good', 'bad'), {
+    (n.i.low, n.d.easy): (.5, .5), (n.i.low, n.d.hard): (.5, .5), (n.i.high, n.d.easy): (.5, .5),
+})).to_raise(AssertionError, 'full product of their labels')
+unchecked_letter = Distribution.dependent(('bad', 'glowing'), { n.i.low: (.5, .6), n.i.high: (.5, .5) }, validate=False)
+expect(lambda: unchecked_letter.validate()).to_raise(AssertionError, 'need to sum to')
+expect(lambda: Distribution.dependent(('bad', 'glowing'), { n.i.low: (.5, .6), n.i.high: (.5, .5) })) \
+    .to_raise(AssertionError, 'need to sum to')
+expect(lambda: Distribution.dependent(('bad', 'glowing'), { n.i.low: (1, 0), n.i.high: (1, 0) })) \
+    .to_raise(AssertionError, 'floats')
+
+samples = [list(map(list, columns)) for columns in n.sample(20000, chunk_size=3000, seed=42)]
+expect(samples).has_len(7)
+expect(samples[-1][0]).has_len(2000)
+plan_names = tuple(map(itemgetter(0), n._sampling_plan()))
+letters = collections.Counter(itertools.chain.from_iterable(map(itemgetter(plan_names.index('letter')), samples)))
+expect(letters[1] / 20000).close_to(.502, 1e-2)
+expect([list(map(list, columns)) for columns in n.sample(20000, chunk_size=3000, seed=42)]) == samples
+expect(lambda: next(n.sample(10, chunk_size=0))).to_raise(AssertionError, 'chunk_size')
+if __name__ == '__main__': # worker processes cannot be started while a spawned worker imports this module
+    expect([list(map(list, columns)) for columns in n.sample(20000, chunk_size=3000, seed=42, processes=2)]) == samples
+
+with tempfile.TemporaryDirectory() as directory:
+    n.write_samples(os.path.join(directory, 'samples.csv'), 5, seed=1)
+    with open(os.path.join(directory, 'samples.csv')) as file:
+        rows = list(csv.reader(file))
+    expect(rows[0]) == list(plan_names)
+    expect(rows).has_len(6)
+    expect(rows[1][plan_names.index('grade')]).is_included_in(['good', 'ok', 'bad'])
+    
+    n.write_samples(os.path.join(directory, 'samples.columnar'), 5000, format='columnar', chunk_size=3000, seed=42)
+    chunks = list(read_columnar_samples(os.path.join(directory, 'samples.columnar')))
+    expect(chunks).has_len(2)
+    expect(chunks[0][0]) == tuple(plan_names)
+    expect(list(chunks[0][2][0])) == samples[0][0]
+
+expect(Student(storage='log').joint_probability()).close_to(1, 1e-9)
+expect(Student(storage='log').conditional_probability(n.i.high, given=(n.g.good, n.d.easy))).close_to(.5625, 1e-9)
+expect(Student(storage='log').log_probability_of_event(n.i.high, n.d.easy, n.g.ok, n.l.bad, n.s.good)) \
+    .close_to(math.log(0.004608), 1e-9)
+expect(lambda: Student(storage='float16')).to_raise(AssertionError, 'storage')
+expect(Student()._factors_of(n.grade)).is_(n.grade._compiled()) # float64 networks share the tables
+expect(n.grade._values) == None # validated tables only keep the array
+expect(lambda: n.letter._index_of((n.l.glowing, n.l.bad))).to_raise(AssertionError, 'full set of keys')
+expect(lambda: n.grade._index_of((n.g.good, n.g.ok, n.i.high))).to_raise(AssertionError, 'full set of keys')
+expect(n.grade[n.g.ok, n.i.high, n.d.easy]) == .08
+stored_gradients = Student(storage='log').sensitivities(n.i.high, given=(n.g.good,))
+expect(stored_gradients['intelligence'][n.i._index_of((n.i.high,))]).close_to(.74 * .14 / .362 ** 2, 1e-9)
+expect(next(UmbrellaWorld(storage='log').filter([(UmbrellaWorld.u.yes,)]))[UmbrellaWorld.r.yes]).close_to(.818, 1e-3)
+
+def chain_network(length):
+    "Network of length Distributions, each depending on the one before"
+    tables = dict(x0=Distribution.independent(on=.01, off=.99))
+    for index in range(1, length):
+        tables['x%s' % index] = Distribution.dependent(('on', 'off'), {
+            tables['x%s' % (index - 1)].on:  (.01, .99),
+            tables['x%s' % (index - 1)].off: (.5, .5),
+        })
+    return type('Chain', (BayesianNetwork,), tables)
+
+Chain = chain_network(200)
+all_on = tuple(table.on for table in Chain()._tables().values())
+expect(Chain().probability_of_event(*all_on)) == 0 # underflow
+expect(Chain(storage='log').log_probability_of_event(*all_on)).close_to(200 * math.log(.01), 1e-9)
+
+ShortChain = chain_network(10)
+float64_chain = ShortChain()
+all_off = lambda network: tuple(table.off for table in network._tables().values())
+float64_results = (float64_chain.probability_of_event(*all_off(float64_chain)), float64_chain.x1[ShortChain.x1.on, ShortChain.x0.on])
+float32_chain = ShortChain(storage='float32')
+held_bytes = lambda network: sum(factors.itemsize * len(factors) for table in network._tables().values() 
+    for factors in (table._probabilities, *table._storages.values()) if factors is not None)
+number_of_entries = sum(len(table._layout()) for table in float64_chain._tables().values())
+expect(held_bytes(float64_chain)) == 8 * number_of_entries
+float32_chain.joint_probability() # converts all tables
+expect(held_bytes(float32_chain)) == (8 + 4) * number_of_entries # the float64 values stay, see BayesianNetwork
+expect(float32_chain._factors_of(ShortChain.x3).itemsize) == 4
+expect(float32_chain._factors_of(ShortChain.x3)).is_(ShortChain(storage='float32')._factors_of(ShortChain.x3))
+expect(float32_chain._factors_of(ShortChain.x1)[ShortChain.x1._index_of((ShortChain.x1.on, ShortChain.x0.on))]) \
+    .not_to_equal(.01) # rounded to float32
+expect(float32_chain.probability_of_event(*all_off(float32_chain))).close_to(float64_results[0], 1e-9)
+# float64 networks and the Distributions keep their values after a float32 network used them
+expect((float64_chain.probability_of_event(*all_off(float64_chain)), float64_chain.x1[ShortChain.x1.on, ShortChain.x0.on])) \
+    == float64_results
+expect(ShortChain().probability_of_event(*all_off(float64_chain))) == float64_results[0]
+expect(float32_chain.x1[ShortChain.x1.on, ShortChain.x0.on]) == .01
+expect(Student(storage='float32').grade[n.g.ok, n.i.high, n.d.easy]) == .08
+expect(n.grade[n.g.ok, n.i.high, n.d.easy]) == .08
+float64_gradients = float64_chain.sensitivities(ShortChain.x9.on, given=(ShortChain.x0.off,))
+float32_gradients = float32_chain.sensitivities(ShortChain.x9.on, given=(ShortChain.x0.off,))
+expect(max(abs(first - second) for name in float64_gradients 
+    for first, second in zip(float64_gradients[name], float32_gradients[name]))).close_to(0, 1e-6)
+
+with tempfile.TemporaryDirectory() as directory:
+    n.write_samples(os.path.join(directory, 'samples.csv'), 20000, seed=42)
+    structure_search = StructureSearch.from_csv(os.path.join(directory, 'samples.csv'))
+    learned = structure_search.search(tabu_length=10) # plain hill climbing ends in a local maximum here
+    skeleton = lambda network: { frozenset((table._name, dependency._name)) 
+        for table in network._tables().values() for dependency in table._dependencies }
+    expect(skeleton(learned)) == skeleton(n)
+    columns, cardinalities = structure_search._columns, structure_search._cardinalities
+    grade, intelligence, difficulty = map(plan_names.index, ('grade', 'intelligence', 'difficulty'))
+    expect(structure_search._family_counts).has_key((grade, tuple(sorted((intelligence, difficulty)))))
+    for parents in ((intelligence, difficulty), (difficulty, intelligence), (difficulty,), ()):
+        structure_search._count_families(((grade, parents),)) # marginalized from the cached counts above
+        expect(structure_search._family_counts[grade, parents]) == _family_counts(columns, cardinalities, grade, parents)
+    expect(learned.joint_probability(learned.letter.glowing)).close_to(.502, 2e-2)
+    expect(learned.conditional_probability(learned.intelligence.high, given=(learned.grade.good,))).close_to(.613, 3e-2)
+    expect(skeleton(StructureSearch.from_csv(os.path.join(directory, 'samples.csv'), score='bdeu').search())) \
+        == skeleton(n)
+    if __name__ == '__main__': # see above
+        expect(skeleton(StructureSearch.from_csv(os.path.join(directory, 'samples.csv'), processes=2).search(tabu_length=10))) == skeleton(n)
+    
+    n.write_samples(os.path.join(directory, 'samples.columnar'), 100, format='columnar', seed=42)
+    fitted = StructureSearch.from_columnar(os.path.join(directory, 'samples.columnar')) \
+        .fit(dict(grade=('intelligence', 'difficulty')), pseudo_count=1.)
+    expect(fitted.validate()).is_(fitted)
+
+w = weather = UmbrellaWorld()
+
+beliefs = _(w.filter([(w.u.yes,), (w.u.yes,), (w.u.no,)])).map(lambda belief: belief[w.r.yes])._
+expect(beliefs[0]).close_to(.818, 1e-3)
+expect(beliefs[1]).close_to(.883, 1e-3)
+expect(beliefs[2]).close_to(.191, 1e-3)
+
+smoothed = _(w.fixed_lag_smoothing([(w.u.yes,), (w.u.yes,)], lag=1)).map(lambda belief: belief[w.r.yes])._
+expect(len(smoothed)) == 2
+expect(smoothed[0]).close_to(.883, 1e-3)
+expect(smoothed[1]).close_to(.883, 1e-3)
+expect(next(w.filter([()]))[w.r.yes]).close_to(.5, 1e-6)
+expect(lambda: next(w.filter([()]))[w.u.yes]).to_raise(AssertionError)
+
 # print('P(d0 | g1)', conditional_probability('difficulties', ['d0'], grades=['g1']))
 # P(d0 | g1) 0.7955801104972375
 # print('P(d0 | g1, i1)', conditional_probability('difficulties', ['d0'], grades=['g1'], intelligences=['i1']))
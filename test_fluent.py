@@ -0,0 +1,1103 @@
+#!/usr/bin/env python3
+# encoding: utf8
+# license: ISC (MIT/BSD compatible) https://choosealicense.com/licenses/isc/
+
+"""Tests for fluent.py, run with `python -m pytest test_fluent.py`.
+
+They live outside of fluent.py so that importing fluent doesn't pay for unittest, pyexpect and pytest.
+"""
+
+import itertools
+import operator
+import types
+import unittest
+
+from pyexpect import expect
+
+from fluent import *
+from fluent import Wrapper, Module, Callable, Iterable, Lazy, AsyncIterable, Mapping, Set, Text, Bytes, Array, Each, \
+    wrapped, unwrapped, wrapped_forward, wrapper_by_type, WRAPPER_CACHE_SIZE, resolved_lib_paths, referenced_lib_paths, \
+    compiled_pattern, PATTERN_CACHE_SIZE, compiled_expressions, is_vectorizable, \
+    preimport, import_report, input_lines, profiled, Profile, ProfiledIterator, BoundedMemory
+
+def numpy_is_installed():
+    import importlib.util
+    return importlib.util.find_spec('numpy') is not None
+
+class FluentTest(unittest.TestCase): pass
+
+class WrapperTest(FluentTest):
+    
+    def test_should_not_wrap_a_wrapper_again(self):
+        wrapped = _(4)
+        expect(type(_(wrapped).unwrap)) == int
+    
+    def test_should_provide_usefull_str_and_repr_output(self):
+        expect(repr(_('foo'))) == "fluent.wrap('foo')"
+        expect(str(_('foo'))) == "fluent.wrap(foo)"
+    
+    def test_should_wrap_callables(self):
+        counter = [0]
+        def foo(): counter[0] += 1
+        expect(_(foo)).is_instance(Wrapper)
+        _(foo)()
+        expect(counter[0]) == 1
+    
+    def test_should_wrap_attribute_accesses(self):
+        class Foo(): bar = 'baz'
+        expect(_(Foo()).bar).is_instance(Wrapper)
+    
+    def test_should_wrap_item_accesses(self):
+        expect(_(dict(foo='bar'))['foo']).is_instance(Wrapper)
+    
+    def test_should_error_when_accessing_missing_attribute(self):
+        class Foo(): pass
+        expect(lambda: _(Foo().missing)).to_raise(AttributeError)
+    
+    def test_should_explictly_unwrap(self):
+        foo = 1
+        expect(_(foo).unwrap).is_(foo)
+    
+    def test_should_wrap_according_to_returned_type(self):
+        expect(_('foo')).is_instance(Text)
+        expect(_([])).is_instance(Iterable)
+        expect(_(iter([]))).is_instance(Iterable)
+        expect(_({})).is_instance(Mapping)
+        expect(_({1})).is_instance(Set)
+        
+        expect(_(lambda: None)).is_instance(Callable)
+        class CallMe(object):
+            def __call__(self): pass
+        expect(_(CallMe())).is_instance(Callable)
+        
+        expect(_(object())).is_instance(Wrapper)
+    
+    def test_should_cache_wrapper_class_per_type(self):
+        class Fnord(object):
+            def __iter__(self): return iter(())
+        expect(_(Fnord())).is_instance(Iterable)
+        expect(wrapper_by_type[Fnord]) == Iterable
+    
+    def test_wrapper_class_cache_should_be_bounded(self):
+        Fnord = type('Fnord', (object,), dict(__iter__=lambda self: iter(())))
+        expect(_(Fnord())).is_instance(Iterable)
+        for index in range(WRAPPER_CACHE_SIZE):
+            _(type('Generated', (object,), dict())())
+        expect(len(wrapper_by_type)) == WRAPPER_CACHE_SIZE
+        expect(wrapper_by_type).not_has_key(Fnord)
+        expect(_(Fnord())).is_instance(Iterable)
+    
+    def test_wrappers_should_not_have_instance_dicts(self):
+        for wrapper in (Wrapper, Module, Callable, Iterable, Lazy, Mapping, Set, Text, Each):
+            expect(wrapper.__dictoffset__) == 0
+    
+    def test_should_remember_call_chain(self):
+        def foo(): return 'bar'
+        expect(_(foo)().unwrap) == 'bar'
+        expect(_(foo)().previous.unwrap) == foo
+    
+    def test_should_delegate_equality_test_to_wrapped_instance(self):
+        # REFACT makes these tests much nicer - but probably has to go to make this library less virus like
+        expect(_(1)) == 1
+        expect(_('42')) == '42'
+        callme = lambda: None
+        expect(_(callme)) == callme
+    
+    def test_hasattr_getattr_setattr_delattr(self):
+        expect(_((1,2)).hasattr('len'))
+        expect(_('foo').getattr('__len__')()) == 3
+        class Attr(object):
+            def __init__(self): self.foo = 'bar'
+        expect(_(Attr()).setattr('foo', 'baz').foo) == 'baz'
+        
+        expect(_(Attr()).delattr('foo').unwrap) == None
+        expect(_(Attr()).delattr('foo').chain).isinstance(Attr)
+        expect(_(Attr()).delattr('foo').vars()) == {}
+    
+    def test_isinstance_issubclass(self):
+        expect(_('foo').isinstance(str)) == True
+        expect(_('foo').isinstance(int)) == False
+        expect(_(str).issubclass(object)) == True
+        expect(_(str).issubclass(str)) == True
+        expect(_(str).issubclass(int)) == False
+    
+    def test_dir_vars(self):
+        expect(_(object()).dir()).contains('__class__', '__init__', '__eq__')
+        class Foo(object): pass
+        foo = Foo()
+        foo.bar = 'baz'
+        expect(_(foo).vars()) == {'bar': 'baz'}
+
+class CallableTest(FluentTest):
+    
+    def test_call(self):
+        expect(_(lambda: 3)()) == 3
+        expect(_(lambda *x: x)(1,2,3)) == (1,2,3)
+        expect(_(lambda x=3: x)()) == 3
+        expect(_(lambda x=3: x)(x=4)) == 4
+        expect(_(lambda x=3: x)(4)) == 4
+    
+    def test_call_with_each_expression_should_not_curry(self):
+        expect(_(lambda function: function(3))(_.each + 1)) == 4
+        expect(_(map)(_.each * 2, [1, 2]).call(list)) == [2, 4]
+    
+    def test_call_should_not_compare_arguments_with_placeholder(self):
+        class Ambiguous(object):
+            def __eq__(self, other): raise ValueError('truth value is ambiguous')
+        ambiguous = Ambiguous()
+        expect(_(lambda argument: argument)(ambiguous).unwrap).is_(ambiguous)
+    
+    @unittest.skipUnless(numpy_is_installed(), 'needs numpy')
+    def test_call_with_numpy_array(self):
+        import numpy
+        expect(_(numpy.add)(numpy.arange(3), 1).call(list)) == [1, 2, 3]
+    
+    def test_star_call(self):
+        expect(wrap([1,2,3]).star_call(str.format, '{} - {} : {}')) == '1 - 2 : 3'
+    
+    def test_should_call_callable_with_wrapped_as_first_argument(self):
+        expect(_([1,2,3]).call(min)) == 1
+        expect(_([1,2,3]).call(min)) == 1
+        expect(_('foo').call(str.upper)) == 'FOO'
+        expect(_('foo').call(str.upper)) == 'FOO'
+    
+    def test_tee_breakout_a_function_with_side_effects_and_disregard_return_value(self):
+        side_effect = {}
+        def observer(a_list): side_effect['tee'] = a_list.join('-')
+        expect(_([1,2,3]).tee(observer)) == [1,2,3]
+        expect(side_effect['tee']) == '1-2-3'
+        
+        def fnording(ignored): return 'fnord'
+        expect(_([1,2,3]).tee(fnording)) == [1,2,3]
+    
+    def test_curry(self):
+        expect(_(lambda x, y: x*y).curry(2, 3)()) == 6
+        expect(_(lambda x=1, y=2: x*y).curry(x=3)()) == 6
+    
+    def test_auto_currying(self):
+        expect(_(lambda x: x + 3)(_)(3)) == 6
+        expect(_(lambda x, y: x + y)(_, 'foo')('bar')) == 'barfoo'
+        expect(_(lambda x, y: x + y)('foo', _)('bar')) == 'foobar'
+        
+    def test_curry_should_support_placeholders_to_curry_later_positional_arguments(self):
+        expect(_(operator.add).curry(_, 'foo')('bar')) == 'barfoo'
+        expect(_(lambda x, y, z: x + y + z).curry(_, 'baz', _)('foo', 'bar')) == 'foobazbar'
+        # expect(_(operator.add).curry(_2, _1)('foo', 'bar')) == 'barfoo'
+    
+    def test_curry_should_merge_keyword_arguments(self):
+        expect(_(lambda x, y, z=1: x + y + z).curry(_, 2, z=3)(1)) == 6
+        expect(_(lambda x, y, z=1: x + y + z).curry(_, 2, z=3)(1, z=4)) == 7
+        expect(_(lambda x, y=2, z=1: x + y + z).curry(y=5)(1)) == 7
+    
+    def test_curry_should_need_an_argument_for_every_placeholder(self):
+        expect(lambda: _(operator.add).curry(_, _)('foo')).to_raise(TypeError)
+        expect(lambda: _(operator.add).curry(_, 'foo')('foo', 'bar')).to_raise(TypeError)
+    
+    def test_curry_should_compile_placeholder_pattern_once(self):
+        first = _(operator.add).curry(_, 'foo')
+        second = _(operator.sub).curry(_, 3)
+        expect(first('bar')) == 'barfoo'
+        expect(second(5)) == 2
+        expect(first.unwrap.__code__).is_(second.unwrap.__code__)
+        expect(first.unwrap.__wrapped__).is_(operator.add)
+    
+    def test_compose_cast_wraps_chain(self):
+        expect(_(lambda x: x*2).compose(lambda x: x+3)(5)) == 13
+        expect(_(str.strip).compose(str.capitalize)('  fnord  ')) == 'Fnord'
+
+    def test_memoize_should_evict_least_recently_used(self):
+        calls = []
+        def square(number):
+            calls.append(number)
+            return number * number
+        memoized = _(square).memoize(maxsize=2)
+        expect(_([1, 2, 1, 3, 1, 2]).map(memoized)) == (1, 4, 1, 9, 1, 4)
+        expect(calls) == [1, 2, 3, 2]
+        expect(memoized.cache_info()._) == (2, 4, 2, 2, 2)
+        memoized.cache_clear()
+        expect(memoized.cache_info()._) == (0, 0, 0, 2, 0)
+        expect(memoized.__name__) == 'square'
+    
+    def test_memoize_with_key_for_unhashable_arguments(self):
+        memoized = _(sum).memoize(key=lambda numbers, start=0: (tuple(numbers), start))
+        expect(memoized([1, 2])) == 3
+        expect(memoized([1, 2], start=1)) == 4
+        expect(memoized([1, 2])) == 3
+        expect(memoized.cache_info().hits) == 1
+        expect(lambda: _(sum).memoize()([1, 2])).to_raise(TypeError)
+    
+    def test_memoize_should_distinguish_keyword_arguments(self):
+        memoized = _(lambda *args, **kwargs: (args, kwargs)).memoize(maxsize=None)
+        expect(memoized(('a', 1))) == ((('a', 1),), {})
+        expect(memoized(a=1)) == ((), dict(a=1))
+    
+    def test_memoize_should_expire_after_ttl(self):
+        import time
+        calls = []
+        memoized = _(calls.append).memoize(ttl=0.05)
+        memoized(1); memoized(1)
+        expect(calls) == [1]
+        time.sleep(0.06)
+        memoized(1)
+        expect(calls) == [1, 1]
+        expect(memoized.cache_info().currsize) == 1
+    
+    def test_memoize_should_evict_by_byte_budget(self):
+        memoized = _(lambda length: 'x' * length).memoize(maxsize=None, byte_budget=25, size_of=len)
+        memoized(10); memoized(11); memoized(12)
+        expect(memoized.cache_info().currsize) == 2
+        memoized(100) # too big to be cached at all
+        expect(memoized.cache_info().currsize) == 2
+        memoized(11)
+        expect(memoized.cache_info().hits) == 1
+    
+    def test_memoize_thread_safe(self):
+        import concurrent.futures
+        memoized = _(lambda number: number % 10).memoize(maxsize=5, thread_safe=True)
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(memoized, range(1000)))
+        expect(results) == [number % 10 for number in range(1000)]
+        info = memoized.cache_info()._
+        expect(info.hits + info.misses) == 1000
+        expect(info.currsize) <= 5
+
+class SmallTalkLikeBehaviour(FluentTest):
+    
+    def test_should_pretend_methods_that_return_None_returned_self(self):
+        expect(_([3,2,1]).sort().unwrap) == None
+        expect(_([3,2,1]).sort().previous.previous) == [1,2,3]
+        expect(_([3,2,1]).sort().chain) == [1,2,3]
+        expect(_([2,3,1]).sort().sort(reverse=True).unwrap) == None
+        expect(_([2,3,1]).sort().sort(reverse=True).previous.previous.previous.previous) == [3,2,1]
+        expect(_([2,3,1]).sort().sort(reverse=True).chain) == [3,2,1]
+    
+    def test_should_chain_off_of_previous_if_our_functions_return_none(self):
+        class Attr(object):
+            foo = 'bar'
+        expect(_(Attr()).setattr('foo', 'baz').foo) == 'baz'
+    
+    # TODO check individually that the different forms of wrapping behave according to the SmallTalk contract
+    # wrapped
+    # unwrapped
+    # wrapped_forward
+
+class IterableTest(FluentTest):
+    
+    def test_should_call_callable_with_star_splat_of_self(self):
+        expect(_([1,2,3]).star_call(lambda x, y, z: z-x-y)) == 0
+    
+    def test_join(self):
+        expect(_(['1','2','3']).join(' ')) == '1 2 3'
+        expect(_([1,2,3]).join(' ')) == '1 2 3'
+    
+    def test_any(self):
+        expect(_((True, False)).any()) == True
+        expect(_((False, False)).any()) == False
+    
+    def test_all(self):
+        expect(_((True, False)).all()) == False
+        expect(_((True, True)).all()) == True
+    
+    def test_len(self):
+        expect(_((1,2,3)).len()) == 3
+    
+    def test_min_max_sum(self):
+        expect(_([1,2]).min()) == 1
+        expect(_([1,2]).max()) == 2
+        expect(_((1,2,3)).sum()) == 6
+    
+    def test_map(self):
+        expect(_([1,2,3]).imap(lambda x: x * x).call(list)) == [1, 4, 9]
+        expect(_([1,2,3]).map(lambda x: x * x)) == (1, 4, 9)
+    
+    def test_starmap(self):
+        expect(_([(1,2), (3,4)]).istarmap(lambda x, y: x+y).call(list)) == [3, 7]
+        expect(_([(1,2), (3,4)]).starmap(lambda x, y: x+y)) == (3, 7)
+    
+    def test_filter(self):
+        expect(_([1,2,3]).ifilter(lambda x: x > 1).call(list)) == [2,3]
+        expect(_([1,2,3]).filter(lambda x: x > 1)) == (2,3)
+    
+    def test_zip(self):
+        expect(_((1,2)).izip((3,4)).call(tuple)) == ((1, 3), (2, 4))
+        expect(_((1,2)).izip((3,4), (5,6)).call(tuple)) == ((1, 3, 5), (2, 4, 6))
+        
+        expect(_((1,2)).zip((3,4))) == ((1, 3), (2, 4))
+        expect(_((1,2)).zip((3,4), (5,6))) == ((1, 3, 5), (2, 4, 6))
+    
+    def test_reduce(self):
+        # no iterator version of reduce as it's not a mapping
+        expect(_((1,2)).reduce(operator.add)) == 3
+    
+    def test_grouped(self):
+        expect(_((1,2,3,4,5,6)).igrouped(2).call(list)) == [(1,2), (3,4), (5,6)]
+        expect(_((1,2,3,4,5,6)).grouped(2)) == ((1,2), (3,4), (5,6))
+        expect(_((1,2,3,4,5)).grouped(2)) == ((1,2), (3,4))
+    
+    def test_group_by(self):
+        actual = {}
+        for key, values in _((1,1,2,2,3,3)).igroupby():
+            actual[key] = tuple(values)
+        
+        expect(actual) == {
+            1: (1,1),
+            2: (2,2),
+            3: (3,3)
+        }
+        
+        actual = {}
+        for key, values in _((1,1,2,2,3,3)).groupby():
+            actual[key] = tuple(values)
+        
+        expect(actual) == {
+            1: (1,1),
+            2: (2,2),
+            3: (3,3)
+        }
+    
+    def test_pmap_pfilter(self):
+        expect(_([1,2,3]).pmap(operator.neg)) == (-1,-2,-3)
+        expect(_(range(10)).ipmap(operator.neg, workers=2, chunk_size=3).call(list)) == list(range(0, -10, -1))
+        expect(_(range(10)).pfilter(lambda x: x % 2, workers=3)) == (1,3,5,7,9)
+        expect(_(range(10)).pmap(operator.neg, workers=3, ordered=False).call(sorted)) == list(range(-9, 1))
+        expect(_(range(10)).lazy().pmap(operator.neg).pfilter(operator.truth).len()) == 9
+    
+    def test_pmap_should_only_pull_a_bounded_number_of_elements(self):
+        pulled = []
+        def counting():
+            for number in itertools.count():
+                pulled.append(number)
+                yield number
+        expect(_(counting()).ipmap(operator.neg, workers=2, in_flight=3).call(itertools.islice, 2).call(list)) == [0, -1]
+        expect(len(pulled)) <= 5
+    
+    def test_pmap_should_reject_non_positive_options(self):
+        expect(lambda: _(range(3)).ipmap(operator.neg, workers=0)).to_raise(AssertionError, 'workers has to be positive')
+        expect(lambda: _(range(3)).ipfilter(operator.neg, in_flight=0)).to_raise(AssertionError, 'in_flight has to be positive')
+        expect(lambda: _(range(3)).pmap(operator.neg, chunk_size=0)).to_raise(AssertionError, 'chunk_size has to be positive')
+    
+    def test_pmap_on_processes(self):
+        expect(_(range(10)).pmap(operator.neg, processes=True, workers=2, chunk_size=4)) == tuple(range(0, -10, -1))
+    
+    def test_tee_should_not_break_iterators(self):
+        # This should work because the extend as well als the .call(list) 
+        # should not exhaust the iterator created by .imap()
+        recorder = []
+        def record(generator): recorder.extend(generator)
+        expect(_([1,2,3]).imap(lambda x: x*x).tee(record).call(list)) == [1,4,9]
+        expect(recorder) == [1,4,9]
+    
+    def test_cached_should_replay_iterators(self):
+        pulled = []
+        def numbers():
+            for number in range(3):
+                pulled.append(number)
+                yield number
+        cached = _(numbers()).cached()
+        expect(cached.call(list)) == [0, 1, 2]
+        expect(cached.map(str)) == ('0', '1', '2')
+        expect(pulled) == [0, 1, 2]
+        expect(_(itertools.count()).cached().call(itertools.islice, 3).call(list)) == [0, 1, 2]
+        expect(_(numbers()).cached().call(lambda replayable: list(zip(replayable, replayable)))) == [(0, 0), (1, 1), (2, 2)]
+        a_list = [1, 2]
+        expect(_(a_list).cached().unwrap).is_(a_list)
+    
+    def test_tee_should_call_function_before_returning(self):
+        seen = []
+        _(iter([1, 2, 3])).tee(lambda elements: seen.append(elements.call(list)))
+        expect(seen) == [[1, 2, 3]]
+    
+    def test_ibroadcast_should_feed_iterators_in_constant_memory(self):
+        state = dict(pulled=0, consumed=0, ahead=0)
+        def source():
+            for number in range(10000):
+                state['pulled'] += 1
+                state['ahead'] = max(state['ahead'], state['pulled'] - state['consumed'])
+                yield number
+        def slow_counter(elements):
+            for element in elements:
+                state['consumed'] += 1
+        expect(_(source()).ibroadcast(slow_counter, queue_length=100).call(list).len()) == 10000
+        expect(state['consumed']) == 10000
+        expect(state['ahead']) <= 200
+    
+    def test_broadcast_to_concurrent_consumers(self):
+        import collections
+        lines = ('a', 'b', 'a', 'c', 'a')
+        counts, joined, first = _(iter(lines)).broadcast(collections.Counter, ''.join, next, queue_length=1)
+        expect(counts) == dict(a=3, b=1, c=1)
+        expect(joined) == 'abaca'
+        expect(first) == 'a'
+        
+        seen = []
+        expect(_(lines).ibroadcast(seen.extend).imap(str.upper).call(list)) == list('ABACA')
+        expect(seen) == list(lines)
+        expect(_(itertools.count()).ibroadcast(next).call(itertools.islice, 3).call(tuple)) == (0, 1, 2)
+    
+    def test_broadcast_should_raise_exceptions_of_consumers(self):
+        def failing(elements):
+            next(elements)
+            raise ValueError('fnord')
+        expect(lambda: _(range(5000)).broadcast(failing, sum)).to_raise(ValueError, 'fnord')
+        expect(lambda: _(itertools.count()).broadcast(failing, sum, queue_length=4)).to_raise(ValueError, 'fnord')
+    
+    def test_enumerate(self):
+        expect(_(('foo', 'bar')).ienumerate().call(list)) == [(0, 'foo'), (1, 'bar')]
+        expect(_(('foo', 'bar')).enumerate()) == ((0, 'foo'), (1, 'bar'))
+    
+    def test_reversed_sorted(self):
+        expect(_([2,1,3]).ireversed().call(list)) == [3,1,2]
+        expect(_([2,1,3]).reversed()) == (3,1,2)
+        expect(_([2,1,3]).isorted().call(list)) == [1,2,3]
+        expect(_([2,1,3]).sorted()) == (1,2,3)
+        expect(_([2,1,3]).isorted(reverse=True).call(list)) == [3,2,1]
+        expect(_([2,1,3]).sorted(reverse=True)) == (3,2,1)
+    
+    def test_flatten(self):
+        expect(_([(1,2),[3,4],(5, [6,7])]).iflatten().call(list)) == \
+            [1,2,3,4,5,6,7]
+        expect(_([(1,2),[3,4],(5, [6,7])]).flatten()) == \
+            (1,2,3,4,5,6,7)
+        
+        expect(_([(1,2),[3,4],(5, [6,7])]).flatten(level=1)) == \
+            (1,2,3,4,5,[6,7])
+        expect(_([(1,2),[3,4]]).flatten(level=0)) == ((1,2),[3,4])
+    
+    def test_flatten_should_not_descend_into_atomic_types(self):
+        expect(_(['foo', [b'bar', ('baz',)]]).flatten()) == ('foo', b'bar', 'baz')
+        expect(_([(1,2), [(3,4), [5]]]).flatten(atomic_types=(tuple,))) == ((1,2), (3,4), 5)
+        expect(_([[b'ab'], range(2)]).flatten(atomic_types=())) == (97, 98, 0, 1)
+    
+    def test_flatten_other_iterables(self):
+        expect(_([range(2), {'a': 1}, iter([2, (3,)])]).flatten()) == (0, 1, 'a', 2, 3)
+    
+    def test_batched(self):
+        expect(_(range(7)).batched(3)) == ((0,1,2), (3,4,5), (6,))
+        expect(_(range(6)).ibatched(3).call(list)) == [(0,1,2), (3,4,5)]
+        expect(_([]).batched(3)) == ()
+    
+    def test_batched_into_buffer(self):
+        from array import array
+        buffer = array('d', bytes(8 * 3))
+        batches = []
+        for batch in _(range(7)).ibatched(3, buffer=buffer):
+            batches.append((batch is buffer, batch.tolist()))
+        expect(batches) == [(True, [0,1,2]), (True, [3,4,5]), (False, [6])]
+        expect(buffer.tolist()) == [6, 4, 5]
+        expect(_(list('abcd')).ibatched(2, buffer=[None, None]).map(tuple)) == (('a','b'), ('c','d'))
+        expect(lambda: _(list('abcd')).ibatched(2, buffer=[None])).to_raise(AssertionError)
+        expect(lambda: _(list('abcd')).batched(2, buffer=[None, None])).to_raise(TypeError)
+    
+    def test_chunked(self):
+        expect(_(range(5)).chunked(2)) == ((0,1), (2,3), (4,))
+        words = ('foo', 'quux', 'a', 'fnordfnord', 'ba', 'r')
+        expect(_(words).chunked(byte_budget=8)) == (('foo', 'quux', 'a'), ('fnordfnord',), ('ba', 'r'))
+        expect(_(words).chunked(2, byte_budget=8)) == (('foo', 'quux'), ('a',), ('fnordfnord',), ('ba', 'r'))
+        expect(_(words).chunked(byte_budget=2, size_of=lambda word: 1)) == (('foo', 'quux'), ('a', 'fnordfnord'), ('ba', 'r'))
+        expect(lambda: _(words).chunked()).to_raise(AssertionError)
+    
+    def test_windowed(self):
+        expect(_(range(5)).windowed(3)) == ((0,1,2), (1,2,3), (2,3,4))
+        expect(_(range(6)).windowed(3, step=2)) == ((0,1,2), (2,3,4), (4,5))
+        expect(_(range(7)).windowed(3, step=2)) == ((0,1,2), (2,3,4), (4,5,6))
+        expect(_(range(8)).windowed(2, step=3)) == ((0,1), (3,4), (6,7))
+        expect(_(range(7)).windowed(2, step=3)) == ((0,1), (3,4), (6,))
+        expect(_(range(2)).windowed(3)) == ((0,1),)
+        expect(_([]).windowed(3)) == ()
+    
+    def test_external_sorted(self):
+        import random
+        numbers = [random.randrange(100) for ignored in range(2000)]
+        expect(_(numbers).external_sorted(memory_budget=1000)) == tuple(sorted(numbers))
+        expect(_(numbers).iexternal_sorted(key=_.each % 10, reverse=True, memory_budget=1000).call(list)) \
+            == sorted(numbers, key=lambda each: each % 10, reverse=True)
+        expect(_([]).external_sorted(memory_budget=1)) == ()
+    
+    def test_external_sorted_should_only_spill_above_memory_budget(self):
+        import tempfile, os
+        with tempfile.TemporaryDirectory() as directory:
+            missing = os.path.join(directory, 'missing')
+            expect(_([3, 1, 2]).external_sorted(directory=missing)) == (1, 2, 3)
+            expect(lambda: _(range(1000)).external_sorted(memory_budget=100, directory=missing)) \
+                .to_raise(FileNotFoundError)
+            expect(_(range(1000, 0, -1)).external_sorted(memory_budget=100, directory=directory)) \
+                == tuple(range(1, 1001))
+    
+    def test_external_groupby(self):
+        words = ('foo', 'bar', 'baz', 'fnord', 'bar', 'quux') * 100
+        expect(_(words).external_groupby(_.each[0], memory_budget=2000)) == (
+            ('b', ('bar', 'baz', 'bar') * 100), ('f', ('foo', 'fnord') * 100), ('q', ('quux',) * 100))
+        expect(_(words).iexternal_groupby(len, memory_budget=2000).map(lambda group: group[0])) == (3, 4, 5)
+    
+    def test_flatten_should_not_recurse(self):
+        import sys
+        nested = [1]
+        for ignored in range(sys.getrecursionlimit() * 2):
+            nested = [nested, 2]
+        expect(_(nested).flatten()) == (1,) + (2,) * sys.getrecursionlimit() * 2
+
+class ArrayTest(FluentTest):
+    
+    def test_wrap_arrays_as_array(self):
+        from array import array
+        expect(_(array('d', [1, 2]))).is_instance(Array)
+    
+    def test_array_methods_keep_the_array_type(self):
+        from array import array
+        numbers = _(array('i', [3, -1, 2]))
+        expect(numbers.sum()) == 4
+        expect(numbers.sum(10)) == 14
+        expect(numbers.filter(_.each > 0)) == array('i', [3, 2])
+        expect(numbers.filter(lambda each: each < 0)) == array('i', [-1])
+        expect(numbers.sorted()) == array('i', [-1, 2, 3])
+        expect(numbers.sorted(reverse=True)) == array('i', [3, 2, -1])
+        expect(numbers.sorted(key=abs)) == (-1, 2, 3)
+        expect(numbers.map(_.each * 2)) == (6, -2, 4)
+        expect(numbers.map(str)) == ('3', '-1', '2')
+        expect(numbers.imap(_.each + 1).call(list)) == [4, 0, 3]
+    
+    def test_vectorizable_expressions(self):
+        expect(is_vectorizable((_.each * 2 + 1 > -_.each)._expression)) == True
+        expect(is_vectorizable((_.each ** 2 % 3 == abs(_.each))._expression)) == True
+        expect(is_vectorizable(_.each.real._expression)) == False
+        expect(is_vectorizable(_.each.call.bit_length()._expression)) == False
+        expect(is_vectorizable((_.each + 'foo')._expression)) == False
+        expect(is_vectorizable((_.each @ 3)._expression)) == False
+    
+    @unittest.skipUnless(numpy_is_installed(), 'needs numpy')
+    def test_numpy_arrays_are_vectorized(self):
+        import numpy
+        numbers = _(numpy.arange(-3, 4))
+        expect(numbers).is_instance(Array)
+        expect(numbers.sum()) == 0
+        doubled = numbers.map(_.each * 2)
+        expect(doubled).is_instance(Array)
+        expect(doubled._.tolist()) == [-6, -4, -2, 0, 2, 4, 6]
+        expect(numbers.filter(_.each % 2 == 0)._.tolist()) == [-2, 0, 2]
+        expect(numbers.filter(_.each)._.tolist()) == [-3, -2, -1, 1, 2, 3]
+        expect(numbers.map(numpy.abs)._.tolist()) == [3, 2, 1, 0, 1, 2, 3]
+        expect(numbers.sorted(reverse=True)._.tolist()) == [3, 2, 1, 0, -1, -2, -3]
+        expect(numbers.map(_.each * 2).filter(_.each > 0).sum()) == 12
+    
+    @unittest.skipUnless(numpy_is_installed(), 'needs numpy')
+    def test_numpy_falls_back_to_element_wise(self):
+        import numpy
+        numbers = _(numpy.arange(1, 4))
+        expect(numbers.map(str)) == ('1', '2', '3')
+        expect(numbers.filter(lambda each: each != 2)) == (1, 3)
+        expect(numbers.sorted(key=lambda each: -each)) == (3, 2, 1)
+        expect(_(numpy.ones((2, 2))).map(_.each.call.sum())) == (2.0, 2.0)
+    
+    @unittest.skipUnless(numpy_is_installed(), 'needs numpy')
+    def test_array_array_uses_numpy_if_imported(self):
+        import numpy
+        from array import array
+        numbers = _(array('d', [1.5, -2.0, 3.0]))
+        expect(numbers.map(_.each * 2)) == (3.0, -4.0, 6.0)
+        expect(numbers.map(_.each > 0)) == (True, False, True)
+        expect(numbers.filter(_.each > 0)) == array('d', [1.5, 3.0])
+        expect(numbers.sorted()) == array('d', [-2.0, 1.5, 3.0])
+        singles = array('f', [.1] * 1000)
+        expect(_(singles).sum()._).close_to(sum(singles), 1e-9) # not the float32 sum
+        expect(numbers.sum()) == 2.5
+
+class LazyTest(FluentTest):
+    
+    def test_should_only_run_once_the_result_is_needed(self):
+        calls = []
+        def record(element):
+            calls.append(element)
+            return element
+        pipeline = _([1,2,3]).lazy().map(record).filter((lambda x: x > 1)).map((lambda x: x * 2))
+        expect(calls) == []
+        expect(pipeline._) == (4, 6)
+        expect(calls) == [1,2,3]
+    
+    def test_should_run_all_steps_in_one_pass(self):
+        order = []
+        def record(name):
+            def recorder(element):
+                order.append((name, element))
+                return element
+            return recorder
+        _([1,2]).lazy().map(record('first')).map(record('second')).call(list)
+        expect(order) == [('first', 1), ('second', 1), ('first', 2), ('second', 2)]
+    
+    def test_should_support_the_collection_methods(self):
+        expect(_([3,1,2]).lazy().sorted()) == (1,2,3)
+        expect(_([3,1,2]).lazy().sorted(reverse=True).reversed()) == (1,2,3)
+        expect(_(['foo', 'bar']).lazy().enumerate(1)) == ((1, 'foo'), (2, 'bar'))
+        expect(_((1,2)).lazy().zip((3,4))) == ((1, 3), (2, 4))
+        expect(_([(1,2), (3,4)]).lazy().starmap(operator.add)) == (3, 7)
+        expect(_([(1,2),[3,[4]]]).lazy().flatten()) == (1,2,3,4)
+        expect(_(range(5)).lazy().batched(2).windowed(2)) == (((0,1), (2,3)), ((2,3), (4,)))
+        expect(_(range(5)).lazy().chunked(byte_budget=3, size_of=lambda each: 1)) == ((0,1,2), (3,4))
+        expect(_((1,2,3,4,5)).lazy().grouped(2)) == ((1,2), (3,4))
+        expect(_((1,1,2)).lazy().groupby()) == ((1, (1,1)), (2, (2,)))
+        expect(_([0,1,2]).lazy().filter(None)) == (1,2)
+    
+    def test_should_run_on_terminal_operations(self):
+        expect(_(iter([1,2,3])).lazy().map((lambda x: x * 2)).call(list)) == [2,4,6]
+        expect(_([1,2,3]).lazy().map((lambda x: x * 2)).sum()) == 12
+        expect(_([1,2,3]).lazy().filter((lambda x: x > 1)).len()) == 2
+        expect(_([1,2,3]).lazy().map(str).join('-')) == '1-2-3'
+        expect(list(_([1,2,3]).lazy().map((lambda x: x * 2)))) == [2,4,6]
+    
+    def test_should_switch_back_to_eager(self):
+        eager = _([1,2,3]).lazy().map((lambda x: x * 2)).eager()
+        expect(eager).is_instance(Iterable)
+        expect(eager).is_not.instance_of(Lazy)
+        expect(eager.map((lambda x: x + 1))) == (3, 5, 7)
+    
+    def test_should_show_recorded_steps(self):
+        expect(repr(_([1]).lazy().map(str).sorted())) == "fluent.wrap([1]).lazy().map().sorted()"
+
+class ProfileTest(FluentTest):
+    
+    def test_should_record_stages_with_element_counts(self):
+        import io
+        output = io.StringIO()
+        with profiled(file=output) as profile:
+            result = _(range(10)).imap(str).filter(lambda each: each != '3').map(len).sum()
+        expect(result) == 9
+        expect([stage.name for stage in profile.stages]) == ['map(str)', 'filter(lambda)', 'map(len)', 'sum()']
+        expect([stage.input_length() for stage in profile.stages]) == [10, 10, 9, 9]
+        expect([stage.elements_out for stage in profile.stages]) == [10, 9, 9, None]
+        expect([stage.lazy for stage in profile.stages]) == [True, False, False, False]
+        expect(all(stage.seconds >= 0 for stage in profile.stages)) == True
+        expect(output.getvalue()).matches(r'filter\(lambda\) +[\d.]+ +10 +9\n')
+    
+    def test_should_not_change_iterators_with_more_interface(self):
+        import csv, io, tempfile
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as file:
+            file.write('a,b\nc,d\n')
+            file.flush()
+            with Profile() as profile:
+                expect(_(file.name).call(open).read()) == 'a,b\nc,d\n'
+                reader = _(io.StringIO('a,b\n')).call(csv.reader)
+                expect(reader.call(list)) == [['a', 'b']]
+                expect(reader.line_num) == 1
+                expect(_([1, 2]).imap(str).unwrap).is_instance(ProfiledIterator)
+        expect(profile.stages[0].lazy) == False
+    
+    def test_should_only_record_while_active(self):
+        with Profile() as profile:
+            _([1, 2]).map(lambda each: _([each]).map(str)) # nested calls count for the outer stage
+        _([1, 2]).map(str)
+        expect([stage.name for stage in profile.stages]) == ['map(lambda)']
+        import fluent
+        expect(fluent.active_profile).is_(None)
+    
+    def test_should_measure_lazy_steps(self):
+        with Profile() as profile:
+            expect(_(range(6)).lazy().map(_.each * 2).filter(_.each > 4).sorted().len()) == 3
+        expect([stage.name for stage in profile.stages]) == ['lazy()', '.map(lambda)', '.filter(lambda)', '.sorted()', 'len()']
+        expect([stage.elements_out for stage in profile.stages]) == [6, 6, 3, 3, None]
+        expect(_(range(6)).lazy().map(_.each * 2).filter(_.each > 4)) == (6, 8, 10)
+    
+    def test_should_measure_allocations(self):
+        with Profile(memory=True) as profile:
+            _(range(10000)).map(str)
+        expect(profile.stages[0].allocated_bytes) > 10000 * 10
+        expect(profile.report()).contains('kB')
+    
+    def test_profile_from_shell(self):
+        from subprocess import run, PIPE
+        result = run(['python', '-m', 'fluent', '--profile', '--lines', "lines.map(str.upper)"],
+            input=b'foo\nbar\n', stdout=PIPE, stderr=PIPE, check=True)
+        expect(result.stdout) == b'FOO\nBAR\n'
+        expect(result.stderr).matches(rb'\.map\(upper\) +[\d.]+ +2 +2\n')
+
+class BoundedMemoryTest(FluentTest):
+    
+    def peak_bytes_of_chain(self, data, stages):
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            result = _(data)
+            for stage in range(stages):
+                result = result.map(operator.pos) # a new tuple, with the same elements
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    
+    def test_should_keep_only_a_constant_number_of_intermediate_results_alive(self):
+        import sys
+        data = tuple(range(100000))
+        copy_bytes = sys.getsizeof(data)
+        expect(self.peak_bytes_of_chain(data, stages=20)) > 15 * copy_bytes
+        with BoundedMemory():
+            expect(self.peak_bytes_of_chain(data, stages=20)) < 4 * copy_bytes
+            expect(self.peak_bytes_of_chain(data, stages=40)) < 4 * copy_bytes
+    
+    def test_should_still_chain_off_of_methods_returning_none(self):
+        with _.bounded_memory():
+            expect(_([3,2,1]).sort().sort(reverse=True).chain) == [3,2,1]
+            expect(_([3,2,1]).map(str).call(list).sort().join(',')) == '1,2,3'
+            expect(_([1]).map(str).previous) == None
+            bound = _([1]).append
+            expect(bound.previous) == [1]
+            expect(bound(2).chain) == [1, 2]
+        expect(_([1]).map(str).previous) == [1]
+    
+    def test_should_only_bound_memory_in_the_current_thread(self):
+        import threading
+        previous = []
+        thread = threading.Thread(target=lambda: previous.append(_([1]).map(str).previous))
+        with _.bounded_memory():
+            thread.start()
+            thread.join()
+            with _.bounded_memory():
+                pass
+            expect(_([1]).map(str).previous) == None
+        expect(previous) == [[1]]
+        expect(_([1]).map(str).previous) == [1]
+    
+    def test_should_restore_the_previous_setting(self):
+        with BoundedMemory():
+            with BoundedMemory():
+                pass
+            expect(_([1]).map(str).previous) == None
+        expect(_([1]).map(str).previous) == [1]
+
+class AsyncIterableTest(FluentTest):
+    
+    def test_should_wrap_async_iterables(self):
+        async def numbers():
+            yield 1
+        expect(_(numbers())).is_instance(AsyncIterable)
+        expect(_([1]).aiter()).is_instance(AsyncIterable)
+    
+    def test_amap_afilter_with_plain_and_coroutine_functions(self):
+        async def double(number): return number * 2
+        expect(_([1,2,3]).aiter().amap(double).gather()) == (2,4,6)
+        expect(_([1,2,3]).aiter().amap(operator.neg).gather()) == (-1,-2,-3)
+        expect(_([1,2,3]).aiter().afilter(lambda number: number > 1).gather()) == (2,3)
+    
+    def test_should_limit_concurrency(self):
+        import asyncio
+        state = dict(in_flight=0, maximum=0)
+        async def slow(number):
+            state['in_flight'] += 1
+            state['maximum'] = max(state['maximum'], state['in_flight'])
+            await asyncio.sleep(.01)
+            state['in_flight'] -= 1
+            return number
+        expect(_(range(20)).aiter().amap(slow, concurrency=5).gather()) == tuple(range(20))
+        expect(state['maximum']) == 5
+        expect(lambda: _(range(3)).aiter().amap(slow, concurrency=0)).to_raise(AssertionError, 'concurrency has to be positive')
+        expect(lambda: _(range(3)).aiter().afilter(slow, concurrency=-1)).to_raise(AssertionError, 'concurrency has to be positive')
+    
+    def test_should_yield_as_completed_if_unordered(self):
+        import asyncio
+        async def sleep_for(number):
+            await asyncio.sleep(number / 100)
+            return number
+        expect(_([3,1,2]).aiter().amap(sleep_for, concurrency=3).gather()) == (3,1,2)
+        expect(_([3,1,2]).aiter().amap(sleep_for, concurrency=3, ordered=False).gather()) == (1,2,3)
+    
+    def test_agather_in_async_code(self):
+        import asyncio
+        async def main():
+            return await _([1,2]).aiter().amap(str).agather()
+        expect(asyncio.run(main())) == ('1', '2')
+
+class MappingTest(FluentTest):
+    
+    def test_should_call_callable_with_double_star_splat_as_keyword_arguments(self):
+        def foo(*, foo): return foo
+        expect(_(dict(foo='bar')).star_call(foo)) == 'bar'
+        expect(_(dict(foo='baz')).star_call(foo, foo='bar')) == 'baz'
+        expect(_(dict()).star_call(foo, foo='bar')) == 'bar'
+    
+    def test_should_support_attribute_access_to_mapping_items(self):
+        expect(_(dict(foo='bar')).foo) == 'bar'
+
+class StrTest(FluentTest):
+    
+    def test_search(self):
+        expect(_('foo bar baz').search(r'b.r').span()) == (4,7)
+    
+    def test_match_fullmatch(self):
+        expect(_('foo bar').match(r'foo\s').span()) == (0, 4)
+        expect(_('foo bar').fullmatch(r'foo\sbar').span()) == (0, 7)
+        expect(_('foo bar').fullmatch(r'foo').unwrap) == None
+        expect(_(b'foo bar').fullmatch(rb'foo').unwrap) == None
+    
+    def test_split(self):
+        expect(_('foo\nbar\nbaz').split(r'\n')) == ['foo', 'bar', 'baz']
+        expect(_('foo\nbar/baz').split(r'[\n/]')) == ['foo', 'bar', 'baz']
+    
+    def test_findall_finditer(self):
+        expect(_("bazfoobar").findall('ba[rz]')) == ['baz', 'bar']
+        expect(_("bazfoobar").finditer('ba[rz]').map(_.each.call.span())) == ((0,3), (6,9))
+    
+    def test_sub_subn(self):
+        expect(_('bazfoobar').sub(r'ba.', 'foo')) == 'foofoofoo'
+        expect(_('bazfoobar').sub(r'ba.', 'foo', 1)) == 'foofoobar'
+        expect(_('bazfoobar').sub(r'ba.', 'foo', count=1)) == 'foofoobar'
+    
+    def test_flags(self):
+        import re
+        expect(_('FOO').search('foo', re.IGNORECASE).span()) == (0, 3)
+        expect(_('FOO').findall('o', flags=re.IGNORECASE)) == ['O', 'O']
+        expect(_('a-B-c').split('b', 0, re.IGNORECASE)) == ['a-', '-c']
+
+class BytesTest(FluentTest):
+    
+    def test_wrap_buffers_as_bytes(self):
+        expect(_(b'foo')).is_instance(Bytes)
+        expect(_(bytearray(b'foo'))).is_instance(Bytes)
+        expect(_(memoryview(b'foo'))).is_instance(Bytes)
+        expect(_(b'foo').map(chr)) == ('f', 'o', 'o')
+    
+    def test_regex_methods(self):
+        expect(_(b'foo bar baz').search(rb'b.r').span()) == (4, 7)
+        expect(_(b'foo bar').fullmatch(rb'foo\sbar').span()) == (0, 7)
+        expect(_(b'foo\nbar').split(rb'\n')) == [b'foo', b'bar']
+        expect(_(memoryview(b'bazfoobar')).findall(rb'ba[rz]')) == [b'baz', b'bar']
+        expect(_(bytearray(b'bazfoobar')).finditer(rb'ba[rz]').map(_.each.call.span())) == ((0,3), (6,9))
+        expect(_(b'bazfoobar').sub(rb'ba.', b'foo', 1)) == b'foofoobar'
+    
+    def test_mapped_file(self):
+        import tempfile, os
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log')
+            with open(path, 'wb') as file:
+                file.write(b'ok\nERROR: foo\nok\nERROR: bar\n')
+            mapped = _.mapped_file(path)
+            expect(mapped).is_instance(Bytes)
+            expect(mapped.finditer(rb'ERROR: (\w+)').map(_.each.call.group(1))) == (b'foo', b'bar')
+            mapped.close()
+            
+            with open(path, 'wb'): pass
+            expect(_.mapped_file(path).findall(rb'ERROR')) == []
+    
+    def test_compiled_pattern_cache(self):
+        expect(compiled_pattern('fo+')).is_(compiled_pattern('fo+'))
+        expect(compiled_pattern(b'fo+').pattern) == b'fo+'
+        expect(compiled_pattern('fo+', 2).flags & 2) == 2
+        expect(PATTERN_CACHE_SIZE) > 512
+
+class ImporterTest(FluentTest):
+    
+    def test_import_top_level_module(self):
+        import sys
+        expect(lib.sys) == sys
+    
+    def test_import_symbol_from_top_level_module(self):
+        import sys
+        expect(lib.sys.stdin) == sys.stdin
+    
+    def test_import_submodule_that_is_also_a_symbol_in_the_parent_module(self):
+        import os
+        expect(lib.os.name) == os.name
+        expect(lib.os.path.join) == os.path.join
+    
+    def test_import_submodule_that_is_not_a_symbol_in_the_parent_module(self):
+        import dbm
+        expect(lambda: dbm.dumb).to_raise(AttributeError)
+        
+        def delayed_import():
+            import dbm.dumb
+            return dbm.dumb
+        expect(lib.dbm.dumb) == delayed_import()
+    
+    def test_imported_objects_are_pre_wrapped(self):
+        lib.os.path.join('/foo', 'bar', 'baz').findall(r'/(\w*)') == ['foo', 'bar', 'baz']
+    
+    def test_should_cache_resolved_modules(self):
+        expect(lib.os.path).is_(lib.os.path)
+        expect(lib.os.path.join).not_is(lib.os.path.join)
+        
+        import types
+        lib.clear_cache()
+        module = types.ModuleType('fluent_test_module')
+        import sys
+        sys.modules['fluent_test_module'] = module
+        try:
+            module.value = 'first'
+            expect(lib.fluent_test_module.value) == 'first'
+            module.value = 'second'
+            expect(lib.fluent_test_module.value) == 'second'
+            
+            sys.modules['fluent_test_module'] = replacement = types.ModuleType('fluent_test_module')
+            replacement.value = 'replaced'
+            expect(lib.fluent_test_module.value) == 'second'
+            lib.clear_cache()
+            expect(lib.fluent_test_module.value) == 'replaced'
+        finally:
+            del sys.modules['fluent_test_module']
+            lib.clear_cache()
+    
+    def test_should_record_import_times(self):
+        lib.clear_cache()
+        lib.json.decoder
+        expect(lib.import_times()._).has_key('json')
+        expect(lib.import_times()._['json']) >= 0
+        expect(import_report()).contains(' ms  json')
+    
+    def test_should_see_rebound_module_attributes(self):
+        import contextlib, io
+        lib.sys.stdout.write('')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            lib.sys.stdout.write('fnord')
+        expect(output.getvalue()) == 'fnord'
+    
+    def test_should_find_lib_paths_in_code(self):
+        expect(referenced_lib_paths("lib.sys.stdin.read().map(lib.xml.sax.saxutils.unescape) + _.lib . os.sep")) \
+            == ('sys.stdin.read', 'xml.sax.saxutils.unescape', 'os.sep')
+        expect(referenced_lib_paths("mylib.foo + lib_bar")) == ()
+    
+    def test_preimport_should_only_import_modules(self):
+        lib.clear_cache()
+        preimport("lib.sys.stdin.read().map(lib.xml.dom.minidom.parseString)").join()
+        import sys
+        expect(sys.modules).has_key('xml.dom.minidom')
+        expect(resolved_lib_paths).has_key('xml.dom.minidom')
+        expect(resolved_lib_paths).not_has_key('xml.dom.minidom.parseString')
+        expect(resolved_lib_paths).not_has_key('sys.stdin')
+        expect(resolved_lib_paths).not_has_key('_io.TextIOWrapper.read')
+
+class EachTest(FluentTest):
+    
+    def test_should_produce_attrgetter_on_attribute_access(self):
+        class Foo(object):
+            bar = 'baz'
+        expect(_([Foo(), Foo()]).map(_.each.bar)) == ('baz', 'baz')
+    
+    def test_should_produce_itemgetter_on_item_access(self):
+        expect(_([['foo'], ['bar']]).map(_.each[0])) == ('foo', 'bar')
+    
+    def test_should_produce_callable_on_binary_operator(self):
+        expect(_(['foo', 'bar']).map(_.each == 'foo')) == (True, False)
+        expect(_([3, 5]).map(_.each + 3)) == (6, 8)
+        expect(_([3, 5]).map(_.each < 4)) == (True, False)
+    
+    def test_should_produce_callable_on_unary_operator(self):
+        expect(_([3, 5]).map(- _.each)) == (-3, -5)
+        expect(_([3, 5]).map(~ _.each)) == (-4, -6)
+    
+    def test_should_produce_methodcaller_on_call_attribute(self):
+        # problem: _.each.call is now not an attrgetter
+        # _.each.method.call('foo') # like a method chaining
+        # _.each_call.method('foo')
+        # _.eachcall.method('foo')
+        class Tested(object):
+            def method(self, arg): return 'method+'+arg
+        expect(_(Tested()).call(_.each.call.method('argument'))) == 'method+argument'
+        expect(lambda: _.each.call('argument')).to_raise(AssertionError, '_.each.call.method_name')
+
+    def test_should_combine_expressions(self):
+        class Item(object):
+            def __init__(self, price, quantity): self.price, self.quantity = price, quantity
+        expect(_([Item(2, 3), Item(4, 5)]).map(_.each.price * _.each.quantity)) == (6, 20)
+        expect(_([{'a': [1, 2]}]).map(_.each['a'][1] + 1)) == (3,)
+        expect(_(['  foo ']).map(_.each.call.strip().call.upper())) == ('FOO',)
+        expect(_([{'key': 'a', 'a': 1}]).map(_.each.call.get(_.each['key']))) == (1,)
+    
+    def test_should_support_reflected_and_in_place_operators(self):
+        expect(_([1, 2]).map(10 - _.each)) == (9, 8)
+        expect(_([1, 2]).map(2 ** _.each)) == (2, 4)
+        expression = _.each
+        expression += 1
+        expect(expression(1)) == 2
+        expect(_.each(1)) == 1
+        expect(abs(_.each - 5)(1)) == 4
+    
+    def test_should_return_plain_results_to_allow_chaining(self):
+        expect(_([1, 2, 3]).map(_.each * 2).map(_.each + 1)) == (3, 5, 7)
+        expect(_([1, 2, 3]).filter(_.each < 3)) == (1, 2)
+        expect(_([3, 1, 2]).sorted(key=-_.each)) == (3, 2, 1)
+        expect(_([1, 2, 3]).lazy().map(_.each * 2).filter(_.each > 2).call(list)) == [4, 6]
+        expect(type((_.each + 1)(1))) == int
+    
+    def test_should_compile_to_a_plain_function(self):
+        expect((_.each.real + 3).unwrap).is_instance(types.FunctionType)
+        expect(repr(_.each.real + 3)) == 'fluent.each(lambda each: (each.real + c0))'
+        # same shape, different constants share the compiled code
+        expect((_.each + 1).unwrap.__code__).is_((_.each + 2).unwrap.__code__)
+    
+    def test_should_bound_the_compiled_expressions(self):
+        for index in range(PATTERN_CACHE_SIZE + 10):
+            getattr(_.each, 'attribute%d' % index)
+        expect(len(compiled_expressions)) == PATTERN_CACHE_SIZE
+        expect(_([3]).map(_.each.real + 1)) == (4,)
+    
+    def test_should_build_attribute_accesses_for_callable_method_names(self):
+        class Functions(object):
+            curry, compose, memoize = 'curry', 'compose', 'memoize'
+        expect(_([Functions()]).map(_.each.curry)) == ('curry',)
+        expect(_([Functions()]).map(_.each.compose)) == ('compose',)
+        expect(_([Functions()]).map(_.each.memoize)) == ('memoize',)
+    
+    def test_should_support_attributes_that_are_not_identifiers(self):
+        class Odd(object): pass
+        odd = Odd()
+        setattr(odd, 'not an identifier', 'value')
+        expect(_([odd]).map(getattr(_.each, 'not an identifier'))) == ('value',)
+
+class IntegrationTest(FluentTest):
+    
+    def test_import_should_not_load_test_machinery_or_expensive_modules(self):
+        from subprocess import check_output
+        output = check_output(['python', '-c', 
+            "import sys, fluent; print(sorted({'unittest', 'pyexpect', 'pytest', 'typing', 're'} & set(sys.modules)))"])
+        expect(output) == b'[]\n'
+    
+    def test_extrac_and_decode_URIs(self):
+        from xml.sax.saxutils import unescape
+        line = '''<td><img src='/sitefiles/star_5.png' height='15' width='75' alt=''></td>
+            <td><input style='width:200px; outline:none; border-style:solid; border-width:1px; border-color:#ccc;' type='text' id='ydxerpxkpcfqjaybcssw' readonly='readonly' onClick="select_text('ydxerpxkpcfqjaybcssw');" value='http://list.iblocklist.com/?list=ydxerpxkpcfqjaybcssw&amp;fileformat=p2p&amp;archiveformat=gz'></td>'''
+
+        actual = _(line).findall(r'value=\'(.*)\'').imap(unescape).call(list)
+        expect(actual) == ['http://list.iblocklist.com/?list=ydxerpxkpcfqjaybcssw&fileformat=p2p&archiveformat=gz']
+    
+    def test_call_module_from_shell(self):
+        from subprocess import check_output
+        output = check_output(
+            ['python', '-m', 'fluent', "lib.sys.stdin.read().split('\\n').imap(str.upper).imap(print).call(list)"],
+            input=b'foo\nbar\nbaz')
+        expect(output) == b'FOO\nBAR\nBAZ\n'
+    
+    def test_call_module_from_shell_with_streamed_lines(self):
+        from subprocess import check_output
+        output = check_output(
+            ['python', '-m', 'fluent', '--lines', "lines.map(str.upper).filter(lambda line: line != 'BAR')"],
+            input=b'foo\nbar\nbaz\n')
+        expect(output) == b'FOO\nBAZ\n'
+        
+        output = check_output(['python', '-m', 'fluent', '-l', "lines.len()"], input=b'foo\nbar')
+        expect(output) == b'2\n'
+    
+    def test_streamed_lines_should_not_keep_carriage_returns(self):
+        from subprocess import check_output
+        output = check_output(['python', '-m', 'fluent', '-l', "lines.map(repr)"], input=b'foo\r\nbar\r\n')
+        expect(output) == b"'foo'\n'bar'\n"
+        
+        import tempfile
+        with tempfile.TemporaryFile('w+', encoding='utf8', newline='') as file:
+            file.write('a\r\nb\rc\nd')
+            file.flush()
+            file.seek(0)
+            expect(list(input_lines(file, buffer_size=2))) == ['a', 'b', 'c', 'd']
+    
+    def test_call_module_from_shell_with_preimport_and_import_times(self):
+        from subprocess import run, PIPE
+        result = run(['python', '-m', 'fluent', '--preimport', '--import-times', "print(lib.json.dumps(3)._)"],
+            stdout=PIPE, stderr=PIPE, check=True)
+        expect(result.stdout) == b'3\n'
+        expect(result.stderr).matches(rb' ms  json\n')
+    
+    def test_streamed_lines_should_produce_output_before_input_ends(self):
+        from subprocess import Popen, PIPE
+        process = Popen(['python', '-m', 'fluent', '--lines', "lines.map(str.upper)"],
+            stdin=PIPE, stdout=PIPE)
+        try:
+            process.stdin.write(b'foo\n')
+            process.stdin.flush()
+            expect(process.stdout.readline()) == b'FOO\n'
+        finally:
+            process.stdin.close()
+            process.wait()